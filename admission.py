@@ -0,0 +1,265 @@
+"""
+Admission control for the API routes: per-user and per-client rate limiting, and load shedding.
+
+Rate limits are token buckets, one per username found in the URL and one per client address.
+With the `memory` backend, the default, each process keeps its own buckets. With the `file`
+backend the buckets live in a SQLite file on local disk, so the limits hold across every
+gunicorn worker of the host, at the cost of one write transaction on the file per limited
+request, serialized between the workers; gunicorn.conf.py picks it when it runs several
+workers. A request over its limit gets a 429 with the time until its next token in `Retry-After`.
+
+The client address is the peer of the connection. Behind reverse proxies, set
+TRUSTED_PROXY_HOPS to their number: the address is then read from `X-Forwarded-For`, taking
+the entry added by the outermost trusted proxy, so clients cannot pick their own bucket.
+
+Load shedding is local to each worker: a request gets a 503 with `Retry-After` when the worker
+already serves ADMISSION_MAX_IN_FLIGHT requests, or, for routes that call the secondary API,
+when ADMISSION_MAX_UPSTREAM_IN_FLIGHT upstream calls are running or queued for the fan-out
+pool. Overload then answers immediately instead of queueing until the client times out.
+
+A worker never serves more requests than its threads (or greenlets), so the in-flight limit must
+stay below them to ever apply; gunicorn.conf.py sets it one short, leaving a thread to answer the
+503s. It is off by default elsewhere. The upstream limit defaults to the HTTP pool size, past
+which calls would wait on new connections.
+
+Operational routes (/metrics, /admin, the documentation) are never limited.
+"""
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from flask import g, jsonify, request
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from logger import logger
+from metrics import admission_rejected
+from services.http_client import HTTP_POOL_MAXSIZE, secondary_api
+from services.saving_goal import queued_calls
+
+# Admission settings, all overridable through the environment; a rate of 0 disables its limit
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")  # memory, file or none
+RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", "cache/rate_limits.sqlite3")
+RATE_LIMIT_USER_RATE = float(os.environ.get("RATE_LIMIT_USER_RATE", "10"))  # Requests per second per username
+RATE_LIMIT_USER_BURST = float(os.environ.get("RATE_LIMIT_USER_BURST", "20"))
+RATE_LIMIT_CLIENT_RATE = float(os.environ.get("RATE_LIMIT_CLIENT_RATE", "50"))  # Requests per second per address
+RATE_LIMIT_CLIENT_BURST = float(os.environ.get("RATE_LIMIT_CLIENT_BURST", "100"))
+RATE_LIMIT_MAX_ENTRIES = int(os.environ.get("RATE_LIMIT_MAX_ENTRIES", "100000"))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", "0"))  # Per worker, 0 disables
+ADMISSION_MAX_UPSTREAM_IN_FLIGHT = int(os.environ.get(
+    "ADMISSION_MAX_UPSTREAM_IN_FLIGHT", str(HTTP_POOL_MAXSIZE)))  # Per worker, 0 disables
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "1"))  # Seconds, sent with 503s
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "0"))  # Proxies setting X-Forwarded-For
+
+ADMITTED_BLUEPRINTS = {"users"}
+
+# Endpoints that may call the secondary API, shed first when it falls behind
+UPSTREAM_ENDPOINTS = {
+    "users.get_user_information",
+    "users.post_goal_for_user",
+    "users.post_goals_batch",
+    "users.get_goal_for_user",
+    "users.put_goal_for_user",
+    "users.delete_goal_for_user",
+}
+
+# Refills a bucket, then takes `cost` tokens from it if it holds enough. Every right-hand
+# side of the SET sees the row before the update, so the statement is atomic across processes.
+TAKE_TOKENS = (
+    "INSERT INTO bucket (key, tokens, updated_at, allowed) VALUES (:key, :burst - :cost, :now, 1) "
+    "ON CONFLICT (key) DO UPDATE SET "
+    "tokens = min(:burst, tokens + (:now - updated_at) * :rate) "
+    "- CASE WHEN min(:burst, tokens + (:now - updated_at) * :rate) >= :cost THEN :cost ELSE 0 END, "
+    "allowed = min(:burst, tokens + (:now - updated_at) * :rate) >= :cost, "
+    "updated_at = :now "
+    "RETURNING tokens, allowed"
+)
+
+
+class MemoryBucketBackend:
+    """
+    Token buckets of the current process only.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        """
+        Takes `cost` tokens from the bucket `key` if it holds enough. Returns whether they were
+        taken and the tokens left.
+        """
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+class FileBucketBackend:
+    """
+    Token buckets stored in a local SQLite file, shared by every process that opens it.
+    """
+
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the current thread and process.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=OFF")  # Losing buckets in a crash only resets the limits
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS bucket ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, allowed INTEGER NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_bucket_updated_at ON bucket (updated_at)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> Tuple[bool, float]:
+        now = time.time()
+        connection = self.connection
+        tokens, allowed = connection.execute(
+            TAKE_TOKENS, {"key": key, "rate": rate, "burst": burst, "cost": cost, "now": now}).fetchone()
+        if random.random() < 0.001:
+            # Now and then, forget the least recently used buckets past the size limit
+            connection.execute(
+                "DELETE FROM bucket WHERE key IN "
+                "(SELECT key FROM bucket ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+        return bool(allowed), tokens
+
+
+class RateLimiter:
+    """
+    Token bucket limit of `rate` requests per second with bursts of up to `burst`, per key.
+    """
+
+    def __init__(self, backend, prefix: str, rate: float, burst: float):
+        self.backend = backend
+        self.prefix = prefix
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+
+    def acquire(self, key: str) -> Optional[float]:
+        """
+        Takes a token for `key`. Returns None when the request may go on, or the seconds
+        until the next token. A failing store lets the request through.
+        """
+        if self.backend is None or self.rate <= 0:
+            return None
+        try:
+            allowed, tokens = self.backend.take(f"{self.prefix}:{key}", self.rate, self.burst)
+        except sqlite3.Error as e:
+            logger.warning("Rate limit store unavailable, admitting the request: %s", e)
+            return None
+        return None if allowed else (1.0 - tokens) / self.rate
+
+
+def create_backend(name: str = RATE_LIMIT_BACKEND):
+    """
+    Builds the bucket backend selected by `name`, or None when rate limiting is disabled.
+    """
+    if name == "file":
+        return FileBucketBackend(RATE_LIMIT_PATH, RATE_LIMIT_MAX_ENTRIES)
+    if name == "memory":
+        return MemoryBucketBackend(RATE_LIMIT_MAX_ENTRIES)
+    if name == "none":
+        return None
+    raise ValueError(f"Unknown rate limit backend '{name}'.")
+
+
+_backend = create_backend()
+user_limiter = RateLimiter(_backend, "user", RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST)
+client_limiter = RateLimiter(_backend, "client", RATE_LIMIT_CLIENT_RATE, RATE_LIMIT_CLIENT_BURST)
+
+_in_flight = 0
+_in_flight_lock = threading.Lock()
+
+
+def reject(status: int, reason: str, message: str, retry_after: float):
+    admission_rejected.labels(reason).inc()
+    response = jsonify({"message": message})
+    response.status_code = status
+    response.headers["Retry-After"] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def shed_reason() -> Optional[str]:
+    """
+    Returns why the current request must be shed, or None.
+    """
+    if ADMISSION_MAX_IN_FLIGHT > 0 and _in_flight >= ADMISSION_MAX_IN_FLIGHT:
+        return "in_flight"
+    if (ADMISSION_MAX_UPSTREAM_IN_FLIGHT > 0 and request.endpoint in UPSTREAM_ENDPOINTS
+            and secondary_api.in_flight + queued_calls() >= ADMISSION_MAX_UPSTREAM_IN_FLIGHT):
+        return "upstream"
+    return None
+
+
+def before_request():
+    global _in_flight
+    if request.blueprint not in ADMITTED_BLUEPRINTS:
+        return None
+
+    reason = shed_reason()
+    if reason:
+        logger.warning("Shedding %s %s (%s)", request.method, request.path, reason)
+        return reject(503, reason, "The server is overloaded, try again later.", ADMISSION_RETRY_AFTER)
+
+    retry_after = client_limiter.acquire(request.remote_addr or "unknown")
+    if retry_after is not None:
+        return reject(429, "client", "Too many requests from this client.", retry_after)
+    username = (request.view_args or {}).get("username")
+    if username:
+        retry_after = user_limiter.acquire(username)
+        if retry_after is not None:
+            return reject(429, "user", f"Too many requests for user {username}.", retry_after)
+
+    with _in_flight_lock:
+        _in_flight += 1
+    g.admission_counted = True
+    return None
+
+
+def teardown_request(exception=None):
+    global _in_flight
+    if g.pop("admission_counted", False):
+        with _in_flight_lock:
+            _in_flight -= 1
+
+
+def init_app(app) -> None:
+    """
+    Adds the admission checks to every request of the API routes, and trusts the
+    `X-Forwarded-For` entries of the configured number of proxies for the client address.
+    """
+    hops = app.config.get("TRUSTED_PROXY_HOPS", TRUSTED_PROXY_HOPS)
+    if hops:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops)
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
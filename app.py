@@ -1,21 +1,131 @@
+"""
+Application factory.
+
+`create_app(config)` builds the app without touching the database or the log files: the
+engine, the schema check and the log handlers are set up on first use. Gunicorn and
+`flask run` use the default app, built on first access to `app.app`; the schema can be
+created ahead of time, e.g. once per deploy with DB_AUTO_INIT=0 in the workers, with:
+    flask --app app init-db
+
+In production, serve it with the settings of gunicorn.conf.py:
+    gunicorn -c gunicorn.conf.py
+"""
 from flask import redirect
 from flask_cors import CORS
 from flask_openapi3 import OpenAPI, Info, Tag
 
+import admission
+import metrics
+import models
+import profiling
+import serialization
+from logger import configure_logging, logger
+from models.migrations import rebuild_stale_aggregates
 from routes.user_info import users
+from services import auth, resilience
+from services.goal_outbox import goal_outbox_worker, GOAL_OUTBOX_WORKER
+from services.reconciliation import backfiller, reconciler, GOAL_PROJECTION_BACKFILL, GOAL_PROJECTION_RECONCILE
+from services.user_summary import UserSummaryService
+
+# The engine is shared by every app of the process, so its statement metrics are registered once
+models.on_engine_created(metrics.init_engine)
 
 info = Info(title="Main API", version="1.0.0")
-app = OpenAPI(__name__, info=info)
-CORS(app)
 
 # Define the documentation tag
 home_tag = Tag(name="Documentation", description="Selection of documentation style: Swagger, Redoc, or RapiDoc")
 
-@app.get('/', tags=[home_tag])
+
 def home():
     """
     Redirects to /openapi, where the user can choose the documentation style.
     """
     return redirect('/openapi')
 
-app.register_api(users)
+
+def init_db_command():
+    """
+    Creates the database and its tables, applies the data migrations and rebuilds the
+    savings aggregates that disagree with the goal projections.
+    """
+    models.init_db()
+    rebuild_stale_aggregates(models.get_engine())
+    logger.info("Database initialized")
+
+
+def rebuild_summaries_command():
+    """
+    Recomputes the savings aggregates of every user from the goal projections.
+    """
+    session = models.Session()
+    try:
+        updated = UserSummaryService.rebuild(session)
+        session.commit()
+        logger.info("Rebuilt the savings summaries of %s users", updated)
+    finally:
+        session.close()
+
+
+def create_app(config: dict = None) -> OpenAPI:
+    """
+    Builds the application. `config` is merged into `app.config`; these keys also change
+    how the app starts, each defaulting to its environment variable:
+
+        DATABASE_URL                 database the engine connects to
+        DB_AUTO_INIT                 create and migrate the schema when the engine is first used
+        LOG_CONFIGURE                set up the log handlers (False leaves logging untouched)
+        GOAL_PROJECTION_RECONCILE    run the projection reconciler on a daemon thread
+        GOAL_PROJECTION_BACKFILL     otherwise, only project the linked goals without a local row
+        GOAL_OUTBOX_WORKER           drain the goal outbox on a daemon thread
+        TRUSTED_PROXY_HOPS           reverse proxies whose X-Forwarded-For gives the client address
+
+    With BACKGROUND_JOBS=False, the daemon threads are left to `start_background_jobs`, which
+    a server preloading the app must call in each worker: threads do not survive a fork.
+    """
+    app = OpenAPI(__name__, info=info, security_schemes={"bearer": {"type": "http", "scheme": "bearer"}})
+    app.config.update(config or {})
+    if app.config.get("LOG_CONFIGURE", True):
+        configure_logging()
+    models.configure(url=app.config.get("DATABASE_URL"), auto_init=app.config.get("DB_AUTO_INIT"))
+
+    CORS(app)
+    serialization.init_app(app)
+    metrics.init_app(app)
+    profiling.init_app(app)
+    resilience.init_app(app)
+    auth.init_app(app)
+    admission.init_app(app)
+
+    app.get('/', tags=[home_tag])(home)
+    app.register_api(users)
+    app.cli.command("init-db")(init_db_command)
+    app.cli.command("rebuild-summaries")(rebuild_summaries_command)
+
+    if app.config.get("BACKGROUND_JOBS", True):
+        start_background_jobs(app)
+    return app
+
+
+def start_background_jobs(app) -> None:
+    """
+    Starts the daemon threads enabled in the app's config, unless they already run in this process.
+    """
+    if app.config.get("GOAL_PROJECTION_RECONCILE", GOAL_PROJECTION_RECONCILE):
+        reconciler.start()
+    elif app.config.get("GOAL_PROJECTION_BACKFILL", GOAL_PROJECTION_BACKFILL):
+        backfiller.start()
+    if app.config.get("GOAL_OUTBOX_WORKER", GOAL_OUTBOX_WORKER):
+        goal_outbox_worker.start()
+
+
+_app = None
+
+
+def __getattr__(name):
+    # `app:app` for gunicorn and `from app import app` build the default app on first access only
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,101 @@
+"""
+Multi-process write benchmark for the SQLite engine configuration.
+
+    python -m benchmarks.bench_db_writes --processes 4 --transactions 200
+
+Each profile runs against a fresh database. Every process mimics gunicorn workers
+handling `POST /users` and `PUT /users/<username>/salary`: it creates a user, then
+reads it back and updates its salary, each step in its own transaction.
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+PROFILES = {
+    # Rollback journal, no pragmas, a new connection per checkout: the previous engine setup
+    "legacy": {"SQLITE_PRAGMAS": "0", "DB_POOL_CLASS": "null"},
+    "wal": {},
+    "wal+immediate": {"SQLITE_BEGIN_MODE": "IMMEDIATE"},
+}
+
+
+def worker(env: dict, worker_id: int, transactions: int, queue) -> None:
+    """
+    Runs `transactions` create/update pairs and reports (successes, lock errors).
+    """
+    os.environ.update(env)
+    os.chdir(env["BENCH_DIR"])
+    from sqlalchemy.exc import OperationalError
+    from models import Session
+    from models.user_info import UserInfo
+
+    successes = errors = 0
+    for index in range(transactions):
+        username = f"bench-{worker_id}-{index}"
+        session = Session()
+        try:
+            session.add(UserInfo(username=username, password="password123", salary=0.0))
+            session.commit()
+            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_info.salary = float(index)
+            session.commit()
+            successes += 1
+        except OperationalError:
+            session.rollback()
+            errors += 1
+        finally:
+            session.close()
+    queue.put((successes, errors))
+
+
+def setup(env: dict) -> None:
+    os.environ.update(env)
+    os.chdir(env["BENCH_DIR"])
+    import models
+
+    models.init_db()
+
+
+def run_profile(name: str, processes: int, transactions: int) -> None:
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        env = {"BENCH_DIR": directory, "DATABASE_URL": f"sqlite:///{directory}/db.sqlite3", "DB_AUTO_INIT": "0",
+               **PROFILES[name]}
+
+        process = context.Process(target=setup, args=(env,))
+        process.start()
+        process.join()
+
+        queue = context.Queue()
+        workers = [context.Process(target=worker, args=(env, worker_id, transactions, queue))
+                   for worker_id in range(processes)]
+        started = time.perf_counter()
+        for process in workers:
+            process.start()
+        results = [queue.get() for _ in workers]
+        elapsed = time.perf_counter() - started
+        for process in workers:
+            process.join()
+
+    successes = sum(result[0] for result in results)
+    errors = sum(result[1] for result in results)
+    print(f"{name:<16} {successes / elapsed:8.1f} ops/s   {successes:6d} ok   {errors:5d} 'database is locked'"
+          f"   {elapsed:6.2f} s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--transactions", type=int, default=200, help="create/update pairs per process")
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append",
+                        help="profile to run (repeatable, all by default)")
+    args = parser.parse_args()
+
+    for name in args.profile or PROFILES:
+        run_profile(name, args.processes, args.transactions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Compares the ways SavingGoalService can fetch a user's goals, against the local stub.
+
+    python -m benchmarks.bench_goal_fetch --goals 30 --latency 0.02
+
+Every path must return the same goals in the same order; the script exits with an
+error if they differ, so it doubles as an offline check of the batch and fallback paths.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from benchmarks.secondary_api_stub import StubConfig, start_stub_server
+import services.saving_goal as saving_goal
+from services.goal_cache import GoalCache, MemoryCacheBackend, NullCacheBackend
+from services.saving_goal import SavingGoalService
+
+
+def measure(label: str, fetch, goal_ids, rounds: int):
+    """
+    Runs `fetch(goal_ids)` `rounds` times and prints the median and worst latency.
+    """
+    timings = []
+    result = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = fetch(goal_ids)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{label:<28} median {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--goals", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02, help="stub latency per call, in seconds")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    config = StubConfig(latency=args.latency)
+    server, base_url = start_stub_server(config, goals=args.goals)
+    SavingGoalService.http.base_url = base_url
+    SavingGoalService.cache = GoalCache(NullCacheBackend())
+    goal_ids = list(range(1, args.goals + 1))
+
+    try:
+        serial = measure("serial", lambda ids: [SavingGoalService.fetch_saving_goal_by_id(i) for i in ids],
+                         goal_ids, args.rounds)
+        concurrent = measure("concurrent", SavingGoalService.get_saving_goals_concurrently, goal_ids, args.rounds)
+        batch = measure("batch", SavingGoalService.get_saving_goals_by_ids, goal_ids, args.rounds)
+
+        SavingGoalService.cache = GoalCache(MemoryCacheBackend(max_entries=args.goals, ttl=60))
+        cached = measure("batch + warm cache", SavingGoalService.get_saving_goals_by_ids, goal_ids, args.rounds)
+        print(f"{'':<28} cache {SavingGoalService.cache.stats()}")
+        SavingGoalService.cache = GoalCache(NullCacheBackend())
+
+        config.batch = False
+        fallback = measure("batch rejected -> fallback", SavingGoalService.get_saving_goals_by_ids,
+                           goal_ids, args.rounds)
+        if saving_goal.batch_supported():
+            sys.exit("batch path did not detect the rejected batch form")
+    finally:
+        server.shutdown()
+
+    if not (serial == concurrent == batch == cached == fallback) or None in serial:
+        sys.exit("fetch paths returned different goals")
+    print("all fetch paths returned identical goals")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Load and latency benchmark of every route in routes/user_info.py.
+
+    python -m benchmarks.bench_load --requests 200 --concurrency 8
+    python -m benchmarks.bench_load --save-baseline benchmarks/baseline_load.json
+    python -m benchmarks.bench_load --compare benchmarks/baseline_load.json
+
+Starts the secondary API stub and the app under gunicorn (with gunicorn.conf.py and the
+chosen `--worker-class`) as separate processes, on a throwaway database, then drives each
+endpoint in turn with `--requests` requests at a fixed `--concurrency`. Phases run in an
+order that lets later ones reuse what earlier ones created (users, then goals, then renames
+and deletions). Reports throughput and p50/p95/p99 latency per endpoint.
+
+With `--compare`, the run fails with exit status 1 when an endpoint's p95 latency grew, or
+its throughput dropped, by more than `--tolerance` compared to the baseline. Latency changes
+smaller than `--slack-ms` are ignored, so sub-millisecond endpoints do not flap. A baseline
+is only meaningful on the machine and with the settings it was recorded with.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BULK_USERS_PER_REQUEST = 5
+ADMIN_TOKEN = os.environ.get("USER_LIST_SECRET", "benchmark")  # Sent to GET /users
+# Settings that must match for a baseline comparison to mean anything
+COMPARED_SETTINGS = ("requests", "concurrency", "workers", "threads", "worker_class", "preload",
+                     "latency", "jitter", "error_rate")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"process serving {url} exited with status {process.returncode}")
+        try:
+            requests.get(url, timeout=5)
+            return
+        except requests.RequestException:
+            time.sleep(0.1)
+    sys.exit(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_stub(args, workdir: str):
+    port = free_port()
+    command = [sys.executable, "-m", "benchmarks.secondary_api_stub", "--port", str(port),
+               "--latency", str(args.latency), "--jitter", str(args.jitter), "--error-rate", str(args.error_rate)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=open(os.path.join(workdir, "stub.log"), "w"),
+                               stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(f"{base_url}/goals/goal_id?goal_id=0", process)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def start_app(args, workdir: str, stub_url: str):
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("AUTH_TOKEN_SECRET", "benchmark")
+    env.setdefault("RATE_LIMIT_BACKEND", "none")  # Every request comes from one client
+    env.update({
+        "USER_LIST_SECRET": ADMIN_TOKEN,
+        "DATABASE_URL": f"sqlite:///{workdir}/db.sqlite3",
+        "LOG_PATH": os.path.join(workdir, "log/"),
+        "GOAL_CACHE_PATH": os.path.join(workdir, "cache", "goals.sqlite3"),
+        "RATE_LIMIT_PATH": os.path.join(workdir, "cache", "rate_limits.sqlite3"),
+        "SECONDARY_API_URL": stub_url,
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_WORKER_CLASS": args.worker_class,
+        "GUNICORN_WORKERS": str(args.workers),
+        "GUNICORN_THREADS": str(args.threads if args.worker_class == "gthread" else 1),
+        "GUNICORN_WORKER_CONNECTIONS": str(max(args.concurrency, 8) * 4),
+        "GUNICORN_PRELOAD": "1" if args.preload else "0",
+    })
+    command = [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py")]
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=open(os.path.join(workdir, "app.log"), "w"),
+                               stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(f"{base_url}/users?limit=1", process)
+    except BaseException:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+class LoadRun:
+    """
+    Shared state of one run: the HTTP sessions of the client threads and the users and
+    goals created by earlier phases.
+    """
+
+    def __init__(self, base_url: str, requests_per_phase: int):
+        self.base_url = base_url
+        self.count = requests_per_phase
+        self.usernames = [f"load{index}" for index in range(requests_per_phase)]
+        self.goals = [None] * requests_per_phase
+        self.tokens = {}  # Session token per username, from the login phases
+        self._local = threading.local()
+
+    @property
+    def http(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def call(self, method: str, path: str, **kwargs) -> requests.Response:
+        return self.http.request(method, f"{self.base_url}{path}", timeout=30, **kwargs)
+
+    def user(self, index: int) -> str:
+        return self.usernames[index % self.count]
+
+    def auth(self, username: str) -> dict:
+        return {"Authorization": f"Bearer {self.tokens.get(username, '')}"}
+
+    def goal(self, index: int):
+        """
+        Returns the (username, goal_id) created by the goal phase for this index, if any.
+        """
+        for offset in range(self.count):
+            goal = self.goals[(index + offset) % self.count]
+            if goal is not None:
+                return goal
+        return None
+
+
+def create_user(run: LoadRun, index: int):
+    return run.call("POST", "/users", data={"username": run.usernames[index], "password": "password123"})
+
+
+def import_users(run: LoadRun, index: int):
+    body = "".join(
+        json.dumps({"username": f"bulk{index}_{row}", "password": "password123", "salary": 1000 + row}) + "\n"
+        for row in range(BULK_USERS_PER_REQUEST))
+    return run.call("POST", "/users/bulk", data=body, headers={"Content-Type": "application/x-ndjson"})
+
+
+def list_users(run: LoadRun, index: int):
+    return run.call("GET", "/users", params={"limit": 50, "min_salary": index % 2 * 1000},
+                    headers={"X-Admin-Token": ADMIN_TOKEN})
+
+
+def login(run: LoadRun, index: int):
+    username = run.user(index)
+    response = run.call("POST", "/users/login", data={"username": username, "password": "password123"})
+    if response.ok:
+        run.tokens[username] = response.json()["access_token"]
+    return response
+
+
+def update_salary(run: LoadRun, index: int):
+    username = run.user(index)
+    return run.call("PUT", f"/users/{username}/salary", headers=run.auth(username), data={"new_salary": 3000 + index})
+
+
+def create_goal(run: LoadRun, index: int):
+    username = run.user(index)
+    response = run.call("POST", f"/users/{username}/goal", headers=run.auth(username), data={
+        "goal_name": f"Goal {index}", "goal_currency": "USD", "goal_value": 300 + index, "monthly_savings": 100})
+    if response.ok:
+        run.goals[index] = (username, response.json()["goal_ids"][-1])
+    return response
+
+
+def create_goal_async(run: LoadRun, index: int):
+    username = run.user(index)
+    return run.call("POST", f"/users/{username}/goal", headers={"Prefer": "respond-async", **run.auth(username)}, data={
+        "goal_name": f"Queued goal {index}", "goal_currency": "USD", "goal_value": 300 + index, "monthly_savings": 100})
+
+
+def get_user(run: LoadRun, index: int):
+    return run.call("GET", f"/users/{run.user(index)}")
+
+
+def get_goal(run: LoadRun, index: int):
+    username, goal_id = run.goal(index)
+    return run.call("GET", f"/users/{username}/goal/{goal_id}")
+
+
+def update_goal(run: LoadRun, index: int):
+    username, goal_id = run.goal(index)
+    return run.call("PUT", f"/users/{username}/goal/{goal_id}", headers=run.auth(username), data={
+        "goal_name": f"Goal {index}", "goal_currency": "EUR", "goal_value": 500, "monthly_savings": 50})
+
+
+def delete_goal(run: LoadRun, index: int):
+    username, goal_id = run.goals[index] or run.goal(index)
+    return run.call("DELETE", f"/users/{username}/goal/{goal_id}", headers=run.auth(username))
+
+
+def rename_user(run: LoadRun, index: int):
+    username, new_username = run.usernames[index], f"renamed{index}"
+    response = run.call("PUT", f"/users/{username}/username", headers=run.auth(username),
+                        data={"new_username": new_username})
+    if response.ok:
+        run.usernames[index] = new_username
+    return response
+
+
+def delete_user(run: LoadRun, index: int):
+    username = run.usernames[index]
+    return run.call("DELETE", f"/users/{username}", headers=run.auth(username))
+
+
+PHASES = [
+    ("POST /users", create_user),
+    ("POST /users/bulk", import_users),
+    ("GET /users", list_users),
+    ("POST /users/login", login),
+    ("PUT /users/{username}/salary", update_salary),
+    ("POST /users/{username}/goal", create_goal),
+    ("GET /users/{username}", get_user),
+    ("GET /users/{username}/goal/{goal_id}", get_goal),
+    ("PUT /users/{username}/goal/{goal_id}", update_goal),
+    ("DELETE /users/{username}/goal/{goal_id}", delete_goal),
+    ("POST /users/{username}/goal (async)", create_goal_async),
+    ("PUT /users/{username}/username", rename_user),
+    ("POST /users/login (renamed)", login),  # A rename ends the tokens of the old username
+    ("DELETE /users/{username}", delete_user),
+]
+
+
+def percentile(sorted_timings, fraction: float) -> float:
+    index = min(len(sorted_timings) - 1, max(0, round(fraction * len(sorted_timings)) - 1))
+    return sorted_timings[index]
+
+
+def run_phase(run: LoadRun, request, concurrency: int) -> dict:
+    """
+    Sends `run.count` requests through `request` from `concurrency` threads.
+    """
+
+    def timed(index: int):
+        started = time.perf_counter()
+        try:
+            response = request(run, index)
+            response.content  # Streamed endpoints are only done once the body is read
+            ok = response.ok
+        except (requests.RequestException, TypeError):  # TypeError: nothing left to act on
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(run.count)))
+    elapsed = time.perf_counter() - started
+    timings = sorted(duration * 1000 for duration, _ in results)
+    return {
+        "requests": len(results),
+        "errors": sum(1 for _, ok in results if not ok),
+        "throughput": round(len(results) / elapsed, 2),
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+    }
+
+
+def print_report(endpoints: dict) -> None:
+    print(f"{'endpoint':<42} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in endpoints.items():
+        print(f"{name:<42} {result['throughput']:8.1f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+              f"{result['p99_ms']:9.2f} {result['errors']:7d}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float, slack_ms: float):
+    """
+    Returns a description of every endpoint that regressed compared to the baseline.
+    """
+    mismatched = [key for key in COMPARED_SETTINGS if baseline["settings"].get(key) != report["settings"].get(key)]
+    if mismatched:
+        print(f"warning: settings differ from the baseline ({', '.join(mismatched)}), the comparison is unreliable")
+    regressions = []
+    for name, before in baseline["endpoints"].items():
+        after = report["endpoints"].get(name)
+        if after is None:
+            regressions.append(f"{name}: missing from this run")
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance) + slack_ms:
+            regressions.append(f"{name}: p95 {before['p95_ms']:.2f} ms -> {after['p95_ms']:.2f} ms")
+        if after["throughput"] < before["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput']:.1f} -> {after['throughput']:.1f} req/s")
+        if after["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {after['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight at once")
+    parser.add_argument("--workers", type=int, default=1, help="gunicorn workers")
+    parser.add_argument("--threads", type=int, default=8, help="gunicorn threads per gthread worker")
+    parser.add_argument("--worker-class", choices=("sync", "gthread", "gevent"), default="gthread",
+                        help="gunicorn worker class")
+    parser.add_argument("--preload", action="store_true", help="load the app in the gunicorn master before forking")
+    parser.add_argument("--latency", type=float, default=0.005, help="stub latency per call, in seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="random extra stub delay, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub calls answered with 503")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    parser.add_argument("--save-baseline", help="write the report as the new baseline to this file")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="allowed relative regression")
+    parser.add_argument("--slack-ms", type=float, default=5.0, help="latency growth always tolerated, in ms")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    stub, stub_url = start_stub(args, workdir)
+    try:
+        app, app_url = start_app(args, workdir, stub_url)
+        try:
+            run = LoadRun(app_url, args.requests)
+            endpoints = {name: run_phase(run, request, args.concurrency) for name, request in PHASES}
+        finally:
+            app.terminate()
+            app.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    report = {
+        "settings": {key: getattr(args, key) for key in COMPARED_SETTINGS},
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "endpoints": endpoints,
+    }
+    print_report(endpoints)
+    print(f"server logs in {workdir}")
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w") as file:
+                json.dump(report, file, indent=2)
+                file.write("\n")
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(report, json.load(file), args.tolerance, args.slack_ms)
+        if regressions:
+            print("REGRESSIONS:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"no regression beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
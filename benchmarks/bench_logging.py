@@ -0,0 +1,81 @@
+"""
+Logging overhead per request, before and after the queue-based pipeline.
+
+    python -m benchmarks.bench_logging --requests 5000
+
+"legacy" reproduces the previous setup: synchronous console and RotatingFileHandler
+(maxBytes=10000) on the request thread, with eagerly built f-strings that include the
+goal payload. "pipeline" uses logger.LogPipeline with production file sizes, JSON lines,
+lazy %-style arguments and the default rate limit. Only the time spent on the calling
+thread is measured, which is what a request pays.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import tempfile
+import time
+
+from logger import JsonFormatter, LogPipeline, LOG_MAX_BYTES
+
+GOAL_DATA = {"goal_name": "Pretty dress", "goal_currency": "USD", "goal_value": 300.0, "monthly_savings": 100.0}
+DETAILED = "[%(asctime)s] %(levelname)-4s %(message)s - call_trace=%(pathname)s L%(lineno)-4d"
+
+
+def legacy_request(log: logging.Logger, index: int) -> None:
+    username, goal_id = f"user{index}", index
+    log.info(f"goal_data: {GOAL_DATA}")
+    log.info(f"Adding saving goal for user: {username}")
+    log.info(f"Updating goal with ID {goal_id} for user {username} with data: {GOAL_DATA}")
+    log.info(f"Goal retrieved successfully for user {username}: {GOAL_DATA}")
+    log.info(f"Goal with ID {goal_id} added to user with username {username} successfully")
+
+
+def pipeline_request(log: logging.Logger, index: int) -> None:
+    username, goal_id = f"user{index}", index
+    log.info("Adding saving goal for user: %s", username)
+    log.info("Updating goal with ID %s for user %s", goal_id, username)
+    log.info("Goal retrieved successfully for user %s", username)
+    log.info("Goal with ID %s added to user with username %s successfully", goal_id, username)
+
+
+def make_logger(name: str, directory: str, max_bytes: int, formatter: logging.Formatter) -> logging.Logger:
+    log = logging.getLogger(name)
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    console = logging.StreamHandler(open(os.devnull, "w"))
+    console.setFormatter(formatter)
+    rotating = logging.handlers.RotatingFileHandler(
+        os.path.join(directory, f"{name}.log"), maxBytes=max_bytes, backupCount=10, delay=True)
+    rotating.setFormatter(formatter)
+    log.addHandler(console)
+    log.addHandler(rotating)
+    return log
+
+
+def measure(label: str, request, log: logging.Logger, requests: int) -> None:
+    started = time.perf_counter()
+    for index in range(requests):
+        request(log, index)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {elapsed / requests * 1e6:8.1f} us per request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy = make_logger("bench.legacy", directory, 10000, logging.Formatter(DETAILED))
+        measure("legacy", legacy_request, legacy, args.requests)
+
+        make_logger("bench.pipeline", directory, LOG_MAX_BYTES, JsonFormatter())
+        pipeline = LogPipeline(["bench.pipeline"])
+        pipeline.start()
+        measure("pipeline", pipeline_request, logging.getLogger("bench.pipeline"), args.requests)
+        pipeline.stop()
+
+
+if __name__ == "__main__":
+    main()
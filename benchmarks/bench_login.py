@@ -0,0 +1,70 @@
+"""
+Login throughput benchmark.
+
+    python -m benchmarks.bench_login --seconds 5 --threads 8
+
+Measures scrypt verifications per second on a single core, then drives `POST /users/login`
+through the app from several threads, with hashing offloaded to the process pool, and
+reports logins per second overall and per core.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+
+def run_for(seconds: float, func) -> int:
+    """
+    Calls `func` repeatedly for `seconds` and returns the number of calls.
+    """
+    calls = 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        func()
+        calls += 1
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, default=8, help="concurrent login requests")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-login-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{workdir}/db.sqlite3")
+    os.environ.setdefault("AUTH_TOKEN_SECRET", "benchmark")
+    os.chdir(workdir)
+
+    import password_hashing
+    from services.auth import AUTH_HASH_WORKERS
+    from app import app
+
+    stored = password_hashing.hash_password("password123")
+    calls = run_for(args.seconds, lambda: password_hashing.verify_password("password123", stored))
+    print(f"single core, in-process      {calls / args.seconds:8.1f} verifications/s")
+
+    client = app.test_client()
+    client.post("/users", data={"username": "bench", "password": "password123"})
+    counts = []
+
+    def login_loop():
+        thread_client = app.test_client()
+        counts.append(run_for(args.seconds, lambda: thread_client.post(
+            "/users/login", data={"username": "bench", "password": "password123"})))
+
+    threads = [threading.Thread(target=login_loop) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    rate = sum(counts) / args.seconds
+    cores = min(AUTH_HASH_WORKERS, os.cpu_count() or 1)
+    print(f"POST /users/login, {args.threads} threads {rate:8.1f} logins/s   "
+          f"{rate / cores:8.1f} logins/s per core ({AUTH_HASH_WORKERS} hash workers)")
+
+
+if __name__ == "__main__":
+    main()
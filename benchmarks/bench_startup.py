@@ -0,0 +1,93 @@
+"""
+Startup cost of a fresh process: importing the app, building it with `create_app` and
+answering the first requests, each in a new interpreter as a gunicorn worker would.
+
+    python -m benchmarks.bench_startup --runs 5
+
+The first request is a profile lookup, so it pays for building the engine and, with
+DB_AUTO_INIT=1, for the schema check. Three databases are compared: a new one, one that
+already exists, and one that exists with DB_AUTO_INIT=0 (schema left to `init-db`).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app as app_module
+imported = time.perf_counter()
+app = app_module.create_app()
+created = time.perf_counter()
+client = app.test_client()
+first_status = client.get("/users/nobody").status_code
+first = time.perf_counter()
+client.get("/users/nobody")
+second = time.perf_counter()
+with open(sys.argv[1], "w") as file:
+    json.dump({
+        "import_ms": (imported - started) * 1000,
+        "create_app_ms": (created - imported) * 1000,
+        "first_request_ms": (first - created) * 1000,
+        "second_request_ms": (second - first) * 1000,
+        "first_status": first_status,
+    }, file)
+"""
+
+SCENARIOS = {
+    "new database": {"DB_AUTO_INIT": "1"},
+    "existing database": {"DB_AUTO_INIT": "1"},
+    "existing, DB_AUTO_INIT=0": {"DB_AUTO_INIT": "0"},
+}
+COLUMNS = ["process_ms", "import_ms", "create_app_ms", "first_request_ms", "second_request_ms"]
+
+
+def run_probe(directory: str, env: dict) -> dict:
+    """
+    Runs the probe in a new interpreter and returns its timings, plus the wall time of the process.
+    """
+    output = os.path.join(directory, "timings.json")
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-c", PROBE, output], cwd=ROOT, capture_output=True, text=True,
+                               env={**os.environ, **env}, check=True)
+    with open(output) as file:
+        timings = json.load(file)
+    timings["process_ms"] = (time.perf_counter() - started) * 1000
+    if timings["first_status"] != 404:
+        sys.exit(f"unexpected status {timings['first_status']} in {directory}:\n{completed.stderr}")
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="processes started per scenario")
+    args = parser.parse_args()
+
+    print(f"{'median of ' + str(args.runs) + ' runs':<28}" + "".join(f"{column[:-3]:>16}" for column in COLUMNS))
+    for name, settings in SCENARIOS.items():
+        results = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as directory:
+                env = {
+                    "DATABASE_URL": f"sqlite:///{directory}/db.sqlite3",
+                    "LOG_PATH": os.path.join(directory, "log/"),
+                    "GOAL_CACHE_PATH": os.path.join(directory, "goals.sqlite3"),
+                    "LOG_LEVEL": "WARNING",
+                    "AUTH_TOKEN_SECRET": os.environ.get("AUTH_TOKEN_SECRET", "benchmark"),
+                }
+                if name != "new database":
+                    run_probe(directory, {**env, "DB_AUTO_INIT": "1"})
+                results.append(run_probe(directory, {**env, **settings}))
+        print(f"{name:<28}" + "".join(
+            f"{statistics.median(result[column] for result in results):13.1f} ms" for column in COLUMNS))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput comparison of the gunicorn worker classes.
+
+    python -m benchmarks.bench_workers --requests 100 --workers 2
+    python -m benchmarks.bench_workers --classes sync gthread --preload
+
+Runs benchmarks/bench_load.py once per worker class, with the same settings, and prints the
+throughput of every endpoint side by side, then the overall throughput (all requests over the
+total time spent in every phase) and the p95 latency across endpoints. Extra arguments are
+passed to bench_load unchanged.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKER_CLASSES = ("sync", "gthread", "gevent")
+
+
+def run_load(worker_class: str, extra_args, workdir: str) -> dict:
+    output = os.path.join(workdir, f"{worker_class}.json")
+    command = [sys.executable, "-m", "benchmarks.bench_load", "--worker-class", worker_class,
+               "--output", output, *extra_args]
+    subprocess.run(command, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    with open(output) as file:
+        return json.load(file)
+
+
+def overall(report: dict) -> dict:
+    endpoints = report["endpoints"].values()
+    requests_total = sum(result["requests"] for result in endpoints)
+    seconds = sum(result["requests"] / result["throughput"] for result in endpoints if result["throughput"])
+    return {
+        "throughput": requests_total / seconds if seconds else 0.0,
+        "worst_p95_ms": max(result["p95_ms"] for result in endpoints),
+        "errors": sum(result["errors"] for result in endpoints),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--classes", nargs="+", choices=WORKER_CLASSES, default=list(WORKER_CLASSES),
+                        help="worker classes to compare")
+    parser.add_argument("--output", help="write every report as JSON to this file")
+    args, extra_args = parser.parse_known_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-workers-")
+    reports = {}
+    for worker_class in args.classes:
+        print(f"running {worker_class}...", flush=True)
+        reports[worker_class] = run_load(worker_class, extra_args, workdir)
+
+    names = list(next(iter(reports.values()))["endpoints"])
+    print(f"\n{'req/s':<42}" + "".join(f"{worker_class:>10}" for worker_class in reports))
+    for name in names:
+        row = "".join(f"{report['endpoints'][name]['throughput']:10.1f}" for report in reports.values())
+        print(f"{name:<42}{row}")
+    totals = {worker_class: overall(report) for worker_class, report in reports.items()}
+    print(f"{'overall':<42}" + "".join(f"{total['throughput']:10.1f}" for total in totals.values()))
+    print(f"{'worst p95 ms':<42}" + "".join(f"{total['worst_p95_ms']:10.1f}" for total in totals.values()))
+    print(f"{'errors':<42}" + "".join(f"{total['errors']:10d}" for total in totals.values()))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"reports": reports, "overall": totals}, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Local stand-in for the secondary API, used to exercise and benchmark the main API offline.
+
+Run it standalone with:
+    python -m benchmarks.secondary_api_stub --port 5002 --latency 0.02 --jitter 0.01 --error-rate 0.01
+
+or start it in-process with `start_stub_server(...)`.
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+class StubConfig:
+    """
+    Runtime behaviour of the stub, adjustable while it is running.
+    """
+
+    def __init__(self, latency: float = 0.0, batch: bool = True, jitter: float = 0.0, error_rate: float = 0.0):
+        """
+        :param latency: Seconds added to every response
+        :param batch: Whether `GET /goals?ids=...` is supported; when False it answers 400
+        :param jitter: Upper bound of a random delay, in seconds, added on top of `latency`
+        :param error_rate: Fraction of requests answered with HTTP 503
+        """
+        self.latency = latency
+        self.batch = batch
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+
+def create_stub_app(config: StubConfig, goals: int = 0) -> Flask:
+    """
+    Builds the stub application, pre-populated with `goals` saving goals.
+    """
+    app = Flask("secondary_api_stub")
+    store = {}
+    created_by_key = {}  # Idempotency-Key -> goal ID
+    lock = threading.Lock()
+    next_id = [1]
+
+    def new_goal(data) -> dict:
+        with lock:
+            goal_id = next_id[0]
+            next_id[0] += 1
+        goal_value = float(data.get("goal_value", 300.0))
+        goal = {
+            "id": goal_id,
+            "goal_name": data.get("goal_name", f"Goal {goal_id}"),
+            "goal_currency": data.get("goal_currency", "USD"),
+            "goal_value": goal_value,
+            "monthly_savings": float(data.get("monthly_savings", 100.0)),
+            "converted_value": round(goal_value * random.uniform(0.5, 6.0), 2),
+            "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        store[goal_id] = goal
+        return goal
+
+    for _ in range(goals):
+        new_goal({})
+
+    @app.before_request
+    def simulate_upstream():
+        delay = config.latency + (random.uniform(0, config.jitter) if config.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        if config.error_rate and random.random() < config.error_rate:
+            return jsonify({"message": "Service unavailable."}), 503
+
+    @app.post("/goals")
+    def post_goal():
+        key = request.headers.get("Idempotency-Key")
+        if key and created_by_key.get(key) in store:
+            return jsonify(store[created_by_key[key]])
+        goal = new_goal(request.form)
+        if key:
+            created_by_key[key] = goal["id"]
+        return jsonify(goal)
+
+    @app.get("/goals")
+    def get_goals():
+        ids = request.args.get("ids")
+        if ids is None:
+            return jsonify(list(store.values()))
+        if not config.batch:
+            return jsonify({"message": "Unknown parameter 'ids'."}), 400
+        wanted = [int(goal_id) for goal_id in ids.split(",") if goal_id]
+        return jsonify([store[goal_id] for goal_id in wanted if goal_id in store])
+
+    @app.get("/goals/goal_id")
+    def get_goal():
+        goal = store.get(request.args.get("goal_id", type=int))
+        if not goal:
+            return jsonify({"message": "Goal not found."}), 404
+        return jsonify(goal)
+
+    @app.put("/goals/goal_id")
+    def put_goal():
+        goal = store.get(request.args.get("goal_id", type=int))
+        if not goal:
+            return jsonify({"message": "Goal not found."}), 404
+        for field in ("goal_name", "goal_currency"):
+            if field in request.form:
+                goal[field] = request.form[field]
+        for field in ("goal_value", "monthly_savings"):
+            if field in request.form:
+                goal[field] = float(request.form[field])
+        return jsonify(goal)
+
+    @app.delete("/goals/goal_id")
+    def delete_goal():
+        goal = store.pop(request.args.get("goal_id", type=int), None)
+        if not goal:
+            return jsonify({"message": "Goal not found."}), 404
+        return jsonify({"message": "Goal deleted successfully."})
+
+    return app
+
+
+def start_stub_server(config: StubConfig, goals: int = 0, host: str = "127.0.0.1", port: int = 0):
+    """
+    Starts the stub on a background thread and returns the server and its base URL.
+    Call `server.shutdown()` to stop it.
+    """
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    server = make_server(host, port, create_stub_app(config, goals), threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 503")
+    parser.add_argument("--goals", type=int, default=0, help="number of goals to pre-populate")
+    parser.add_argument("--no-batch", action="store_true", help="reject `GET /goals?ids=...` with HTTP 400")
+    args = parser.parse_args()
+
+    stub_config = StubConfig(latency=args.latency, batch=not args.no_batch, jitter=args.jitter,
+                             error_rate=args.error_rate)
+    create_stub_app(stub_config, args.goals).run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,130 @@
+"""
+Gunicorn settings for serving the API in production:
+
+    gunicorn -c gunicorn.conf.py
+
+Every setting is overridable through the environment:
+
+    GUNICORN_BIND                 address to listen on (0.0.0.0:5000)
+    GUNICORN_WORKER_CLASS         sync, gthread or gevent (gthread)
+    GUNICORN_WORKERS              worker processes (tuned to the CPU count and the worker class)
+    GUNICORN_THREADS              threads per gthread worker (4)
+    GUNICORN_WORKER_CONNECTIONS   concurrent requests per gevent worker (100)
+    GUNICORN_PRELOAD              import the app once in the master before forking (0)
+    GUNICORN_TIMEOUT              seconds before a silent worker is restarted (30)
+    GUNICORN_MAX_REQUESTS         requests after which a worker is recycled, 0 for never (0)
+
+AUTH_HASH_WORKERS, the password hashing processes of each worker, defaults to the cores
+divided by the workers, ADMISSION_MAX_IN_FLIGHT, the requests a worker serves before
+shedding the next ones, to its threads (greenlets under gevent) minus one, and
+RATE_LIMIT_BACKEND to `file` with several workers, so that they share the rate limits.
+
+gevent workers are not supported with the SQLite backends. SQLite calls block the event loop of
+the whole worker, and once `monkey.patch_all()` has run, the thread-local SQLite connections of
+the file goal cache and of the file rate limits become greenlet-local, opened again for every
+request. Under gevent both default to their memory backend, and the database should be a server
+one (DATABASE_URL); gevent with the SQLite database is only kept for benchmarks/bench_workers.py.
+
+The master creates or migrates the schema before forking (unless DB_AUTO_INIT=0). Whatever
+the app created before the fork (the database engine's pool, the HTTP session to the
+secondary API) is dropped in each worker by `post_fork`, and the background threads are
+started by `post_worker_init`, once per worker.
+"""
+import multiprocessing
+import os
+import secrets
+import shutil
+
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+
+if worker_class == "gevent":
+    # Patched before the app is imported, which may happen in the master with preload_app
+    from gevent import monkey
+
+    monkey.patch_all()
+
+
+def default_workers(worker_class: str) -> int:
+    """
+    Blocking sync workers need extra processes to cover I/O waits; gthread workers cover them
+    with threads and gevent workers with greenlets, so one process per core (plus one) is enough.
+    """
+    cores = multiprocessing.cpu_count()
+    if worker_class == "sync":
+        return cores * 2 + 1
+    if worker_class == "gthread":
+        return cores + 1
+    return cores
+
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", str(default_workers(worker_class))))
+# gunicorn turns a sync worker with several threads into a gthread one
+threads = int(os.environ.get("GUNICORN_THREADS", "4" if worker_class == "gthread" else "1"))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", "100"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "0") == "1"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", "5"))
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+
+# Each worker hashes passwords on its own process pool, so the cores are split between the workers
+os.environ.setdefault("AUTH_HASH_WORKERS", str(max(1, multiprocessing.cpu_count() // workers)))
+
+# A worker never runs more requests than its threads, so shedding starts one short of them and the
+# last thread answers the 503s at once instead of leaving the excess queued. Sync workers shed nothing.
+concurrency = worker_connections if worker_class == "gevent" else threads
+os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", str(concurrency - 1))
+
+if worker_class == "gevent":
+    # The file backends keep one SQLite connection per thread, which gevent turns into one per request
+    os.environ.setdefault("GOAL_CACHE_BACKEND", "memory")
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+
+# Buckets kept per worker would let a client through once per worker; one worker keeps them in memory
+os.environ.setdefault("RATE_LIMIT_BACKEND", "file" if workers > 1 else "memory")
+
+# The background threads are started per worker by post_worker_init
+wsgi_app = "app:create_app({'BACKGROUND_JOBS': False})"
+
+# Session tokens must verify in every worker. Without a configured secret, the workers of this
+# server share one; set AUTH_TOKEN_SECRET to keep tokens valid across restarts and hosts.
+os.environ.setdefault("AUTH_TOKEN_SECRET", secrets.token_hex(32))
+
+
+def on_starting(server):
+    # Samples left by a previous run would be aggregated with the new ones
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+    # Imported now rather than in child_exit, which runs in a signal handler and may interrupt itself
+    import metrics  # noqa: F401
+    import models
+
+    # The schema is checked once, here, instead of by every worker at once. The workers are forked
+    # from this process and inherit the models module as configured here.
+    if models.DB_AUTO_INIT:
+        models.configure(auto_init=False)
+        models.init_db()
+
+
+def post_fork(server, worker):
+    import models
+    from services.http_client import secondary_api
+
+    models.dispose_engine()
+    secondary_api.reset()
+
+
+def post_worker_init(worker):
+    from app import start_background_jobs
+
+    start_background_jobs(worker.wsgi)
+
+
+def child_exit(server, worker):
+    import metrics
+
+    metrics.mark_process_dead(worker.pid)
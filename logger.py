@@ -1,59 +1,227 @@
 from logging.config import dictConfig
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import json
 import logging
 import os
+import queue
+import random
+import threading
+import time
 
 
-log_path = "log/"
-if not os.path.exists(log_path):
-   os.makedirs(log_path)
+# Logging settings, all overridable through the environment
+log_path = os.environ.get("LOG_PATH", "log/")
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json or text
+LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get("LOG_BACKUP_COUNT", "5"))
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+# Records per second allowed for each message template below WARNING, 0 disables the limit
+LOG_RATE_LIMIT = float(os.environ.get("LOG_RATE_LIMIT", "20"))
+# Fraction of records below WARNING kept per logger, e.g. "logger=0.1,gunicorn.error=0.5"
+LOG_SAMPLE_RATES = {
+    name.strip(): float(rate)
+    for name, _, rate in (item.partition("=") for item in os.environ.get("LOG_SAMPLE_RATES", "").split(","))
+    if name.strip() and rate
+}
 
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one compact JSON object per line.
+    """
 
-dictConfig({
-    "version": 1,
-    "disable_existing_loggers": True,
-    "formatters": {
-        "default": {
-            "format": "[%(asctime)s] %(levelname)-4s %(message)s",
-        },
-        "detailed": {
-            "format": "[%(asctime)s] %(levelname)-4s %(message)s - call_trace=%(pathname)s L%(lineno)-4d",
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
         }
-    },
-    "handlers": {
-        "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "default",
-            "stream": "ext://sys.stdout",
-        },
-        "error_file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "formatter": "detailed",
-            "filename": "log/gunicorn.error.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
-            "delay": "True",
-        },
-        "detailed_file": {
-            "class": "logging.handlers.RotatingFileHandler",
-            "formatter": "detailed",
-            "filename": "log/gunicorn.detailed.log",
-            "maxBytes": 10000,
-            "backupCount": 10,
-            "delay": "True",
-        }
-    },
-    "loggers": {
-        "gunicorn.error": {
-            "handlers": ["console", "error_file"],  #, email],
-            "level": "INFO",
-            "propagate": False,
-        }
-    },
-    "root": {
-        "handlers": ["console", "detailed_file"],
-        "level": "INFO",
-    }
-})
+        if record.levelno >= logging.WARNING:
+            entry["src"] = f"{record.pathname}:{record.lineno}"
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the records below WARNING, per logger name.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Token bucket per (logger, message template) for records below WARNING.
+    A hot-path message logged on every request is capped at `per_second` records,
+    while rare messages always pass.
+    """
+
+    def __init__(self, per_second: float, burst: float = None):
+        super().__init__()
+        self.per_second = per_second
+        self.burst = burst or per_second
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.per_second <= 0 or record.levelno >= logging.WARNING:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.per_second)
+            allowed = tokens >= 1
+            self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        return allowed
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    In-process queue handler that drops records instead of blocking the request thread
+    when the queue is full.
+    """
+
+    def prepare(self, record):
+        # Records never leave the process, so message formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+
+class LogPipeline:
+    """
+    Moves the configured handlers of the given loggers behind a queue.
+    Request threads only enqueue records; formatting and file I/O, rotation included,
+    happen on a background listener thread.
+    """
+
+    def __init__(self, logger_names):
+        self.queue_handlers = []
+        self.listeners = []
+        for name in logger_names:
+            target = logging.getLogger(name)
+            handlers = list(target.handlers)
+            queue_handler = NonBlockingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+            queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+            queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT))
+            for handler in handlers:
+                target.removeHandler(handler)
+            target.addHandler(queue_handler)
+            self.queue_handlers.append(queue_handler)
+            self.listeners.append(QueueListener(queue_handler.queue, *handlers, respect_handler_level=True))
+
+    def start(self):
+        for listener in self.listeners:
+            listener.start()
+
+    def stop(self):
+        """
+        Flushes the queued records and stops the listener threads.
+        """
+        for listener in self.listeners:
+            if listener._thread is not None:
+                listener.stop()
+
+    def restart_in_child(self):
+        """
+        Gives a forked process fresh queues and listener threads; threads do not survive a fork.
+        """
+        for queue_handler, listener in zip(self.queue_handlers, self.listeners):
+            queue_handler.queue = queue.Queue(LOG_QUEUE_SIZE)
+            listener.queue = queue_handler.queue
+            listener._thread = None
+        self.start()
+
+
+pipeline = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """
+    Sets up the console and rotating file handlers behind the queue pipeline.
+    Runs once per process: importing this module only creates the logger, so that
+    scripts and tests that never log pay nothing for handler setup.
+    """
+    global pipeline
+    with _configure_lock:
+        if pipeline is not None:
+            return
+        os.makedirs(log_path, exist_ok=True)
+        formatter_class = JsonFormatter if LOG_FORMAT == "json" else logging.Formatter
+
+        dictConfig({
+            "version": 1,
+            "disable_existing_loggers": True,
+            "formatters": {
+                "default": {
+                    "()": formatter_class,
+                    "fmt": "[%(asctime)s] %(levelname)-4s %(message)s",
+                },
+                "detailed": {
+                    "()": formatter_class,
+                    "fmt": "[%(asctime)s] %(levelname)-4s %(message)s - call_trace=%(pathname)s L%(lineno)-4d",
+                }
+            },
+            "handlers": {
+                "console": {
+                    "class": "logging.StreamHandler",
+                    "formatter": "default",
+                    "stream": "ext://sys.stdout",
+                },
+                "error_file": {
+                    "class": "logging.handlers.RotatingFileHandler",
+                    "formatter": "detailed",
+                    "filename": os.path.join(log_path, "gunicorn.error.log"),
+                    "maxBytes": LOG_MAX_BYTES,
+                    "backupCount": LOG_BACKUP_COUNT,
+                    "delay": "True",
+                },
+                "detailed_file": {
+                    "class": "logging.handlers.RotatingFileHandler",
+                    "formatter": "detailed",
+                    "filename": os.path.join(log_path, "gunicorn.detailed.log"),
+                    "maxBytes": LOG_MAX_BYTES,
+                    "backupCount": LOG_BACKUP_COUNT,
+                    "delay": "True",
+                }
+            },
+            "loggers": {
+                "gunicorn.error": {
+                    "handlers": ["console", "error_file"],  #, email],
+                    "level": LOG_LEVEL,
+                    "propagate": False,
+                }
+            },
+            "root": {
+                "handlers": ["console", "detailed_file"],
+                "level": LOG_LEVEL,
+            }
+        })
+        # The application logger exists before this runs, so dictConfig has just disabled it
+        logger.disabled = False
+
+        pipeline = LogPipeline(["", "gunicorn.error"])
+        pipeline.start()
+        atexit.register(pipeline.stop)
+        os.register_at_fork(after_in_child=pipeline.restart_in_child)
 
 
 logger = logging.getLogger(__name__)
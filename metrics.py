@@ -0,0 +1,131 @@
+"""
+Prometheus metrics for the API.
+
+With several gunicorn workers, set PROMETHEUS_MULTIPROC_DIR to an empty directory shared
+by the workers (and wiped before the server starts): each process then writes its samples
+there and `/metrics` aggregates all of them, whichever worker answers.
+"""
+import os
+import time
+
+from flask import Response, g, request
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+
+PROMETHEUS_MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Request latency per route and status code.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency per route.",
+    ["route"], buckets=LATENCY_BUCKETS)
+db_statements_per_request = Histogram(
+    "db_statements_per_request", "Number of SQL statements executed by a request, per route.",
+    ["route"], buckets=STATEMENT_COUNT_BUCKETS)
+upstream_request_duration = Histogram(
+    "upstream_request_duration_seconds", "Secondary API call latency per verb and path.",
+    ["verb", "path"], buckets=LATENCY_BUCKETS)
+upstream_errors = Counter(
+    "upstream_errors_total", "Secondary API calls that raised or answered with a 5xx, per verb and path.",
+    ["verb", "path"])
+upstream_rejected = Counter(
+    "upstream_rejected_total", "Secondary API calls not sent, per verb, path and reason (circuit_open or budget).",
+    ["verb", "path", "reason"])
+upstream_in_flight = Gauge(
+    "upstream_in_flight", "Secondary API calls currently in flight, per verb.",
+    ["verb"], multiprocess_mode="livesum")
+goal_cache_lookups = Counter(
+    "goal_cache_lookups_total", "Goal cache lookups by result.", ["result"])
+user_cache_lookups = Counter(
+    "user_cache_lookups_total", "User row cache lookups by result.", ["result"])
+admission_rejected = Counter(
+    "admission_rejected_total",
+    "Requests refused by admission control, by reason (client, user, in_flight or upstream).", ["reason"])
+goal_outbox_deliveries = Counter(
+    "goal_outbox_deliveries_total",
+    "Goal outbox delivery attempts by outcome (created, retry, failed or dropped).", ["outcome"])
+
+
+def current_route() -> str:
+    """
+    Returns the route template of the current request, to keep label cardinality bounded.
+    """
+    try:
+        return request.url_rule.rule if request.url_rule else "unmatched"
+    except RuntimeError:  # Outside of a request, e.g. on a worker thread
+        return "background"
+
+
+def before_request():
+    g.metrics_started_at = time.perf_counter()
+    g.metrics_statements = 0
+
+
+def after_request(response):
+    started_at = getattr(g, "metrics_started_at", None)
+    if started_at is not None:
+        route = current_route()
+        http_request_duration.labels(request.method, route, response.status_code).observe(
+            time.perf_counter() - started_at)
+        db_statements_per_request.labels(route).observe(g.metrics_statements)
+    return response
+
+
+def metrics_view():
+    """
+    Serves every metric in the Prometheus text format.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        payload = generate_latest(registry)
+    else:
+        payload = generate_latest()
+    return Response(payload, mimetype=CONTENT_TYPE_LATEST)
+
+
+def init_app(app) -> None:
+    """
+    Adds the request hooks and the `/metrics` endpoint to the app.
+    """
+    app.before_request(before_request)
+    app.after_request(after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+
+def init_engine(engine) -> None:
+    """
+    Times every SQL statement executed by the engine and counts them per request.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def observe_statement(conn, cursor, statement, parameters, context, executemany):
+        started_at = conn.info["metrics_started_at"].pop()
+        db_statement_duration.labels(current_route()).observe(time.perf_counter() - started_at)
+        try:
+            g.metrics_statements += 1
+        except (RuntimeError, AttributeError):
+            pass
+
+    @event.listens_for(engine, "handle_error")
+    def discard_statement_timer(exception_context):
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("metrics_started_at"):
+            connection.info["metrics_started_at"].pop()
+
+
+def mark_process_dead(pid: int) -> None:
+    """
+    Drops the live gauges of a worker that exited. Call it from gunicorn's `child_exit` hook.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -1,22 +1,115 @@
-from sqlalchemy_utils import database_exists, create_database
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+"""
+Database models and the application engine.
+
+Importing this package does not touch the database. The engine is built on first use,
+by `get_engine()` or the first `Session()`, and the schema is created and migrated then
+when DB_AUTO_INIT is on. With DB_AUTO_INIT=0 the schema is left to an explicit
+    flask --app app init-db
+so that worker processes skip the check at boot.
+"""
 import os
+import threading
+
+from sqlalchemy.orm import sessionmaker
 
 from models.base import Base
+from models.engine import build_engine
+from models.user_goal import UserGoal
 from models.user_info import UserInfo
+from models.saving_goal_projection import SavingGoalProjection
+from models.pending_goal import PendingGoal
+from models.goal_outbox import GoalOutbox
+from models.migrations import run_migrations
+
+DB_AUTO_INIT = os.environ.get("DB_AUTO_INIT", "1") == "1"
+
+_engine = None
+_engine_url = None
+_engine_hooks = []
+_engine_lock = threading.Lock()
+
+
+def configure(url: str = None, auto_init: bool = None) -> None:
+    """
+    Overrides the database URL and DB_AUTO_INIT before the engine is built.
+    """
+    global _engine_url, DB_AUTO_INIT
+    if url is None and auto_init is None:
+        return
+    if _engine is not None:
+        raise RuntimeError("The engine is already built; configure the database before first use.")
+    if url is not None:
+        _engine_url = url
+    if auto_init is not None:
+        DB_AUTO_INIT = auto_init
+
+
+def on_engine_created(hook) -> None:
+    """
+    Calls `hook(engine)` once the engine is built, right away if it already is.
+    """
+    with _engine_lock:
+        _engine_hooks.append(hook)
+        engine = _engine
+    if engine is not None:
+        hook(engine)
+
+
+def get_engine():
+    """
+    Returns the application engine, building it (and, with DB_AUTO_INIT, the schema) on first call.
+    """
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            engine = build_engine(_engine_url)
+            for hook in _engine_hooks:
+                hook(engine)
+            if DB_AUTO_INIT:
+                init_db(engine)
+            _engine = engine
+    return _engine
+
+
+def dispose_engine() -> None:
+    """
+    Drops the pooled connections of the engine in a process forked after it was used, such as
+    a gunicorn worker of a preloaded app. The connections belong to the parent and are left
+    open for it; the engine opens new ones on demand.
+    """
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+def init_db(engine=None) -> None:
+    """
+    Creates the database and its tables if needed, then applies the data migrations.
+    """
+    from sqlalchemy_utils import database_exists, create_database
+
+    if engine is None:
+        if DB_AUTO_INIT:  # Building the engine initializes the database
+            get_engine()
+            return
+        engine = get_engine()
+    if not database_exists(engine.url):
+        create_database(engine.url)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
 
-db_path = "database/"
-if not os.path.exists(db_path):
-   os.makedirs(db_path)
 
-db_url = 'sqlite:///%s/db.sqlite3' % db_path
+class LazySessionmaker(sessionmaker):
+    """
+    Session factory that binds itself to the application engine the first time it is called.
+    """
 
-engine = create_engine(db_url, echo=False)
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
 
-Session = sessionmaker(bind=engine)
 
-if not database_exists(engine.url):
-    create_database(engine.url)
+Session = LazySessionmaker()
 
-Base.metadata.create_all(engine)
@@ -0,0 +1,102 @@
+import os
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool, QueuePool, SingletonThreadPool, StaticPool
+
+# Database settings, all overridable through the environment. DATABASE_URL can point to
+# a server database (e.g. postgresql://...), in which case the SQLite settings are ignored.
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///database/db.sqlite3")
+DB_ECHO = os.environ.get("DB_ECHO", "0") == "1"
+DB_POOL_CLASS = os.environ.get("DB_POOL_CLASS", "queue")  # queue, null, static, singleton
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "0") == "1"
+
+SQLITE_PRAGMAS = os.environ.get("SQLITE_PRAGMAS", "1") == "1"
+SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000"))  # milliseconds
+SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE", "-65536"))  # negative means KiB
+SQLITE_BEGIN_MODE = os.environ.get("SQLITE_BEGIN_MODE", "DEFERRED")  # DEFERRED or IMMEDIATE
+
+POOL_CLASSES = {
+    "queue": QueuePool,
+    "null": NullPool,
+    "static": StaticPool,
+    "singleton": SingletonThreadPool,
+}
+
+
+def ensure_sqlite_directory(url: str) -> None:
+    """
+    Creates the directory of a SQLite database file if it does not exist yet.
+    """
+    prefix = "sqlite:///"
+    if url.startswith(prefix) and ":memory:" not in url:
+        directory = os.path.dirname(url[len(prefix):])
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+
+def build_engine(url: str = None, **overrides):
+    """
+    Creates the application engine for `url` (DATABASE_URL by default).
+    Pool settings apply to every backend; SQLite connections additionally get the
+    configured pragmas each time the pool opens one.
+    """
+    url = url or DATABASE_URL
+    is_sqlite = url.startswith("sqlite")
+    pool_name = overrides.pop("pool_class", DB_POOL_CLASS)
+    pool_class = POOL_CLASSES.get(pool_name)
+    if pool_class is None:
+        raise ValueError(f"Unknown pool class '{pool_name}'.")
+
+    options = {"echo": DB_ECHO, "poolclass": pool_class, "pool_pre_ping": DB_POOL_PRE_PING}
+    if pool_class is QueuePool:
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    if is_sqlite:
+        ensure_sqlite_directory(url)
+        # Pooled connections are handed to whichever thread checks them out
+        options["connect_args"] = {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000}
+    options.update(overrides)
+
+    engine = create_engine(url, **options)
+    if is_sqlite:
+        configure_sqlite(engine)
+    return engine
+
+
+def configure_sqlite(engine) -> None:
+    """
+    Applies the SQLite pragmas to every new connection and, with SQLITE_BEGIN_MODE=IMMEDIATE,
+    makes transactions take the write lock up front so that lock upgrades never fail mid-transaction.
+    """
+    begin_immediate = SQLITE_BEGIN_MODE.upper() == "IMMEDIATE"
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        if begin_immediate:
+            # Let SQLAlchemy emit BEGIN itself instead of the driver's implicit deferred BEGIN
+            dbapi_connection.isolation_level = None
+        if not SQLITE_PRAGMAS:
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+        cursor.close()
+
+    if begin_immediate:
+        @event.listens_for(engine, "begin")
+        def begin_immediate_transaction(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
@@ -0,0 +1,42 @@
+import uuid
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from datetime import datetime
+from models import Base
+
+
+class GoalOutbox(Base):
+    """
+    Outbox entry asking for a pending goal to be created in the secondary API.
+    It is written in the same transaction as its PendingGoal and deleted once the goal
+    is attached to the user, or given up on. `idempotency_key` is sent with every attempt,
+    so that a replay after a crash does not create the goal twice.
+    """
+    __tablename__ = "goal_outbox"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    pending_goal_id = Column(Integer, ForeignKey("pending_goal.id", ondelete="CASCADE"), nullable=False, unique=True)
+    idempotency_key = Column(String(36), nullable=False, unique=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+    claimed_until = Column(DateTime, nullable=True)  # Lease of the worker delivering the entry
+    last_error = Column(String(255), nullable=True)
+
+    def __init__(self, pending_goal_id: int, idempotency_key: Optional[str] = None,
+                 next_attempt_at: Optional[datetime] = None, **kwargs):
+        """
+        Initializes the outbox entry of a pending goal.
+
+        :param pending_goal_id: The ID of the PendingGoal to create upstream
+        :param idempotency_key: The key of a creation already attempted, a new one by default
+        :param next_attempt_at: When the first delivery is due, immediately by default
+        """
+        super().__init__(**kwargs)
+        self.pending_goal_id = pending_goal_id
+        self.idempotency_key = idempotency_key or str(uuid.uuid4())
+        self.attempts = 0
+        self.next_attempt_at = next_attempt_at or datetime.now()
+
+    def __repr__(self):
+        return f"GoalOutbox(id={self.id}, pending_goal_id={self.pending_goal_id}, attempts={self.attempts})"
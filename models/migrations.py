@@ -0,0 +1,196 @@
+"""
+Data migrations for databases created by earlier versions of the application.
+Each migration is idempotent and runs after the tables are created, on the first use of
+the engine or from `flask --app app init-db`; they can also be applied by hand with:
+    python -m models.migrations
+"""
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, inspect, select, text
+
+import password_hashing
+from logger import logger
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_info import UserInfo, rebuild_aggregates
+
+PASSWORD_MIGRATION_BATCH = 500
+
+
+def migrate_goal_ids_to_user_goal(engine) -> int:
+    """
+    Moves the legacy `user_info.goal_ids` JSON lists into the `user_goal` table,
+    then drops the column (or empties it when the database cannot drop columns).
+    Returns the number of migrated links.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("user_info")}
+    if "goal_ids" not in columns:
+        return 0
+
+    migrated = 0
+    with engine.begin() as connection:
+        rows = connection.execute(
+            text("SELECT id, goal_ids, created_at FROM user_info WHERE goal_ids IS NOT NULL")
+        ).fetchall()
+        if not rows:
+            return 0
+        for user_id, goal_ids, created_at in rows:
+            goal_ids = json.loads(goal_ids) if isinstance(goal_ids, str) else goal_ids
+            # Links are read back ordered by created_at, so each one is stamped a microsecond
+            # after the previous to keep the order of the legacy list
+            linked_at = _parse_datetime(created_at)
+            links = [
+                {"user_id": user_id, "goal_id": int(goal_id), "created_at": linked_at + timedelta(microseconds=index)}
+                for index, goal_id in enumerate(dict.fromkeys(goal_ids or []))
+            ]
+            if links:
+                connection.execute(
+                    text("INSERT OR IGNORE INTO user_goal (user_id, goal_id, created_at) "
+                         "VALUES (:user_id, :goal_id, :created_at)")
+                    if engine.dialect.name == "sqlite" else
+                    text("INSERT INTO user_goal (user_id, goal_id, created_at) "
+                         "VALUES (:user_id, :goal_id, :created_at) ON CONFLICT DO NOTHING"),
+                    links,
+                )
+                migrated += len(links)
+
+    with engine.begin() as connection:
+        try:
+            connection.execute(text("ALTER TABLE user_info DROP COLUMN goal_ids"))
+        except Exception as e:
+            logger.warning("Could not drop user_info.goal_ids, clearing it instead: %s", e)
+            connection.execute(text("UPDATE user_info SET goal_ids = NULL"))
+
+    logger.info("Migrated %s goal links from user_info.goal_ids to user_goal", migrated)
+    return migrated
+
+
+def add_user_info_version(engine) -> bool:
+    """
+    Adds the `user_info.version` column to databases created before it existed.
+    Returns whether the column was added.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("user_info")}
+    if "version" in columns:
+        return False
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE user_info ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    logger.info("Added user_info.version")
+    return True
+
+
+def add_user_info_aggregates(engine) -> bool:
+    """
+    Adds the savings aggregate columns of `user_info` to databases created before they existed,
+    and computes them from the goal projections. Returns whether the columns were added.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("user_info")}
+    missing = [
+        (name, definition) for name, definition in (
+            ("goal_count", "INTEGER NOT NULL DEFAULT 0"),
+            ("total_savings", "FLOAT NOT NULL DEFAULT 0"),
+            ("total_goal_value", "FLOAT NOT NULL DEFAULT 0"),
+            ("savings_ratio", "FLOAT"),
+            ("months_to_goals", "FLOAT"),
+        ) if name not in columns
+    ]
+    if not missing:
+        return False
+    with engine.begin() as connection:
+        for name, definition in missing:
+            connection.execute(text(f"ALTER TABLE user_info ADD COLUMN {name} {definition}"))
+        connection.execute(rebuild_aggregates())
+    logger.info("Added the user_info savings aggregates")
+    return True
+
+
+def add_user_info_listing_indexes(engine) -> int:
+    """
+    Creates the indexes of the user listing filters on databases created before they existed.
+    Returns the number of created indexes.
+    """
+    existing = {index["name"] for index in inspect(engine).get_indexes("user_info")}
+    missing = [index for index in UserInfo.__table__.indexes if index.name not in existing]
+    for index in missing:
+        index.create(engine)
+    if missing:
+        logger.info("Created the user_info indexes %s", ", ".join(index.name for index in missing))
+    return len(missing)
+
+
+def rebuild_stale_aggregates(engine) -> int:
+    """
+    Recomputes the savings aggregates of the users whose goal count disagrees with their goal
+    projections, such as projections written by an instance of an earlier version during a
+    rolling deploy. Returns the number of rebuilt users.
+
+    It scans every user, so it is left out of `run_migrations` and only runs from
+    `flask --app app init-db` and `python -m models.migrations`.
+    """
+    users = UserInfo.__table__
+    projections = SavingGoalProjection.__table__
+    projected = select(func.count()).where(projections.c.user_id == users.c.id).scalar_subquery()
+    with engine.begin() as connection:
+        stale = connection.execute(select(users.c.id).where(users.c.goal_count != projected)).scalars().all()
+        for user_id in stale:
+            connection.execute(rebuild_aggregates(user_id))
+    if stale:
+        logger.info("Rebuilt the stale savings aggregates of %s users", len(stale))
+    return len(stale)
+
+
+def hash_plaintext_passwords(engine) -> int:
+    """
+    Replaces the legacy plaintext passwords still stored in `user_info` by their scrypt hash,
+    so that accounts nobody logs in to do not keep them. Returns the number of hashed passwords.
+    """
+    hashed = 0
+    select_plaintext = text(
+        "SELECT id, password FROM user_info WHERE password NOT LIKE :prefix ORDER BY id LIMIT :limit"
+    )
+    # Only rows still holding the value that was read are updated, in case the user logged in meanwhile
+    update_password = text("UPDATE user_info SET password = :hashed WHERE id = :id AND password = :password")
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(select_plaintext, {
+                "prefix": f"{password_hashing.SCRYPT_PREFIX}$%", "limit": PASSWORD_MIGRATION_BATCH,
+            }).fetchall()
+            if not rows:
+                break
+            connection.execute(update_password, [
+                {"id": user_id, "password": password, "hashed": password_hashing.hash_password(password)}
+                for user_id, password in rows
+            ])
+        hashed += len(rows)
+    if hashed:
+        logger.info("Hashed %s plaintext passwords", hashed)
+    return hashed
+
+
+def _parse_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return datetime.now()
+
+
+def run_migrations(engine) -> None:
+    """
+    Applies every data migration, in order.
+    """
+    migrate_goal_ids_to_user_goal(engine)
+    add_user_info_version(engine)
+    add_user_info_aggregates(engine)
+    add_user_info_listing_indexes(engine)
+    hash_plaintext_passwords(engine)
+
+
+if __name__ == "__main__":
+    from logger import configure_logging
+    from models import get_engine, init_db
+
+    configure_logging()
+    init_db()
+    rebuild_stale_aggregates(get_engine())
@@ -0,0 +1,70 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from datetime import datetime
+from models import Base
+
+PENDING = "pending"
+CREATED = "created"
+FAILED = "failed"
+
+
+class PendingGoal(Base):
+    """
+    Saving goal accepted by the API for asynchronous creation.
+    The row keeps the requested data and tracks the creation in the secondary API, from
+    `pending` to `created` (with the goal ID) or `failed`; clients poll it through its status URL.
+    """
+    __tablename__ = "pending_goal"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("user_info.id", ondelete="CASCADE"), nullable=False, index=True)
+    status = Column(String(16), nullable=False, default=PENDING)
+    goal_name = Column(String(255), nullable=False)
+    goal_currency = Column(String(3), nullable=False)
+    goal_value = Column(Float, nullable=False)
+    monthly_savings = Column(Float, nullable=False)
+    goal_id = Column(Integer, nullable=True)  # Goal ID in the secondary API, once created
+    error = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    updated_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    def __init__(self, user_id: int, goal_data: dict, **kwargs):
+        """
+        Initializes a pending goal for the user `user_id`.
+
+        :param user_id: The ID of the user the goal is created for
+        :param goal_data: The goal fields, as sent to the secondary API
+        """
+        super().__init__(**kwargs)
+        self.user_id = user_id
+        self.status = PENDING
+        self.goal_name = goal_data["goal_name"]
+        self.goal_currency = goal_data["goal_currency"]
+        self.goal_value = goal_data["goal_value"]
+        self.monthly_savings = goal_data["monthly_savings"]
+
+    def goal_data(self) -> dict:
+        """
+        Returns the goal fields in the form posted to the secondary API.
+        """
+        return {
+            "goal_name": self.goal_name,
+            "goal_currency": self.goal_currency,
+            "goal_value": self.goal_value,
+            "monthly_savings": self.monthly_savings,
+        }
+
+    def to_dict(self):
+        """
+        Returns the creation status of the goal.
+        """
+        return {
+            "id": self.id,
+            "status": self.status,
+            "goal_id": self.goal_id,
+            "error": self.error,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "updated_at": self.updated_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def __repr__(self):
+        return f"PendingGoal(id={self.id}, user_id={self.user_id}, status='{self.status}', goal_id={self.goal_id})"
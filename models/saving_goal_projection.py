@@ -0,0 +1,84 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from models import Base
+
+
+class SavingGoalProjection(Base):
+    """
+    Local copy of a saving goal owned by the secondary API.
+    Rows are written after every successful upstream mutation, so profile reads
+    can be served from the local database without calling the secondary API.
+    """
+    __tablename__ = "saving_goal_projection"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # Goal ID in the secondary API
+    user_id = Column(Integer, ForeignKey("user_info.id", ondelete="CASCADE"), nullable=False, index=True)
+    goal_name = Column(String(255), nullable=False)
+    goal_currency = Column(String(3), nullable=False)
+    goal_value = Column(Float, nullable=False)
+    monthly_savings = Column(Float, nullable=False)
+    converted_value = Column(Float, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    refreshed_at = Column(DateTime, default=datetime.now, nullable=False, index=True)
+
+    def __init__(self, id: int, user_id: int, **kwargs):
+        """
+        Initializes a projection row for the goal `id` owned by the user `user_id`.
+
+        :param id: The goal ID in the secondary API
+        :param user_id: The ID of the user owning the goal
+        """
+        super().__init__(**kwargs)
+        self.id = id
+        self.user_id = user_id
+
+    def update_from(self, goal_data: dict) -> bool:
+        """
+        Copies the fields of a goal returned by the secondary API into this row.
+        Returns whether any field visible to clients changed.
+        """
+        before = self.to_dict() if self.created_at else None
+        self.goal_name = goal_data["goal_name"]
+        self.goal_currency = goal_data["goal_currency"]
+        self.goal_value = goal_data["goal_value"]
+        self.monthly_savings = goal_data["monthly_savings"]
+        self.converted_value = goal_data["converted_value"]
+        self.created_at = parse_datetime(goal_data.get("created_at"))
+        self.refreshed_at = datetime.now()
+        return before != self.to_dict()
+
+    def to_dict(self):
+        """
+        Returns the goal in the same shape as the secondary API.
+        """
+        return {
+            "id": self.id,
+            "goal_name": self.goal_name,
+            "goal_currency": self.goal_currency,
+            "goal_value": self.goal_value,
+            "monthly_savings": self.monthly_savings,
+            "converted_value": self.converted_value,
+            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def __repr__(self):
+        return f"SavingGoalProjection(id={self.id}, user_id={self.user_id}, goal_name='{self.goal_name}')"
+
+
+def parse_datetime(value) -> datetime:
+    """
+    Parses the `created_at` value sent by the secondary API.
+    """
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+        try:
+            return parsedate_to_datetime(value).replace(tzinfo=None)  # Flask's default datetime format
+        except (TypeError, ValueError):
+            pass
+    return datetime.now()
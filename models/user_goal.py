@@ -0,0 +1,30 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey
+from datetime import datetime
+from models import Base
+
+
+class UserGoal(Base):
+    """
+    Association between a user and a saving goal stored in the secondary API.
+    The composite primary key makes membership checks, appends and removals
+    single indexed statements.
+    """
+    __tablename__ = "user_goal"
+
+    user_id = Column(Integer, ForeignKey("user_info.id", ondelete="CASCADE"), primary_key=True)
+    goal_id = Column(Integer, primary_key=True)  # Goal ID in the secondary API
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+
+    def __init__(self, user_id: int, goal_id: int, **kwargs):
+        """
+        Links the goal `goal_id` to the user `user_id`.
+
+        :param user_id: The ID of the user owning the goal
+        :param goal_id: The goal ID in the secondary API
+        """
+        super().__init__(**kwargs)
+        self.user_id = user_id
+        self.goal_id = goal_id
+
+    def __repr__(self):
+        return f"UserGoal(user_id={self.user_id}, goal_id={self.goal_id})"
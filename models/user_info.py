@@ -1,7 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, JSON
+from typing import Optional
+
+from sqlalchemy import Column, Integer, String, DateTime, Float, Index, case, func, select
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from models import Base
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_goal import UserGoal
 
 
 class UserInfo(Base):
@@ -10,20 +14,33 @@ class UserInfo(Base):
     and an optional list of associated saving goals (IDs).
     """
     __tablename__ = "user_info"
+    # Serve the salary and creation date filters of the user listing, in its ID order
+    __table_args__ = (
+        Index("ix_user_info_salary_id", "salary", "id"),
+        Index("ix_user_info_created_at_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     username = Column(String(100), nullable=False, unique=True)
     password = Column(String(255), nullable=False)
     salary = Column(Float, nullable=False)
     created_at = Column(DateTime, default=datetime.now)
-    goal_ids = Column(JSON, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")  # Bumped on every change, used for ETags
+    # Savings aggregates over the user's projected goals, kept up to date by GoalProjectionService
+    goal_count = Column(Integer, nullable=False, default=0, server_default="0")
+    total_savings = Column(Float, nullable=False, default=0.0, server_default="0")  # Sum of monthly_savings
+    total_goal_value = Column(Float, nullable=False, default=0.0, server_default="0")  # Sum of converted_value
+    savings_ratio = Column(Float, nullable=True)  # total_savings / salary, None without a salary
+    months_to_goals = Column(Float, nullable=True)  # total_goal_value / total_savings, None without savings
+    goals = relationship(UserGoal, order_by=(UserGoal.created_at, UserGoal.goal_id),
+                         cascade="all, delete-orphan", passive_deletes=True)
 
     def __init__(self, username: str, password: str, salary: float, goal_ids: list = None, **kwargs):
         """
         Initializes a new user login with the provided parameters.
 
         :param username: The username for the login
-        :param password: The password for the login (should be hashed)
+        :param password: The scrypt hash of the user's password
         :param salary: The user's salary
         :param goal_ids: A list of goal IDs associated with the user (optional)
         """
@@ -31,19 +48,70 @@ class UserInfo(Base):
         self.username = username
         self.password = password
         self.salary = salary
-        self.goal_ids = goal_ids or []
+        self.goals = [UserGoal(user_id=self.id, goal_id=goal_id) for goal_id in goal_ids or []]
+
+    @property
+    def goal_ids(self) -> list:
+        """
+        Returns the IDs of the user's goals, in the order they were added.
+        """
+        return [user_goal.goal_id for user_goal in self.goals]
 
     def to_dict(self):
         """
         Returns a dictionary representation of the UserLogin object.
         """
+        return UserInfo.row_to_dict(self, self.goal_ids)
+
+    @staticmethod
+    def row_to_dict(row, goal_ids: list) -> dict:
+        """
+        Same representation as `to_dict`, built from any row with the user's columns,
+        such as one returned by an `UPDATE ... RETURNING` statement.
+        """
         return {
-            "id": self.id,
-            "username": self.username,
-            "salary": self.salary,
-            "goal_ids": self.goal_ids,  # Lista de IDs de goals
-            "created_at": self.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            "id": row.id,
+            "username": row.username,
+            "salary": float(row.salary),  # SQLite's RETURNING skips the REAL affinity, 1234.0 comes back as 1234
+            "goal_ids": goal_ids,  # Lista de IDs de goals
+            "created_at": row.created_at.strftime("%Y-%m-%d %H:%M:%S"),
         }
 
     def __repr__(self):
         return f"UserInfo(id={self.id}, username='{self.username}', salary={self.salary}, goal_ids={self.goal_ids})"
+
+
+def savings_ratio(total_savings, salary):
+    """
+    SQL expression of `savings_ratio` from the given total savings and salary expressions.
+    """
+    return case((salary > 0, total_savings / salary), else_=None)
+
+
+def months_to_goals(total_goal_value, total_savings):
+    """
+    SQL expression of `months_to_goals` from the given total goal value and total savings expressions.
+    """
+    return case((total_savings > 0, total_goal_value / total_savings), else_=None)
+
+
+def rebuild_aggregates(user_id: Optional[int] = None):
+    """
+    Returns an UPDATE recomputing the savings aggregates of one user, or of every user,
+    from their goal projections.
+    """
+    users = UserInfo.__table__
+    projections = SavingGoalProjection.__table__
+    owned = projections.c.user_id == users.c.id
+    goal_count = select(func.count()).where(owned).scalar_subquery()
+    total_savings = select(func.coalesce(func.sum(projections.c.monthly_savings), 0.0)).where(owned).scalar_subquery()
+    total_goal_value = (select(func.coalesce(func.sum(projections.c.converted_value), 0.0))
+                        .where(owned).scalar_subquery())
+    statement = users.update().values(
+        goal_count=goal_count,
+        total_savings=total_savings,
+        total_goal_value=total_goal_value,
+        savings_ratio=savings_ratio(total_savings, users.c.salary),
+        months_to_goals=months_to_goals(total_goal_value, total_savings),
+    )
+    return statement if user_id is None else statement.where(users.c.id == user_id)
@@ -0,0 +1,72 @@
+"""
+Password hashing with scrypt.
+This module only depends on the standard library, so the process pool that runs it
+starts quickly and never imports the web application.
+"""
+import base64
+import hashlib
+import hmac
+import os
+
+SCRYPT_PREFIX = "scrypt"
+SCRYPT_N = int(os.environ.get("AUTH_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("AUTH_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("AUTH_SCRYPT_P", "1"))
+SCRYPT_KEY_LENGTH = 32
+SALT_LENGTH = 16
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=2 * 128 * n * r + 1024 * 1024, dklen=SCRYPT_KEY_LENGTH)
+
+
+def hash_password(password: str) -> str:
+    """
+    Returns the encoded scrypt hash of `password`: scrypt$n$r$p$salt$key.
+    """
+    salt = os.urandom(SALT_LENGTH)
+    key = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"{SCRYPT_PREFIX}${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64encode(salt)}${_b64encode(key)}"
+
+
+def is_hashed(stored: str) -> bool:
+    """
+    Checks whether a stored password is a hash, as opposed to a legacy plaintext value.
+    """
+    return stored.startswith(f"{SCRYPT_PREFIX}$")
+
+
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Checks `password` against a stored hash, or against a legacy plaintext value.
+    """
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _, n, r, p, salt, key = stored.split("$")
+        expected = _b64decode(key)
+        return hmac.compare_digest(_scrypt(password, _b64decode(salt), int(n), int(r), int(p)), expected)
+    except ValueError:
+        return False
+
+
+def needs_rehash(stored: str) -> bool:
+    """
+    Checks whether a stored password should be rehashed with the current parameters.
+    """
+    if not is_hashed(stored):
+        return True
+    try:
+        _, n, r, p, _, _ = stored.split("$")
+    except ValueError:
+        return True
+    return (int(n), int(r), int(p)) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
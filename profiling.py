@@ -0,0 +1,203 @@
+"""
+Opt-in cProfile profiling of single requests.
+
+A request is profiled when it carries the `X-Profile-Token` header matching PROFILE_SECRET,
+or when PROFILE_SAMPLE_RATE fires. Each profile is written to PROFILE_DIR, grouped in one
+directory per route template, and only the newest PROFILE_MAX_FILES profiles are kept.
+Requests that are not picked only pay for one header lookup and, when sampling is on,
+one random draw.
+
+Only the thread serving the request is profiled. Secondary API calls fanned out by
+`run_bounded` run on executor threads, so a profile shows them as time spent waiting on their
+futures, not as the calls themselves; the admin endpoints repeat this in their output.
+
+The admin endpoints below answer only when PROFILE_SECRET is set and the same header is sent:
+
+    GET /admin/profiles                      lists the stored profiles per route
+    GET /admin/profiles/<route>/<name>       one profile, as pstats text or raw (?format=raw)
+    GET /admin/profiles/<route>              every stored profile of a route merged together
+"""
+import cProfile
+import hmac
+import io
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+from flask import Response, abort, g, jsonify, request, send_file
+
+from logger import logger
+
+# Profiling settings, all overridable through the environment
+PROFILE_SECRET = os.environ.get("PROFILE_SECRET", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles/")
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "50"))
+PROFILE_STATS_LIMIT = int(os.environ.get("PROFILE_STATS_LIMIT", "40"))
+
+PROFILE_HEADER = "X-Profile-Token"
+PROFILE_NAME = re.compile(r"^\d+-\d+$")
+SORT_KEYS = {"cumulative", "tottime", "calls", "ncalls", "time"}
+PROFILE_SCOPE = ("Request thread only: calls fanned out by run_bounded run on executor threads "
+                 "and appear as waits on their futures.")
+
+# Only one profiler can be active per process on recent Pythons; concurrent candidates are skipped
+_profiler_lock = threading.Lock()
+
+
+def route_slug(route: str) -> str:
+    """
+    Turns a route template such as `/users/<username>` into a directory name.
+    """
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+def has_valid_token() -> bool:
+    token = request.headers.get(PROFILE_HEADER)
+    return bool(PROFILE_SECRET and token and hmac.compare_digest(token, PROFILE_SECRET))
+
+
+def should_profile() -> bool:
+    if PROFILE_HEADER in request.headers and has_valid_token():
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def before_request():
+    if request.path.startswith("/admin/profiles") or not should_profile():
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        return
+    profiler = cProfile.Profile()
+    g.profiler = profiler
+    g.profile_started_at = time.perf_counter()
+    profiler.enable()
+
+
+def teardown_request(exception=None):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    _profiler_lock.release()
+    try:
+        save_profile(profiler, time.perf_counter() - g.pop("profile_started_at"))
+    except OSError as error:
+        logger.warning("Could not save request profile: %s", error)
+
+
+def save_profile(profiler: cProfile.Profile, duration: float) -> None:
+    """
+    Writes the profile and its metadata under the directory of the current route,
+    then prunes the oldest profiles beyond PROFILE_MAX_FILES.
+    """
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    directory = os.path.join(PROFILE_DIR, route_slug(route))
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns()}-{os.getpid()}"
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.json"), "w") as file:
+        json.dump({
+            "name": name,
+            "route": route,
+            "method": request.method,
+            "path": request.path,
+            "duration_ms": round(duration * 1000, 3),
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }, file)
+    prune_profiles()
+
+
+def stored_profiles():
+    """
+    Returns the paths of every stored profile, oldest first.
+    """
+    paths = []
+    if os.path.isdir(PROFILE_DIR):
+        for slug in os.listdir(PROFILE_DIR):
+            directory = os.path.join(PROFILE_DIR, slug)
+            if os.path.isdir(directory):
+                paths.extend(os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".prof"))
+    return sorted(paths, key=os.path.basename)
+
+
+def prune_profiles() -> None:
+    profiles = stored_profiles()
+    for path in profiles[:max(0, len(profiles) - PROFILE_MAX_FILES)]:
+        for stale in (path, path[:-len(".prof")] + ".json"):
+            try:
+                os.remove(stale)
+            except FileNotFoundError:  # Already pruned by another worker
+                pass
+
+
+def format_stats(paths) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(*paths, stream=stream)
+    sort = request.args.get("sort", "cumulative")
+    stats.sort_stats(sort if sort in SORT_KEYS else "cumulative").print_stats(PROFILE_STATS_LIMIT)
+    return f"{PROFILE_SCOPE}\n{stream.getvalue()}"
+
+
+def require_token():
+    if not has_valid_token():
+        abort(404)
+
+
+def list_profiles_view():
+    """
+    Lists the stored profiles grouped by route, newest first.
+    """
+    require_token()
+    routes = {}
+    for path in reversed(stored_profiles()):
+        try:
+            with open(path[:-len(".prof")] + ".json") as file:
+                meta = json.load(file)
+        except (OSError, ValueError):
+            continue
+        meta["slug"] = os.path.basename(os.path.dirname(path))
+        routes.setdefault(meta["route"], []).append(meta)
+    return jsonify({"max_files": PROFILE_MAX_FILES, "scope": PROFILE_SCOPE, "routes": routes})
+
+
+def route_profiles_view(slug: str):
+    """
+    Merges every stored profile of one route into a single pstats report.
+    """
+    require_token()
+    directory = os.path.join(PROFILE_DIR, route_slug(slug))
+    paths = [path for path in stored_profiles() if os.path.dirname(path) == directory.rstrip("/")]
+    if not paths:
+        abort(404)
+    return Response(format_stats(paths), mimetype="text/plain")
+
+
+def profile_view(slug: str, name: str):
+    """
+    Returns one profile as pstats text, or the raw cProfile dump with `?format=raw`.
+    """
+    require_token()
+    path = os.path.join(PROFILE_DIR, route_slug(slug), f"{name}.prof")
+    if not PROFILE_NAME.match(name) or not os.path.isfile(path):
+        abort(404)
+    if request.args.get("format") == "raw":
+        return send_file(os.path.abspath(path), mimetype="application/octet-stream", as_attachment=True)
+    return Response(format_stats([path]), mimetype="text/plain")
+
+
+def init_app(app) -> None:
+    """
+    Adds the profiling hooks and the admin endpoints to the app.
+    """
+    if not PROFILE_SECRET and PROFILE_SAMPLE_RATE <= 0:
+        return
+    app.before_request(before_request)
+    app.teardown_request(teardown_request)
+    app.add_url_rule("/admin/profiles", "profiles", list_profiles_view)
+    app.add_url_rule("/admin/profiles/<slug>", "route_profiles", route_profiles_view)
+    app.add_url_rule("/admin/profiles/<slug>/<name>", "profile", profile_view)
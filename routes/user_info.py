@@ -1,13 +1,26 @@
+from flask import Response, request, stream_with_context
 from flask_openapi3 import Tag, APIBlueprint
 from schemas import ErrorSchema
 from schemas.user_info import UserInfoViewSchema, UserInfoSchema, UserInfoSearchSchema, \
     UserInfoUpdateUsernameSchema, UserInfoUpdateSalarySchema, SavingGoalSchema, SavingGoalViewSchema, \
-    UserInfoGoalSearchSchema, UserInfoSavingGoalSchema
+    UserInfoGoalSearchSchema, UserInfoSavingGoalSchema, UserInfoLoginSchema, LoginTokenSchema, \
+    UserInfoBulkImportQuerySchema, UserInfoBulkImportResultSchema, UserInfoListQuerySchema, UserInfoListSchema, \
+    PendingGoalSearchSchema, PendingGoalViewSchema, GoalBatchSchema, GoalBatchViewSchema, UserSummaryViewSchema
+from serialization import iter_json_lines
+from services.auth import AuthService
+from services.goal_batch import GoalBatchService
+from services.goal_outbox import GOAL_CREATE_ASYNC
+from services.user_import import UserImportService, parse_csv, parse_ndjson
 from services.user_info import UserInfoService
+from services.user_listing import UserListingService, decode_cursor, has_admin_token
+from services.user_summary import UserSummaryService
 
 users_tag = Tag(name="Users", description="Creation, retrieval, and management of users information in the database")
 users = APIBlueprint("users", __name__, url_prefix="/users", abp_tags=[users_tag])
 
+# Routes changing a user's data take a token from POST /users/login (see services.auth)
+bearer_auth = [{"bearer": []}]
+
 
 @users.post('', tags=[users_tag], responses={
     "200": UserInfoViewSchema,
@@ -21,21 +34,86 @@ def post_user_information(form:  UserInfoSchema):
     return UserInfoService.post_user_information(form)
 
 
+@users.get('', tags=[users_tag], responses={
+    "200": UserInfoListSchema,
+    "403": ErrorSchema,
+    "400": ErrorSchema})
+def get_users(query: UserInfoListQuerySchema):
+    """
+    Lists users ordered by ID, one page at a time, optionally filtered by salary and creation date.
+    Pass the returned `next_cursor` to get the following page. With `stream=true`, every
+    matching user is streamed as NDJSON instead. Needs the `X-Admin-Token` header set to USER_LIST_SECRET.
+    """
+    if not has_admin_token():
+        return {"message": "Listing users requires a valid X-Admin-Token header."}, 403
+    if not query.stream:
+        return UserListingService.list_users(query)
+    try:
+        decode_cursor(query.cursor)
+    except ValueError as e:
+        return {"message": str(e)}, 400
+    lines = iter_json_lines(UserListingService.stream_users(query))
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+
+@users.post('/bulk', tags=[users_tag], responses={
+    "200": UserInfoBulkImportResultSchema})
+def post_users_bulk(query: UserInfoBulkImportQuerySchema):
+    """
+    Creates many users from a streamed NDJSON body, or a CSV body sent as `text/csv`.
+    Users are inserted in batches and the result of each batch is streamed back as NDJSON,
+    including the rows rejected because their username already exists.
+    """
+    parse = parse_csv if request.mimetype == "text/csv" else parse_ndjson
+    results = UserImportService.import_users(parse(request.stream), query.batch_size)
+    lines = iter_json_lines(results)
+    return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+
+@users.post('/login', tags=[users_tag], responses={
+    "200": LoginTokenSchema,
+    "401": ErrorSchema,
+    "400": ErrorSchema})
+def login(form: UserInfoLoginSchema):
+    """
+    Checks the user's credentials.
+    Returns a signed session token or an error message if they are invalid.
+    """
+    return AuthService.login(form)
+
+
 @users.get('<username>', tags=[users_tag], responses= {
     "200": UserInfoSavingGoalSchema,
+    "304": None,
     "409": ErrorSchema,
     "400": ErrorSchema})
 def get_user_information(path: UserInfoSearchSchema):
     """
     Return the information about the given user.
     Information that contains username, salary and total goals savings.
+    Send the returned ETag in `If-None-Match` to get a 304 when nothing changed.
     """
-    return UserInfoService.get_user_information(path.username)
+    return UserInfoService.get_user_information(path.username, request.headers.get("If-None-Match"))
 
 
-@users.delete('<username>', tags=[users_tag], responses={
+@users.get('<username>/summary', tags=[users_tag], responses={
+    "200": UserSummaryViewSchema,
+    "404": ErrorSchema,
+    "400": ErrorSchema})
+def get_user_summary(path: UserInfoSearchSchema):
+    """
+    Returns the savings aggregates of the given user: goal count, total monthly savings,
+    savings-to-salary ratio and months to reach every goal. Never calls the secondary API.
+    """
+    return UserSummaryService.get_user_summary(path.username)
+
+
+@users.delete('<username>', tags=[users_tag], security=bearer_auth, responses={
     "200": {"description": "Successfully deleted the user"},
+    "404": ErrorSchema,
     "409": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def delete_user_information(path: UserInfoSearchSchema):
     """
@@ -44,9 +122,12 @@ def delete_user_information(path: UserInfoSearchSchema):
     return UserInfoService.delete_user_information(path.username)
 
 
-@users.put('<username>/username', tags=[users_tag], responses= {
+@users.put('<username>/username', tags=[users_tag], security=bearer_auth, responses= {
     "200": UserInfoViewSchema,
+    "404": ErrorSchema,
     "409": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def put_user_username(path: UserInfoSearchSchema, form: UserInfoUpdateUsernameSchema):
     """
@@ -56,9 +137,12 @@ def put_user_username(path: UserInfoSearchSchema, form: UserInfoUpdateUsernameSc
     return UserInfoService.put_user_username(path.username, form)
 
 
-@users.put('<username>/salary', tags=[users_tag], responses= {
+@users.put('<username>/salary', tags=[users_tag], security=bearer_auth, responses= {
     "200": UserInfoViewSchema,
+    "404": ErrorSchema,
     "409": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def put_user_salary(path: UserInfoSearchSchema, form: UserInfoUpdateSalarySchema):
     """
@@ -68,44 +152,84 @@ def put_user_salary(path: UserInfoSearchSchema, form: UserInfoUpdateSalarySchema
     return UserInfoService.put_user_salary(path.username, form)
 
 
-@users.post('/<username>/goal', tags=[users_tag], responses={
+@users.post('/<username>/goal', tags=[users_tag], security=bearer_auth, responses={
     "200": UserInfoViewSchema,
+    "202": PendingGoalViewSchema,
     "409": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def post_goal_for_user(path: UserInfoSearchSchema, form: SavingGoalSchema):
     """
     Creates a specific saving goal for a user.
-    This creates the goal data in the secondary API.
+    This creates the goal data in the secondary API. With `Prefer: respond-async`, or when
+    GOAL_CREATE_ASYNC is set, the goal is queued instead and a 202 with its status URL is returned.
     """
+    if GOAL_CREATE_ASYNC or "respond-async" in request.headers.get("Prefer", ""):
+        return UserInfoService.post_goal_for_user_async(path.username, form)
     return UserInfoService.post_goal_for_user(path.username, form)
 
 
+@users.post('/<username>/goals:batch', tags=[users_tag], security=bearer_auth, responses={
+    "200": GoalBatchViewSchema,
+    "404": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
+    "400": ErrorSchema,
+    "500": ErrorSchema})
+def post_goals_batch(path: UserInfoSearchSchema, body: GoalBatchSchema):
+    """
+    Creates, updates and deletes many saving goals of a user in one call.
+    The secondary API calls run concurrently, every local change is committed together,
+    and the result of each operation is returned in order.
+    """
+    return GoalBatchService.apply(path.username, body)
+
+
+@users.get('/<username>/goal-requests/<request_id>', tags=[users_tag], responses={
+    "200": PendingGoalViewSchema,
+    "404": ErrorSchema,
+    "400": ErrorSchema})
+def get_pending_goal_for_user(path: PendingGoalSearchSchema):
+    """
+    Retrieves the status of a goal queued for asynchronous creation.
+    Once `status` is `created`, `goal_url` points to the new goal.
+    """
+    return UserInfoService.get_pending_goal_for_user(path.username, path.request_id)
+
+
 @users.get('/<username>/goal/<goal_id>', tags=[users_tag], responses={
     "200": SavingGoalViewSchema,
+    "304": None,
     "404": ErrorSchema,
     "400": ErrorSchema})
 def get_goal_for_user(path: UserInfoGoalSearchSchema):
     """
     Retrieves a specific saving goal for a user using the secondary API.
+    Send the returned ETag in `If-None-Match` to get a 304 when nothing changed.
     """
-    return UserInfoService.get_goal_for_user(path.username, path.goal_id)
+    return UserInfoService.get_goal_for_user(path.username, path.goal_id, request.headers.get("If-None-Match"))
 
 
-@users.delete('/<username>/goal/<goal_id>', tags=[users_tag], responses={
+@users.delete('/<username>/goal/<goal_id>', tags=[users_tag], security=bearer_auth, responses={
     "200": {"description": "Successfully deleted the goal"},
     "404": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def delete_goal_for_user(path: UserInfoGoalSearchSchema):
     """
     Deletes a specific saving goal for a user.
-    This removes the reference from the user's `goal_ids` and deletes the goal in the secondary API.
+    This removes the link between the user and the goal and deletes the goal in the secondary API.
     """
     return UserInfoService.delete_goal_for_user(path.username, path.goal_id)
 
 
-@users.put('/<username>/goal/<goal_id>', tags=[users_tag], responses={
+@users.put('/<username>/goal/<goal_id>', tags=[users_tag], security=bearer_auth, responses={
     "200": SavingGoalViewSchema,
     "404": ErrorSchema,
+    "401": ErrorSchema,
+    "403": ErrorSchema,
     "400": ErrorSchema})
 def put_goal_for_user(path: UserInfoGoalSearchSchema, form: SavingGoalSchema):
     """
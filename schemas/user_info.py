@@ -1,8 +1,9 @@
 import enum
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
-from pydantic import BaseModel, field_validator
+from pydantic import AfterValidator, BaseModel, TypeAdapter, field_validator
+from typing_extensions import Annotated, TypedDict
 
 
 class CurrencyEnumSchema(str, enum.Enum):
@@ -21,6 +22,73 @@ class UserInfoSchema(BaseModel):
     password: str= "password123"  # The users password
 
 
+class UserInfoLoginSchema(BaseModel):
+    """
+    Defines the credentials sent to log in.
+    """
+    username: str = "ChocolateCookie"
+    password: str = "password123"
+
+
+class LoginTokenSchema(BaseModel):
+    """
+    Defines how a session token is returned after a successful login.
+    """
+    access_token: str
+    token_type: str = "Bearer"
+    expires_in: int
+
+
+class UserInfoBulkImportQuerySchema(BaseModel):
+    """
+    Defines the options of a bulk user import.
+    """
+    batch_size: int = 500  # Users inserted per transaction
+
+
+class UserInfoBulkImportResultSchema(BaseModel):
+    """
+    Defines one line of the NDJSON stream returned by a bulk user import.
+    Batch lines carry `batch`, `inserted`, `conflicts` and `errors`; the last line carries `summary`.
+    """
+    batch: Optional[int] = None
+    inserted: Optional[int] = None
+    conflicts: Optional[List[dict]] = None
+    errors: Optional[List[dict]] = None
+    summary: Optional[dict] = None
+
+
+class UserInfoListQuerySchema(BaseModel):
+    """
+    Defines the filters and the page requested when listing users.
+    """
+    limit: int = 50  # Users per page, at most 500
+    cursor: Optional[str] = None  # `next_cursor` of the previous page
+    min_salary: Optional[float] = None
+    max_salary: Optional[float] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    stream: bool = False  # Stream every matching user as NDJSON instead of returning one page
+
+
+class UserInfoListItemSchema(BaseModel):
+    """
+    Defines how a user is returned in a listing.
+    """
+    id: int
+    username: str
+    salary: float
+    created_at: str
+
+
+class UserInfoListSchema(BaseModel):
+    """
+    Defines how a page of users is returned.
+    """
+    users: List[UserInfoListItemSchema]
+    next_cursor: Optional[str] = None  # Absent on the last page
+
+
 class UserInfoSearchSchema(BaseModel):
     username: str
 
@@ -30,6 +98,26 @@ class UserInfoGoalSearchSchema(BaseModel):
     goal_id: int
 
 
+class PendingGoalSearchSchema(BaseModel):
+    username: str
+    request_id: int
+
+
+class PendingGoalViewSchema(BaseModel):
+    """
+    Defines how the status of an asynchronous goal creation is returned.
+    `status` is pending, created or failed; `goal_id` and `goal_url` are set once the goal is created.
+    """
+    id: int
+    status: str
+    goal_id: Optional[int] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    status_url: str
+    goal_url: Optional[str] = None
+
+
 class UserInfoUpdateUsernameSchema(BaseModel):
     new_username: str
 
@@ -51,7 +139,6 @@ class UserInfoViewSchema(BaseModel):
     Defines how a saving goal will be returned with full data.
     """
     username: str
-    password: str
     goal_ids: List[str]
     salary: int
     created_at: datetime
@@ -102,14 +189,108 @@ class SavingGoalViewSchema(BaseModel):
         return v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v
 
 
+class GoalBatchOperationEnum(str, enum.Enum):
+    CREATE = "create"
+    UPDATE = "update"
+    DELETE = "delete"
+
+
+class GoalBatchOperationSchema(BaseModel):
+    """
+    Defines one operation of a goal batch: `create` needs `goal`, `update` needs
+    `goal_id` and `goal`, and `delete` needs `goal_id`.
+    """
+    op: GoalBatchOperationEnum
+    goal_id: Optional[int] = None
+    goal: Optional[SavingGoalSchema] = None
+
+
+class GoalBatchSchema(BaseModel):
+    """
+    Defines a list of goal operations applied to one user in a single call.
+    """
+    operations: List[GoalBatchOperationSchema]
+
+
+class GoalBatchResultSchema(BaseModel):
+    """
+    Defines the result of one operation of a goal batch, with the status code it would have had on its own.
+    """
+    index: int
+    op: str
+    status: int
+    goal_id: Optional[int] = None
+    goal: Optional[SavingGoalViewSchema] = None
+    message: Optional[str] = None
+    status_url: Optional[str] = None  # For a creation finished in the background (status 202)
+
+
+class GoalBatchViewSchema(BaseModel):
+    """
+    Defines how a goal batch is returned: one result per operation, in order, and the user's goals afterwards.
+    """
+    results: List[GoalBatchResultSchema]
+    goal_ids: List[int]
+
+
+class UserSummaryViewSchema(BaseModel):
+    """
+    Defines how the savings aggregates of a user are returned.
+    """
+    username: str
+    salary: float
+    goal_count: int
+    total_savings: float  # Sum of the monthly savings of every goal
+    total_goal_value: float  # Sum of the goal values, converted to the salary currency
+    savings_ratio: Optional[float] = None  # Share of the salary saved each month; absent without a salary
+    months_to_goals: Optional[float] = None  # Months to reach every goal at the current savings; absent without savings
+
+
 class UserInfoSavingGoalSchema(BaseModel):
     """
     Defines how a user information and saving goal will be returned with full data.
     TODO improve the comment!
     """
     username: str
-    password: str
     goals: List[SavingGoalViewSchema]
     salary: int
     total_savings: float
     created_at: datetime
+    skipped_goals: Optional[List[int]] = None  # Goals that could not be fetched in time; null when complete
+
+
+def format_datetime(v):
+    """
+    Same conversion as `convert_datetime`, for the typed dicts below.
+    """
+    return v.strftime("%Y-%m-%d %H:%M:%S") if isinstance(v, datetime) else v
+
+
+class SavingGoalViewDict(TypedDict):
+    """
+    Plain-dict twin of SavingGoalViewSchema, validated without building model instances.
+    """
+    id: int
+    goal_name: str
+    goal_currency: str
+    goal_value: float
+    monthly_savings: float
+    converted_value: float
+    created_at: Annotated[datetime, AfterValidator(format_datetime)]
+
+
+class UserInfoSavingGoalDict(TypedDict):
+    """
+    Plain-dict twin of UserInfoSavingGoalSchema. `created_at` stays a datetime, like in
+    `model_dump()`, and is formatted by the JSON provider.
+    """
+    username: str
+    goals: List[SavingGoalViewDict]
+    salary: int
+    total_savings: float
+    created_at: datetime
+    skipped_goals: Optional[List[int]]
+
+
+# Built once at import time; validating a dict through them returns a dict
+user_info_saving_goal_adapter = TypeAdapter(UserInfoSavingGoalDict)
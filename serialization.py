@@ -0,0 +1,110 @@
+"""
+JSON encoding for the API responses.
+
+Uses orjson when it is installed and falls back to the standard library otherwise. The
+output matches Flask's default provider: sorted keys, compact separators, and dates in
+HTTP format. Only the bytes differ, since orjson writes non-ASCII characters as UTF-8
+instead of escaping them, and floats in exponent notation without the `+` and leading
+zeros of the exponent (1e16 instead of 1e+16); they parse to the same values.
+"""
+import json
+from typing import Any, Iterable, Iterator
+
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional speed-up
+    orjson = None
+
+# Payload lists longer than this are streamed in chunks instead of being encoded in one piece
+JSON_STREAM_MIN_ITEMS = 500
+JSON_STREAM_CHUNK_ITEMS = 100
+
+
+# Same fallback as Flask: dates in HTTP format, decimals, UUIDs and dataclasses
+_default = DefaultJSONProvider.default
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps_bytes(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps_bytes(value: Any) -> bytes:
+        return json.dumps(value, default=_default, sort_keys=True, separators=(",", ":")).encode()
+
+
+def dumps(value: Any) -> str:
+    return dumps_bytes(value).decode()
+
+
+def iter_json_lines(items: Iterable[Any]) -> Iterator[bytes]:
+    """
+    Encodes each item as one NDJSON line.
+    """
+    for item in items:
+        yield dumps_bytes(item) + b"\n"
+
+
+def iter_json_object(payload: dict, stream_key: str) -> Iterator[bytes]:
+    """
+    Encodes `payload` piece by piece, with the list under `stream_key` written in chunks
+    of JSON_STREAM_CHUNK_ITEMS items. The output is identical to `dumps_bytes(payload)`.
+    """
+    yield b"{"
+    for position, key in enumerate(sorted(payload)):
+        if position:
+            yield b","
+        yield dumps_bytes(key) + b":"
+        if key != stream_key:
+            yield dumps_bytes(payload[key])
+            continue
+        items = payload[key]
+        yield b"["
+        for start in range(0, len(items), JSON_STREAM_CHUNK_ITEMS):
+            chunk = dumps_bytes(items[start:start + JSON_STREAM_CHUNK_ITEMS])[1:-1]
+            yield (b"," + chunk) if start else chunk
+        yield b"]"
+    yield b"}\n"
+
+
+def large_list_key(payload: Any):
+    """
+    Returns the key of the first list of at least JSON_STREAM_MIN_ITEMS items in a dict payload.
+    """
+    if isinstance(payload, dict):
+        for key, value in payload.items():
+            if isinstance(value, list) and len(value) >= JSON_STREAM_MIN_ITEMS:
+                return key
+    return None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    Flask JSON provider encoding with `dumps_bytes`, used for every dict or list returned by a view.
+    A dict holding a large list is streamed in chunks. Pretty-printed output, as in debug mode,
+    still goes through the standard library.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.get("indent") is not None:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        stream_key = large_list_key(obj)
+        body = iter_json_object(obj, stream_key) if stream_key else dumps_bytes(obj) + b"\n"
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_app(app) -> None:
+    """
+    Makes the app encode its JSON responses with FastJSONProvider.
+    """
+    app.json = FastJSONProvider(app)
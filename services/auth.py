@@ -0,0 +1,207 @@
+import base64
+import hashlib
+import hmac
+import json
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from flask import jsonify, request
+
+import password_hashing
+from logger import logger
+from models import Session
+from models.user_info import UserInfo
+from schemas.user_info import UserInfoLoginSchema
+
+# Authentication settings, all overridable through the environment
+# Hashing processes per web worker; with several web workers, the cores are shared between them
+AUTH_HASH_WORKERS = int(os.environ.get("AUTH_HASH_WORKERS", "1"))
+AUTH_TOKEN_TTL = int(os.environ.get("AUTH_TOKEN_TTL", "3600"))
+# Required: every process serving the API must sign and verify tokens with the same secret
+AUTH_TOKEN_SECRET = os.environ.get("AUTH_TOKEN_SECRET")
+
+# Endpoints that change a user's data, only allowed with a token issued to that user
+AUTHENTICATED_ENDPOINTS = {
+    "users.delete_user_information",
+    "users.put_user_username",
+    "users.put_user_salary",
+    "users.post_goal_for_user",
+    "users.post_goals_batch",
+    "users.put_goal_for_user",
+    "users.delete_goal_for_user",
+}
+
+# Verified against when the username does not exist, so unknown users cost the same time
+_dummy_hash: Optional[str] = None
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def get_hash_executor() -> ProcessPoolExecutor:
+    """
+    Returns the process pool running password hashing for this web worker.
+    The pool uses spawned processes, so it is safe to create from threaded workers,
+    and it is rebuilt when the worker itself was forked from a process owning one.
+    """
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ProcessPoolExecutor(
+                    max_workers=AUTH_HASH_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class AuthService:
+    """
+    Service class for password storage, login and stateless session tokens.
+    """
+
+    @staticmethod
+    def hash_password(password: str) -> str:
+        """
+        Hashes a password on the process pool.
+        """
+        return get_hash_executor().submit(password_hashing.hash_password, password).result()
+
+    @staticmethod
+    def hash_passwords(passwords: List[str]) -> List[str]:
+        """
+        Hashes several passwords on the process pool, spread over all of its workers.
+        """
+        chunksize = max(1, len(passwords) // (AUTH_HASH_WORKERS * 4))
+        return list(get_hash_executor().map(password_hashing.hash_password, passwords, chunksize=chunksize))
+
+    @staticmethod
+    def verify_password(password: str, stored: str) -> bool:
+        """
+        Verifies a password against its stored value on the process pool.
+        """
+        return get_hash_executor().submit(password_hashing.verify_password, password, stored).result()
+
+    @staticmethod
+    def dummy_hash() -> str:
+        """
+        Returns a hash of a random password, checked when the username does not exist.
+        """
+        global _dummy_hash
+        if _dummy_hash is None:
+            _dummy_hash = AuthService.hash_password(secrets.token_hex(8))
+        return _dummy_hash
+
+    @staticmethod
+    def issue_token(user_id: int, username: str, ttl: int = AUTH_TOKEN_TTL) -> str:
+        """
+        Issues a session token: a base64 JSON payload followed by its HMAC-SHA256 signature.
+        """
+        now = int(time.time())
+        payload = {"sub": user_id, "username": username, "iat": now, "exp": now + ttl}
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode())
+        signature = hmac.new(AUTH_TOKEN_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+        return f"{body}.{_b64encode(signature)}"
+
+    @staticmethod
+    def verify_token(token: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the payload of a valid, unexpired token, or None. Needs no database lookup.
+        """
+        try:
+            body, signature = token.split(".")
+            expected = hmac.new(AUTH_TOKEN_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, _b64decode(signature)):
+                return None
+            payload = json.loads(_b64decode(body))
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(payload, dict) or payload.get("exp", 0) < time.time():
+            return None
+        return payload
+
+    @staticmethod
+    def login(credentials: UserInfoLoginSchema):
+        """
+        Checks a username and password and issues a session token.
+        Passwords hashed with other scrypt parameters are rehashed on a successful login.
+        """
+        logger.info("Logging in user: '%s'", credentials.username)
+
+        session = None
+        try:
+            session = Session()
+            user_info = session.query(UserInfo).filter(UserInfo.username == credentials.username).first()
+            stored = user_info.password if user_info else AuthService.dummy_hash()
+
+            if not AuthService.verify_password(credentials.password, stored) or not user_info:
+                error_msg = "Invalid username or password."
+                logger.warning("Failed login for user '%s'", credentials.username)
+                return {"message": error_msg}, 401
+
+            if password_hashing.needs_rehash(user_info.password):
+                user_info.password = AuthService.hash_password(credentials.password)
+                session.commit()
+
+            token = AuthService.issue_token(user_info.id, user_info.username)
+            logger.info("User '%s' logged in successfully", credentials.username)
+            return {"access_token": token, "token_type": "Bearer", "expires_in": AUTH_TOKEN_TTL}, 200
+
+        except Exception as e:
+            error_msg = "Could not log in."
+            logger.warning("Error logging in user '%s': %s", credentials.username, e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
+
+
+def unauthorized(status: int, message: str):
+    response = jsonify({"message": message})
+    response.status_code = status
+    if status == 401:
+        response.headers["WWW-Authenticate"] = 'Bearer realm="users"'
+    return response
+
+
+def before_request():
+    """
+    Requires `Authorization: Bearer <token>` on the endpoints changing a user's data, with a token
+    issued to the user named in the URL. Tokens carry the username they were issued for, so a
+    rename ends them: the user logs in again under the new name.
+    """
+    if request.endpoint not in AUTHENTICATED_ENDPOINTS:
+        return None
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    payload = AuthService.verify_token(token.strip()) if scheme.lower() == "bearer" else None
+    if payload is None:
+        return unauthorized(401, "A valid bearer token is required.")
+    if payload.get("username") != (request.view_args or {}).get("username"):
+        return unauthorized(403, "The token does not belong to this user.")
+    return None
+
+
+def init_app(app) -> None:
+    """
+    Checks the session tokens of the requests changing a user's data. Fails when no token
+    secret is configured, since tokens signed by one process would be rejected by the others.
+    """
+    if not AUTH_TOKEN_SECRET:
+        raise RuntimeError("AUTH_TOKEN_SECRET must be set to the secret shared by every process of the API.")
+    app.before_request(before_request)
@@ -0,0 +1,217 @@
+import os
+import uuid
+from typing import Any, List, NamedTuple, Optional, Set, Tuple
+
+import requests
+
+from logger import logger
+from models import Session
+from schemas.user_info import GoalBatchSchema, GoalBatchOperationSchema, GoalBatchOperationEnum, SavingGoalSchema
+from services.goal_outbox import RETRIABLE_STATUS, GoalOutboxService, goal_outbox_worker
+from services.goal_projection import GoalProjectionService
+from services.resilience import BudgetExhaustedError, CircuitOpenError
+from services.saving_goal import NOT_STARTED, SavingGoalService, run_bounded
+from services.user_goal import UserGoalService
+from services.user_info import UserInfoService
+from services.user_version import UserVersionService
+
+GOALS_BATCH_MAX_OPERATIONS = int(os.environ.get("GOALS_BATCH_MAX_OPERATIONS", "100"))
+GOALS_BATCH_CONCURRENCY = int(os.environ.get("GOALS_BATCH_CONCURRENCY", "4"))
+# Upper bound for starting the fan-out; the request's upstream budget usually ends it first.
+# Calls already started are waited for, each bounded by its HTTP timeouts.
+GOALS_BATCH_DEADLINE = float(os.environ.get("GOALS_BATCH_DEADLINE", "30"))
+
+# Failures raised before a request reaches the secondary API
+NOT_SENT_ERRORS = (CircuitOpenError, BudgetExhaustedError, requests.exceptions.ConnectTimeout)
+
+# An operation sent upstream: (position in the batch, operation, idempotency key of a creation)
+BatchCall = Tuple[int, GoalBatchOperationSchema, Optional[str]]
+
+
+class CallOutcome(NamedTuple):
+    """
+    What one upstream call did. `applied` is True when the secondary API confirmed the operation,
+    with the goal as `value` (None for a deletion); False when the goal is known to be unchanged;
+    None when the call may have been applied without an answer. `value` then holds the error.
+    """
+    applied: Optional[bool]
+    value: Any = None
+
+
+def goal_form(goal: SavingGoalSchema) -> dict:
+    goal_data = goal.model_dump()
+    goal_data['goal_currency'] = goal_data['goal_currency'].value
+    return goal_data
+
+
+def call_upstream(call: BatchCall) -> CallOutcome:
+    """
+    Sends one operation to the secondary API and tells whether it was applied.
+    """
+    _, operation, idempotency_key = call
+    try:
+        if operation.op == GoalBatchOperationEnum.CREATE:
+            return CallOutcome(True, SavingGoalService.create_saving_goal(goal_form(operation.goal), idempotency_key))
+        if operation.op == GoalBatchOperationEnum.UPDATE:
+            return CallOutcome(True, SavingGoalService.update_saving_goal(operation.goal_id, goal_form(operation.goal)))
+        SavingGoalService.remove_saving_goal(operation.goal_id)
+        return CallOutcome(True)
+    except requests.exceptions.HTTPError as e:
+        status = e.response.status_code
+        if operation.op == GoalBatchOperationEnum.DELETE and status == 404:
+            return CallOutcome(True)  # Deleted by an earlier attempt
+        if 400 <= status < 500 and status not in RETRIABLE_STATUS:
+            return CallOutcome(False, f"The secondary API rejected it with status {status}.")
+        return CallOutcome(None, str(e))
+    except NOT_SENT_ERRORS as e:
+        return CallOutcome(False, str(e))
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return CallOutcome(None, str(e))
+
+
+def result(index: int, operation: GoalBatchOperationSchema, status: int, goal_id: Optional[int] = None,
+           goal: Optional[dict] = None, message: Optional[str] = None, status_url: Optional[str] = None) -> dict:
+    entry = {"index": index, "op": operation.op.value, "status": status, "goal_id": goal_id}
+    if goal is not None:
+        entry["goal"] = goal
+    if message is not None:
+        entry["message"] = message
+    if status_url is not None:
+        entry["status_url"] = status_url
+    return entry
+
+
+def check_operation(operation: GoalBatchOperationSchema, username: str, owned: Set[int],
+                    seen: Set[int]) -> Optional[Tuple[int, str]]:
+    """
+    Returns the status and message rejecting an operation before any upstream call, or None if it is valid.
+    """
+    if operation.op != GoalBatchOperationEnum.DELETE and operation.goal is None:
+        return 400, f"Operation '{operation.op.value}' needs a goal."
+    if operation.op == GoalBatchOperationEnum.CREATE:
+        return None
+    if operation.goal_id is None:
+        return 400, f"Operation '{operation.op.value}' needs a goal_id."
+    if operation.goal_id not in owned:
+        return 404, f"Goal ID {operation.goal_id} not found for user {username}."
+    if operation.goal_id in seen:
+        return 409, f"Goal ID {operation.goal_id} appears in more than one operation."
+    seen.add(operation.goal_id)
+    return None
+
+
+class GoalBatchService:
+    """
+    Service class applying many goal operations for one user in a single call.
+    The user is resolved once, the secondary API calls run concurrently with a bounded
+    fan-out and no open transaction, and every local change is committed together.
+    """
+
+    @staticmethod
+    def apply(username: str, batch: GoalBatchSchema):
+        """
+        Applies the operations of `batch` and returns one result per operation, in order.
+        Rejected operations are not sent upstream. Operations the secondary API failed on get a 502,
+        and those not started before the request's upstream budget ran out get a 503; both leave the
+        goal unchanged unless their message says otherwise. A creation the secondary API did not
+        answer is handed to the goal outbox with the same idempotency key and gets a 202.
+        """
+        operations = batch.operations
+        if not operations:
+            return {"message": "The batch has no operations."}, 400
+        if len(operations) > GOALS_BATCH_MAX_OPERATIONS:
+            return {"message": f"A batch holds at most {GOALS_BATCH_MAX_OPERATIONS} operations."}, 400
+        logger.info("Applying %s goal operations for user %s", len(operations), username)
+
+        session = None
+        sent = False
+        try:
+            session = Session()
+            user = UserVersionService.lookup(session, username)
+
+            if not user:
+                error_msg = f"User with username {username} not found."
+                logger.warning(error_msg)
+                return {"message": error_msg}, 404
+
+            user_id = user[0]
+            owned = set(UserGoalService.goal_ids(session, user_id))
+            session.close()  # No transaction stays open during the upstream calls
+
+            results: List[Optional[dict]] = [None] * len(operations)
+            calls: List[BatchCall] = []
+            seen: Set[int] = set()
+            for index, operation in enumerate(operations):
+                rejection = check_operation(operation, username, owned, seen)
+                if rejection:
+                    results[index] = result(index, operation, rejection[0], operation.goal_id, message=rejection[1])
+                else:
+                    key = str(uuid.uuid4()) if operation.op == GoalBatchOperationEnum.CREATE else None
+                    calls.append((index, operation, key))
+
+            sent = True
+            outcomes = run_bounded(call_upstream, calls, GOALS_BATCH_CONCURRENCY, GOALS_BATCH_DEADLINE,
+                                   wait_started=True)
+
+            changed = queued = False
+            for (index, operation, key), outcome in zip(calls, outcomes):
+                op = operation.op.value
+                if outcome is NOT_STARTED:
+                    message = f"Not sent to the secondary API before the deadline; the goal was not {op}d."
+                    results[index] = result(index, operation, 503, operation.goal_id, message=message)
+                elif outcome is None or outcome.applied is False:
+                    message = f"Failed to {op} goal in secondary API."
+                    if outcome is not None:
+                        message = f"{message} {outcome.value}"
+                    results[index] = result(index, operation, 502, operation.goal_id, message=message)
+                elif outcome.applied is None and operation.op == GoalBatchOperationEnum.CREATE:
+                    # The goal may exist upstream: the outbox replays the creation with the same key,
+                    # which returns that goal instead of a duplicate, and links it to the user
+                    pending_goal = GoalOutboxService.enqueue(
+                        session, user_id, goal_form(operation.goal), idempotency_key=key,
+                        delay=SavingGoalService.http.timeout[1])
+                    status_url = UserInfoService.pending_goal_view(username, pending_goal)["status_url"]
+                    message = "The secondary API did not confirm the creation; it is retried in the background."
+                    results[index] = result(index, operation, 202, message=message, status_url=status_url)
+                    queued = True
+                elif outcome.applied is None:
+                    message = (f"The secondary API did not confirm the {op}; the goal may have changed upstream. "
+                               "Repeating the operation is safe.")
+                    results[index] = result(index, operation, 502, operation.goal_id, message=message)
+                elif operation.op == GoalBatchOperationEnum.DELETE:
+                    UserGoalService.remove_goal(session, user_id, operation.goal_id)
+                    GoalProjectionService.remove(session, operation.goal_id)
+                    message = f"Goal {operation.goal_id} deleted successfully."
+                    results[index] = result(index, operation, 200, operation.goal_id, message=message)
+                    changed = True
+                else:
+                    goal = outcome.value
+                    if operation.op == GoalBatchOperationEnum.CREATE:
+                        UserGoalService.add_goal(session, user_id, goal["id"])
+                    GoalProjectionService.save(session, user_id, goal)
+                    results[index] = result(index, operation, 200, goal["id"], goal=goal)
+                    changed = True
+
+            if changed:
+                UserVersionService.bump(session, user_id)
+            session.commit()
+            if queued:
+                goal_outbox_worker.notify()
+
+            applied = sum(1 for entry in results if entry["status"] < 300)
+            logger.info("Applied %s of %s goal operations for user %s", applied, len(operations), username)
+            return {"results": results, "goal_ids": UserGoalService.goal_ids(session, user_id)}, 200
+
+        except Exception as e:
+            if sent:
+                error_msg = (f"The goal operations for user with username {username} were sent to the secondary "
+                             "API but could not be saved locally; some of them may have been applied.")
+                logger.error("Error saving goal operations for user %s: %s", username, e, exc_info=True)
+                return {"message": error_msg}, 500
+            error_msg = f"Could not apply the goal operations for user with username {username}."
+            logger.warning("Error applying goal operations for user %s: %s", username, e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
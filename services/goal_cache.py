@@ -0,0 +1,308 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+from metrics import goal_cache_lookups
+
+
+# Cache settings, all overridable through the environment
+# file is shared by every worker of the host; memory is per process, so with several workers
+# a goal changed through one of them is served stale by the others for up to GOAL_CACHE_TTL
+GOAL_CACHE_BACKEND = os.environ.get("GOAL_CACHE_BACKEND", "file")  # file, memory or none
+GOAL_CACHE_MAX_ENTRIES = int(os.environ.get("GOAL_CACHE_MAX_ENTRIES", "4096"))
+GOAL_CACHE_TTL = float(os.environ.get("GOAL_CACHE_TTL", "300"))
+GOAL_CACHE_PATH = os.environ.get("GOAL_CACHE_PATH", "cache/goals.sqlite3")
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU cache whose entries expire after a fixed time to live.
+    """
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def get_many(self, keys) -> Dict[Any, Any]:
+        found = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._generation += 1
+            self._store(key, value)
+
+    def fill(self, key, value, generation: int) -> None:
+        with self._lock:
+            if generation == self._generation:
+                self._store(key, value)
+
+    def _store(self, key, value) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FileCacheBackend:
+    """
+    Cache with a time to live, stored in a local SQLite file.
+    Every gunicorn worker on the host opening the same file sees the same entries,
+    so an invalidation made by one worker applies to all of them.
+
+    Hits only read the file, so they never wait on the write lock; past `max_entries`, the
+    entries closest to expiring, which are the oldest, are evicted first. Every write or
+    invalidation bumps a shared generation, and a read-through fill is only stored if the
+    generation did not move since the goal was fetched, so that a fill racing with an update
+    cannot bring the old goal back.
+    """
+
+    def __init__(self, path: str, max_entries: int, ttl: float):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns the connection of the current thread and process.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS goal ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_goal_expires_at ON goal (expires_at)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)")
+            connection.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def generation(self) -> int:
+        return self.connection.execute("SELECT value FROM generation WHERE id = 0").fetchone()[0]
+
+    def get(self, key) -> Optional[Any]:
+        row = self.connection.execute(
+            "SELECT value FROM goal WHERE key = ? AND expires_at > ?", (str(key), time.time())
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def get_many(self, keys) -> Dict[Any, Any]:
+        """
+        Returns the live entries among `keys` with one query per 500 keys.
+        """
+        keys = list(keys)
+        by_key = {str(key): key for key in keys}
+        found = {}
+        now = time.time()
+        for start in range(0, len(keys), 500):
+            chunk = [str(key) for key in keys[start:start + 500]]
+            rows = self.connection.execute(
+                f"SELECT key, value FROM goal WHERE expires_at > ? AND key IN ({','.join('?' * len(chunk))})",
+                (now, *chunk),
+            )
+            found.update({by_key[key]: json.loads(value) for key, value in rows})
+        return found
+
+    def set(self, key, value) -> None:
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE generation SET value = value + 1 WHERE id = 0")
+            self._store(connection, key, value)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def fill(self, key, value, generation: int) -> None:
+        now = time.time()
+        connection = self.connection
+        inserted = connection.execute(
+            "INSERT OR REPLACE INTO goal (key, value, expires_at) "
+            "SELECT ?, ?, ? WHERE (SELECT value FROM generation WHERE id = 0) = ?",
+            (str(key), json.dumps(value), now + self.ttl, generation),
+        ).rowcount
+        if inserted:
+            self._evict(connection, now)
+
+    def _store(self, connection: sqlite3.Connection, key, value) -> None:
+        now = time.time()
+        connection.execute(
+            "INSERT OR REPLACE INTO goal (key, value, expires_at) VALUES (?, ?, ?)",
+            (str(key), json.dumps(value), now + self.ttl),
+        )
+        self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute(
+            "DELETE FROM goal WHERE expires_at <= ? OR key IN "
+            "(SELECT key FROM goal ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (now, self.max_entries),
+        )
+
+    def delete(self, key) -> None:
+        connection = self.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("UPDATE generation SET value = value + 1 WHERE id = 0")
+            connection.execute("DELETE FROM goal WHERE key = ?", (str(key),))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        self.connection.execute("DELETE FROM goal")
+
+
+class NullCacheBackend:
+    """
+    Backend that stores nothing, used when caching is disabled.
+    """
+
+    def generation(self) -> int:
+        return 0
+
+    def get(self, key) -> Optional[Any]:
+        return None
+
+    def get_many(self, keys) -> Dict[Any, Any]:
+        return {}
+
+    def set(self, key, value) -> None:
+        pass
+
+    def fill(self, key, value, generation: int) -> None:
+        pass
+
+    def delete(self, key) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+
+class GoalCache:
+    """
+    Read-through cache of saving goals returned by the secondary API, keyed by goal ID.
+    Counts hits and misses for the current process.
+
+    Goals returned by a write to the secondary API are stored with `set`. Goals read from it are
+    stored with `fill`, passing the `generation()` taken before the read: the fill is dropped if
+    a write or an invalidation happened meanwhile.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _count(self, hits: int, misses: int) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            goal_cache_lookups.labels("hit").inc(hits)
+        if misses:
+            goal_cache_lookups.labels("miss").inc(misses)
+
+    def get(self, goal_id: int) -> Optional[Dict[str, Any]]:
+        goal = self.backend.get(goal_id)
+        self._count(goal is not None, goal is None)
+        return goal
+
+    def get_many(self, goal_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Returns the cached goals among `goal_ids`, keyed by ID.
+        """
+        goal_ids = list(goal_ids)
+        found = self.backend.get_many(goal_ids)
+        self._count(len(found), len(goal_ids) - len(found))
+        return found
+
+    def generation(self) -> int:
+        return self.backend.generation()
+
+    def set(self, goal: Dict[str, Any]) -> None:
+        if goal and goal.get("id") is not None:
+            self.backend.set(goal["id"], goal)
+
+    def fill(self, goal: Dict[str, Any], generation: int) -> None:
+        if goal and goal.get("id") is not None:
+            self.backend.fill(goal["id"], goal, generation)
+
+    def invalidate(self, goal_id: int) -> None:
+        self.backend.delete(goal_id)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters of the current process.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def create_backend(name: str = GOAL_CACHE_BACKEND):
+    """
+    Builds the cache backend selected by `name`.
+    """
+    if name == "memory":
+        return MemoryCacheBackend(GOAL_CACHE_MAX_ENTRIES, GOAL_CACHE_TTL)
+    if name == "file":
+        return FileCacheBackend(GOAL_CACHE_PATH, GOAL_CACHE_MAX_ENTRIES, GOAL_CACHE_TTL)
+    if name == "none":
+        return NullCacheBackend()
+    raise ValueError(f"Unknown goal cache backend '{name}'.")
+
+
+goal_cache = GoalCache(create_backend())
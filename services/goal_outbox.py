@@ -0,0 +1,290 @@
+"""
+Asynchronous goal creation through a transactional outbox.
+
+`GoalOutboxService.enqueue` writes a PendingGoal and its GoalOutbox entry in the caller's
+transaction, so the request answers without waiting on the secondary API. The worker below
+drains the outbox: it leases due entries, posts each goal upstream with the entry's
+idempotency key, then links the returned goal to the user and deletes the entry in one local
+transaction. Failed attempts are retried with exponential backoff; after
+GOAL_OUTBOX_MAX_ATTEMPTS, or on a 4xx answer, the goal is marked as failed.
+
+An entry whose worker died mid-delivery is picked up again once its lease expires. The replay
+sends the same idempotency key, so an upstream honouring `Idempotency-Key` returns the goal
+created the first time instead of a duplicate.
+
+The worker runs on a daemon thread of each app process (GOAL_OUTBOX_WORKER=1), or as a
+separate process with:
+    python -m services.goal_outbox [--once]
+"""
+import argparse
+import os
+import random
+import threading
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+import requests
+from sqlalchemy import DateTime, bindparam, select, text
+
+from logger import configure_logging, logger
+from metrics import goal_outbox_deliveries
+from models import Session
+from models.goal_outbox import GoalOutbox
+from models.pending_goal import PendingGoal, CREATED, FAILED
+from services.goal_projection import GoalProjectionService
+from services.saving_goal import SavingGoalService
+from services.user_goal import UserGoalService
+from services.user_version import UserVersionService
+
+# Outbox settings, all overridable through the environment
+GOAL_CREATE_ASYNC = os.environ.get("GOAL_CREATE_ASYNC", "0") == "1"  # Otherwise only with `Prefer: respond-async`
+GOAL_OUTBOX_WORKER = os.environ.get("GOAL_OUTBOX_WORKER", "1") == "1"
+GOAL_OUTBOX_POLL_INTERVAL = float(os.environ.get("GOAL_OUTBOX_POLL_INTERVAL", "1.0"))
+GOAL_OUTBOX_BATCH = int(os.environ.get("GOAL_OUTBOX_BATCH", "20"))
+GOAL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("GOAL_OUTBOX_MAX_ATTEMPTS", "8"))
+GOAL_OUTBOX_BACKOFF = float(os.environ.get("GOAL_OUTBOX_BACKOFF", "1.0"))  # First retry delay, doubled each time
+GOAL_OUTBOX_MAX_BACKOFF = float(os.environ.get("GOAL_OUTBOX_MAX_BACKOFF", "300"))
+GOAL_OUTBOX_LEASE = float(os.environ.get("GOAL_OUTBOX_LEASE", "30"))  # Seconds a claimed entry stays reserved
+
+# Leases up to `limit` due entries in one statement. The claim condition is repeated in the
+# outer WHERE so that a concurrent claimer re-checks it on the locked row.
+CLAIM_DUE = text(
+    "UPDATE goal_outbox SET claimed_until = :lease_until "
+    "WHERE id IN (SELECT id FROM goal_outbox WHERE next_attempt_at <= :now "
+    "AND (claimed_until IS NULL OR claimed_until < :now) ORDER BY next_attempt_at LIMIT :limit) "
+    "AND (claimed_until IS NULL OR claimed_until < :now) RETURNING id"
+).bindparams(bindparam("now", type_=DateTime), bindparam("lease_until", type_=DateTime))
+
+# 4xx answers that are still worth retrying
+RETRIABLE_STATUS = {408, 425, 429}
+
+
+class GoalOutboxService:
+    """
+    Service class for pending goals and their outbox entries.
+    Every method works inside the caller's session.
+    """
+
+    @staticmethod
+    def enqueue(session, user_id: int, goal_data: dict, idempotency_key: Optional[str] = None,
+                delay: float = 0.0) -> PendingGoal:
+        """
+        Adds a pending goal and its outbox entry; both are written by the caller's commit.
+        A creation whose outcome is unknown is handed over with the key it was sent with, so that
+        the replay returns the goal if it was created, and a `delay` leaving it time to finish upstream.
+        """
+        pending_goal = PendingGoal(user_id=user_id, goal_data=goal_data)
+        session.add(pending_goal)
+        session.flush()
+        session.add(GoalOutbox(pending_goal_id=pending_goal.id, idempotency_key=idempotency_key,
+                               next_attempt_at=datetime.now() + timedelta(seconds=delay)))
+        return pending_goal
+
+    @staticmethod
+    def get(session, user_id: int, pending_goal_id: int) -> Optional[PendingGoal]:
+        return session.query(PendingGoal).filter(
+            PendingGoal.id == pending_goal_id, PendingGoal.user_id == user_id).first()
+
+    @staticmethod
+    def remove_for_user(session, user_id: int) -> None:
+        """
+        Deletes the pending goals of a user and their outbox entries.
+        """
+        pending_ids = select(PendingGoal.id).where(PendingGoal.user_id == user_id)
+        session.query(GoalOutbox).filter(GoalOutbox.pending_goal_id.in_(pending_ids)).delete(
+            synchronize_session=False)
+        session.query(PendingGoal).filter(PendingGoal.user_id == user_id).delete(synchronize_session=False)
+
+
+def backoff(attempts: int) -> float:
+    """
+    Delay before the next attempt, doubling from GOAL_OUTBOX_BACKOFF, with full jitter.
+    """
+    return random.uniform(0, min(GOAL_OUTBOX_MAX_BACKOFF, GOAL_OUTBOX_BACKOFF * 2 ** (attempts - 1)))
+
+
+def claim_due(limit: int = GOAL_OUTBOX_BATCH) -> List[int]:
+    """
+    Leases the due outbox entries to this worker and returns their IDs.
+    """
+    session = None
+    try:
+        session = Session()
+        now = datetime.now()
+        lease_until = now + timedelta(seconds=GOAL_OUTBOX_LEASE)
+        claimed = [outbox_id for (outbox_id,) in session.execute(
+            CLAIM_DUE, {"now": now, "lease_until": lease_until, "limit": limit})]
+        session.commit()
+        return claimed
+    finally:
+        if session:
+            session.close()
+
+
+def deliver(outbox_id: int) -> str:
+    """
+    Creates the goal of one outbox entry upstream and attaches it to its user.
+    No transaction is open during the upstream call. Returns the outcome.
+    """
+    session = None
+    try:
+        session = Session()
+        outbox = session.get(GoalOutbox, outbox_id)
+        if outbox is None:
+            return "dropped"
+        pending_goal_id, idempotency_key = outbox.pending_goal_id, outbox.idempotency_key
+        pending_goal = session.get(PendingGoal, pending_goal_id)
+        if pending_goal is None:
+            session.delete(outbox)
+            session.commit()
+            return "dropped"
+        goal_data = pending_goal.goal_data()
+        session.close()  # Ends the read transaction; the session is reused afterwards
+
+        try:
+            goal = SavingGoalService.create_saving_goal(goal_data, idempotency_key)
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code
+            if 400 <= status < 500 and status not in RETRIABLE_STATUS:
+                return give_up(session, outbox_id, f"Secondary API rejected the goal with status {status}.")
+            return retry(session, outbox_id, str(e))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            return retry(session, outbox_id, str(e))
+
+        pending_goal = session.get(PendingGoal, pending_goal_id)
+        if pending_goal is None:  # The user was deleted meanwhile
+            session.query(GoalOutbox).filter(GoalOutbox.id == outbox_id).delete(synchronize_session=False)
+            session.commit()
+            SavingGoalService.delete_saving_goal_by_id(goal["id"])
+            return "dropped"
+
+        # A replayed delivery may find the goal already linked
+        if not UserGoalService.has_goal(session, pending_goal.user_id, goal["id"]):
+            UserGoalService.add_goal(session, pending_goal.user_id, goal["id"])
+        GoalProjectionService.save(session, pending_goal.user_id, goal)
+        UserVersionService.bump(session, pending_goal.user_id)
+        pending_goal.status = CREATED
+        pending_goal.goal_id = goal["id"]
+        pending_goal.updated_at = datetime.now()
+        session.query(GoalOutbox).filter(GoalOutbox.id == outbox_id).delete(synchronize_session=False)
+        session.commit()
+        logger.info("Pending goal %s created as goal %s", pending_goal_id, goal["id"])
+        return "created"
+
+    finally:
+        if session:
+            session.close()
+
+
+def retry(session, outbox_id: int, error: str) -> str:
+    """
+    Schedules another attempt, or gives up once GOAL_OUTBOX_MAX_ATTEMPTS is reached.
+    """
+    outbox = session.get(GoalOutbox, outbox_id)
+    if outbox is None:
+        return "dropped"
+    outbox.attempts += 1
+    if outbox.attempts >= GOAL_OUTBOX_MAX_ATTEMPTS:
+        return give_up(session, outbox_id, f"Secondary API unavailable after {outbox.attempts} attempts.")
+    outbox.next_attempt_at = datetime.now() + timedelta(seconds=backoff(outbox.attempts))
+    outbox.claimed_until = None
+    outbox.last_error = error[:255]
+    session.commit()
+    logger.info("Goal outbox entry %s failed (attempt %s): %s", outbox_id, outbox.attempts, error)
+    return "retry"
+
+
+def give_up(session, outbox_id: int, error: str) -> str:
+    """
+    Marks the pending goal as failed and deletes its outbox entry.
+    """
+    outbox = session.get(GoalOutbox, outbox_id)
+    if outbox is None:
+        return "dropped"
+    pending_goal_id = outbox.pending_goal_id
+    pending_goal = session.get(PendingGoal, pending_goal_id)
+    if pending_goal is not None:
+        pending_goal.status = FAILED
+        pending_goal.error = error[:255]
+        pending_goal.updated_at = datetime.now()
+    session.delete(outbox)
+    session.commit()
+    logger.warning("Pending goal %s failed: %s", pending_goal_id, error)
+    return "failed"
+
+
+def drain_once(limit: int = GOAL_OUTBOX_BATCH) -> int:
+    """
+    Delivers the due outbox entries, up to `limit`. Returns the number of entries handled.
+    """
+    try:
+        outbox_ids = claim_due(limit)
+    except Exception as e:
+        logger.warning("Error claiming goal outbox entries: %s", e)
+        return 0
+    for outbox_id in outbox_ids:
+        try:
+            outcome = deliver(outbox_id)
+        except Exception as e:
+            # The lease expires and the entry is picked up again
+            logger.warning("Error delivering goal outbox entry %s: %s", outbox_id, e)
+            outcome = "retry"
+        goal_outbox_deliveries.labels(outcome).inc()
+    return len(outbox_ids)
+
+
+class GoalOutboxWorker:
+    """
+    Daemon thread draining the goal outbox every `interval` seconds, or as soon as
+    `notify()` signals a new entry from this process.
+    """
+
+    def __init__(self, interval: float = GOAL_OUTBOX_POLL_INTERVAL):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            # Also restarts the thread in a forked worker, where it did not survive the fork
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="goal-outbox", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def notify(self) -> None:
+        if GOAL_OUTBOX_WORKER:
+            self.start()
+            self._wake.set()
+
+    def _run(self) -> None:
+        # Waits first, so that a booting worker does not touch the database before its first request
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            while drain_once() >= GOAL_OUTBOX_BATCH and not self._stop.is_set():
+                pass
+
+
+goal_outbox_worker = GoalOutboxWorker()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="drain the due entries once and exit")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.once:
+        while drain_once() >= GOAL_OUTBOX_BATCH:
+            pass
+    else:
+        goal_outbox_worker._run()
@@ -0,0 +1,92 @@
+import os
+from typing import Dict, List, Optional, Tuple
+
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_goal import UserGoal
+from models.user_info import UserInfo
+from services.user_summary import UserSummaryService, goal_totals
+
+# Where profile reads take goals from: "projection" (local table, upstream only for
+# goals not projected yet) or "secondary_api" (always upstream)
+GOAL_READ_SOURCE = os.environ.get("GOAL_READ_SOURCE", "projection")
+
+
+class GoalProjectionService:
+    """
+    Service class for the local projection of the goals stored in the secondary API.
+    Every method works inside the caller's session, so projection writes commit
+    together with the change to the user's goal links and to the user's savings aggregates.
+    """
+
+    @staticmethod
+    def save(session, user_id: int, goal_data: dict) -> SavingGoalProjection:
+        """
+        Inserts or refreshes the projection of a goal returned by the secondary API.
+        A new projection recomputes its user's aggregates from all of the user's projections, so
+        that projections removed without their delta, and then re-created, are not counted twice.
+        """
+        projection = session.get(SavingGoalProjection, goal_data["id"])
+        if projection is None:
+            projection = SavingGoalProjection(id=goal_data["id"], user_id=user_id)
+            session.add(projection)
+            projection.update_from(goal_data)
+            session.flush()
+            UserSummaryService.rebuild(session, user_id)
+        else:
+            GoalProjectionService.update(session, projection, goal_data)
+        return projection
+
+    @staticmethod
+    def update(session, projection: SavingGoalProjection, goal_data: dict) -> bool:
+        """
+        Refreshes an existing projection and its user's aggregates.
+        Returns whether any field visible to clients changed.
+        """
+        before = goal_totals(projection)
+        changed = projection.update_from(goal_data)
+        UserSummaryService.apply(session, projection.user_id, before, goal_totals(projection))
+        return changed
+
+    @staticmethod
+    def remove(session, goal_id: int) -> None:
+        """
+        Deletes the projection of a goal.
+        """
+        projection = session.get(SavingGoalProjection, goal_id)
+        if projection is not None:
+            UserSummaryService.apply(session, projection.user_id, goal_totals(projection), None)
+            session.delete(projection)
+
+    @staticmethod
+    def remove_for_user(session, user_id: int) -> None:
+        """
+        Deletes the projections of every goal owned by a user.
+        """
+        session.query(SavingGoalProjection).filter(SavingGoalProjection.user_id == user_id).delete(
+            synchronize_session=False)
+
+    @staticmethod
+    def get(session, goal_id: int) -> Optional[SavingGoalProjection]:
+        return session.get(SavingGoalProjection, goal_id)
+
+    @staticmethod
+    def load_user_with_goals(session, username: str) \
+            -> Tuple[Optional[UserInfo], List[int], Dict[int, SavingGoalProjection]]:
+        """
+        Loads a user, the IDs of its goals in order and their projections with a single joined query.
+        Goals without a projection are listed in the IDs but absent from the projections.
+        """
+        rows = (
+            session.query(UserInfo, UserGoal.goal_id, SavingGoalProjection)
+            .outerjoin(UserGoal, UserGoal.user_id == UserInfo.id)
+            .outerjoin(SavingGoalProjection, SavingGoalProjection.id == UserGoal.goal_id)
+            .filter(UserInfo.username == username)
+            .order_by(UserGoal.created_at, UserGoal.goal_id)
+            .all()
+        )
+        if not rows:
+            return None, [], {}
+        goal_ids = [goal_id for _, goal_id, _ in rows if goal_id is not None]
+        projections = {projection.id: projection for _, _, projection in rows if projection is not None}
+        return rows[0][0], goal_ids, projections
+
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metrics import upstream_errors, upstream_in_flight, upstream_rejected, upstream_request_duration
+from services.resilience import BudgetExhaustedError, CircuitBreaker, CircuitOpenError, remaining_budget
+
+
+# Connection settings for the secondary API, all overridable through the environment
+SECONDARY_API_URL = os.environ.get("SECONDARY_API_URL", "http://secondary-api:5000")
+HTTP_POOL_CONNECTIONS = int(os.environ.get("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.environ.get("HTTP_POOL_MAXSIZE", "32"))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "2.0"))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "5.0"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF = float(os.environ.get("HTTP_RETRY_BACKOFF", "0.1"))
+
+# Only verbs that are safe to repeat are retried; POST creates a new goal on every call
+RETRY_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRY_STATUSES = (502, 503, 504)
+
+
+class HttpClient:
+    """
+    Keep-alive HTTP client for one upstream API.
+    Holds a per-process `requests.Session` with a sized connection pool, default
+    timeouts and retries with backoff for idempotent verbs. The session is rebuilt
+    in a child process after a fork, so gunicorn workers never share sockets.
+    Each operation (verb and path) has its own circuit breaker, and no call outlives
+    the upstream budget of the current request.
+    """
+
+    def __init__(self, base_url: str, pool_connections: int = HTTP_POOL_CONNECTIONS,
+                 pool_maxsize: int = HTTP_POOL_MAXSIZE, connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+                 read_timeout: float = HTTP_READ_TIMEOUT, retries: int = HTTP_RETRIES,
+                 retry_backoff: float = HTTP_RETRY_BACKOFF):
+        """
+        :param base_url: Base URL prepended to every request path
+        :param pool_connections: Number of host pools to keep
+        :param pool_maxsize: Maximum number of kept-alive connections per host
+        :param connect_timeout: Seconds to wait for a TCP connection
+        :param read_timeout: Seconds to wait for the response
+        :param retries: Retries for idempotent verbs on connection errors and 502/503/504
+        :param retry_backoff: Backoff factor between retries, in seconds
+        """
+        self.base_url = base_url.rstrip("/")
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self._session: Optional[requests.Session] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.in_flight = 0  # Calls of this process waiting on the upstream, read by the load shedding
+        self._in_flight_lock = threading.Lock()
+
+    def breaker(self, method: str, path: str) -> CircuitBreaker:
+        """
+        Returns the circuit breaker of an operation, creating it on first use.
+        """
+        operation = f"{method} {path}"
+        breaker = self.breakers.get(operation)
+        if breaker is None:
+            breaker = self.breakers.setdefault(operation, CircuitBreaker(operation))
+        return breaker
+
+    @property
+    def session(self) -> requests.Session:
+        """
+        Returns the session of the current process, building it on first use.
+        """
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _build_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=0,  # A read timeout already used up the whole timeout; retrying it would overrun the request budget
+            status=self.retries,
+            backoff_factor=self.retry_backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def reset(self) -> None:
+        """
+        Drops the current session, its pooled connections and the circuit breakers.
+        The next request builds a fresh session.
+        """
+        self._session = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.breakers = {}
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+
+    def close(self) -> None:
+        """
+        Closes the pooled connections of this process.
+        """
+        if self._session is not None and self._pid == os.getpid():
+            self._session.close()
+        self.reset()
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request to `base_url + path`, applying the default timeouts unless overridden.
+        Fails fast with CircuitOpenError while the operation's circuit is open, and with
+        BudgetExhaustedError once the request's upstream budget is spent; both are
+        RequestExceptions, so callers handle them like any other upstream failure.
+        The budget shortens the read timeout of calls that are safe to repeat only: a POST
+        without an Idempotency-Key, cut short once sent, could have created a goal that
+        the caller would report as failed.
+        """
+        connect_timeout, read_timeout = kwargs.pop("timeout", self.timeout)
+        budget = remaining_budget()
+        if budget is not None:
+            if budget <= 0:
+                upstream_rejected.labels(method, path, "budget").inc()
+                raise BudgetExhaustedError(f"Upstream budget exhausted before {method} {path}")
+            connect_timeout = min(connect_timeout, budget)
+            if method in RETRY_METHODS or "Idempotency-Key" in (kwargs.get("headers") or {}):
+                read_timeout = min(read_timeout, budget)
+
+        breaker = self.breaker(method, path)
+        if not breaker.allow():
+            upstream_rejected.labels(method, path, "circuit_open").inc()
+            raise CircuitOpenError(f"Circuit open for {method} {path}")
+
+        in_flight = upstream_in_flight.labels(method)
+        in_flight.inc()
+        with self._in_flight_lock:
+            self.in_flight += 1
+        started_at = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}",
+                                            timeout=(connect_timeout, read_timeout), **kwargs)
+            failed = response.status_code >= 500
+        finally:
+            duration = time.perf_counter() - started_at
+            in_flight.dec()
+            with self._in_flight_lock:
+                self.in_flight -= 1
+            upstream_request_duration.labels(method, path).observe(duration)
+            breaker.record(failed, duration)
+            if failed:
+                upstream_errors.labels(method, path).inc()
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+
+secondary_api = HttpClient(SECONDARY_API_URL)
+
+# Connections inherited from the parent must never be used by a forked worker
+os.register_at_fork(after_in_child=secondary_api.reset)
@@ -0,0 +1,165 @@
+"""
+Background job keeping `saving_goal_projection` in line with the secondary API.
+
+Run it as a separate process with:
+    python -m services.reconciliation [--once]
+
+or set GOAL_PROJECTION_RECONCILE=1 to run it on a daemon thread inside the app. Otherwise the
+app only projects the linked goals that have no local row yet (GOAL_PROJECTION_BACKFILL=1), so
+that they count in their user's savings aggregates.
+"""
+import argparse
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from logger import configure_logging, logger
+from models import Session
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_goal import UserGoal
+from services.goal_projection import GoalProjectionService
+from services.saving_goal import SavingGoalService
+from services.user_version import UserVersionService
+
+GOAL_PROJECTION_RECONCILE = os.environ.get("GOAL_PROJECTION_RECONCILE", "0") == "1"
+GOAL_PROJECTION_BACKFILL = os.environ.get("GOAL_PROJECTION_BACKFILL", "1") == "1"
+GOAL_PROJECTION_MAX_AGE = float(os.environ.get("GOAL_PROJECTION_MAX_AGE", "900"))
+GOAL_PROJECTION_RECONCILE_INTERVAL = float(os.environ.get("GOAL_PROJECTION_RECONCILE_INTERVAL", "60"))
+GOAL_PROJECTION_RECONCILE_BATCH = int(os.environ.get("GOAL_PROJECTION_RECONCILE_BATCH", "200"))
+
+
+def reconcile_once(max_age: float = GOAL_PROJECTION_MAX_AGE, limit: int = GOAL_PROJECTION_RECONCILE_BATCH) -> int:
+    """
+    Refreshes up to `limit` projections older than `max_age` seconds from the secondary API,
+    oldest first. Returns the number of refreshed rows.
+    """
+    session = None
+    try:
+        session = Session()
+        stale_before = datetime.now() - timedelta(seconds=max_age)
+        stale = (
+            session.query(SavingGoalProjection)
+            .filter(SavingGoalProjection.refreshed_at < stale_before)
+            .order_by(SavingGoalProjection.refreshed_at)
+            .limit(limit)
+            .all()
+        )
+        if not stale:
+            return 0
+
+        goal_ids = [projection.id for projection in stale]
+        for goal_id in goal_ids:
+            SavingGoalService.cache.invalidate(goal_id)
+        fetched = SavingGoalService.get_saving_goals_by_ids(goal_ids)
+
+        refreshed = 0
+        changed_users = set()
+        for projection, goal_data in zip(stale, fetched):
+            if goal_data:
+                if GoalProjectionService.update(session, projection, goal_data):
+                    changed_users.add(projection.user_id)
+                refreshed += 1
+        # Upstream changes, such as a new converted value, must invalidate the clients' ETags
+        for user_id in changed_users:
+            UserVersionService.bump(session, user_id)
+        session.commit()
+        logger.info("Refreshed %s of %s stale goal projections", refreshed, len(stale))
+        return refreshed
+
+    except Exception as e:
+        if session:
+            session.rollback()
+        logger.warning("Error reconciling goal projections: %s", e)
+        return 0
+
+    finally:
+        if session:
+            session.close()
+
+
+def backfill_missing(limit: int = GOAL_PROJECTION_RECONCILE_BATCH) -> int:
+    """
+    Projects up to `limit` linked goals that have no local row yet.
+    Returns the number of projected goals.
+    """
+    session = None
+    try:
+        session = Session()
+        missing = (
+            session.query(UserGoal.user_id, UserGoal.goal_id)
+            .outerjoin(SavingGoalProjection, SavingGoalProjection.id == UserGoal.goal_id)
+            .filter(SavingGoalProjection.id.is_(None))
+            .limit(limit)
+            .all()
+        )
+        if not missing:
+            return 0
+
+        goal_ids = [goal_id for _, goal_id in missing]
+        fetched = SavingGoalService.get_saving_goals_by_ids(goal_ids)
+        projected = 0
+        for (user_id, _), goal_data in zip(missing, fetched):
+            if goal_data:
+                GoalProjectionService.save(session, user_id, goal_data)
+                projected += 1
+        session.commit()
+        logger.info("Projected %s of %s goals without a local row", projected, len(missing))
+        return projected
+
+    except Exception as e:
+        if session:
+            session.rollback()
+        logger.warning("Error backfilling goal projections: %s", e)
+        return 0
+
+    finally:
+        if session:
+            session.close()
+
+
+class ProjectionReconciler:
+    """
+    Daemon thread that, every `interval` seconds, projects the linked goals without a local row
+    (such as the ones migrated from the legacy `goal_ids` column) and, with `refresh`, runs `reconcile_once`.
+    """
+
+    def __init__(self, interval: float = GOAL_PROJECTION_RECONCILE_INTERVAL, refresh: bool = True):
+        self.interval = interval
+        self.refresh = refresh
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="goal-reconciler", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def run_once(self) -> None:
+        while backfill_missing() >= GOAL_PROJECTION_RECONCILE_BATCH and not self._stop.is_set():
+            pass
+        if self.refresh:
+            reconcile_once()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.run_once()
+
+
+reconciler = ProjectionReconciler()
+backfiller = ProjectionReconciler(refresh=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    args = parser.parse_args()
+
+    configure_logging()
+    reconciler.run_once()
+    if not args.once:
+        reconciler._run()
@@ -0,0 +1,146 @@
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+import requests
+
+
+# Circuit breaker settings, shared by every upstream operation and overridable through the environment
+BREAKER_WINDOW = int(os.environ.get("UPSTREAM_BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATE = float(os.environ.get("UPSTREAM_BREAKER_FAILURE_RATE", "0.5"))
+BREAKER_SLOW_CALL_RATE = float(os.environ.get("UPSTREAM_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_SLOW_CALL_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_SLOW_CALL_SECONDS", "1.0"))
+BREAKER_OPEN_SECONDS = float(os.environ.get("UPSTREAM_BREAKER_OPEN_SECONDS", "10"))
+BREAKER_HALF_OPEN_CALLS = int(os.environ.get("UPSTREAM_BREAKER_HALF_OPEN_CALLS", "3"))
+
+# Total time, in seconds, the upstream calls of one request may take
+UPSTREAM_REQUEST_BUDGET = float(os.environ.get("UPSTREAM_REQUEST_BUDGET", "3.0"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """
+    Raised instead of calling an upstream operation whose circuit is open.
+    """
+
+
+class BudgetExhaustedError(requests.exceptions.RequestException):
+    """
+    Raised instead of calling upstream once the request's time budget is spent.
+    """
+
+
+class CircuitBreaker:
+    """
+    Count-based circuit breaker for one upstream operation.
+    The circuit opens when, over the last `window` calls, the failure rate or the slow-call
+    rate reaches its threshold. After `open_seconds` it lets `half_open_calls` probes through:
+    the circuit closes again if they all succeed quickly, and reopens on the first bad one.
+    """
+
+    def __init__(self, name: str, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 failure_rate: float = BREAKER_FAILURE_RATE, slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS, open_seconds: float = BREAKER_OPEN_SECONDS,
+                 half_open_calls: int = BREAKER_HALF_OPEN_CALLS):
+        """
+        :param name: Operation guarded by the breaker, used in logs and errors
+        :param window: Number of most recent calls the rates are computed on
+        :param min_calls: Calls needed in the window before the circuit may open
+        :param failure_rate: Fraction of failed calls that opens the circuit
+        :param slow_call_rate: Fraction of slow calls that opens the circuit
+        :param slow_call_seconds: Duration above which a call counts as slow
+        :param open_seconds: Time the circuit stays open before probing
+        :param half_open_calls: Probes let through while half-open
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # (failed, slow) per call
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Returns whether a call may go through now. A True answer must be followed by
+        `record(...)` once the call is over.
+        """
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self._opened_at < self.open_seconds:
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+                self._probe_successes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_calls:
+                    return False
+                self._probes += 1
+            return True
+
+    def record(self, failed: bool, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            if self.state == HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_calls:
+                        self.state = CLOSED
+                        self._outcomes.clear()
+                return
+            if self.state == OPEN:  # A call started before the circuit opened
+                return
+            self._outcomes.append((failed, slow))
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, slow in self._outcomes if slow)
+            if failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate:
+                self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+
+_budget_expires_at: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "upstream_budget_expires_at", default=None)
+
+
+def remaining_budget() -> Optional[float]:
+    """
+    Returns the seconds left in the current request's upstream budget, or None without a budget.
+    """
+    expires_at = _budget_expires_at.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+def start_budget(seconds: float = UPSTREAM_REQUEST_BUDGET) -> None:
+    """
+    Starts the upstream budget of the current request. A non-positive value removes it.
+    """
+    _budget_expires_at.set(time.monotonic() + seconds if seconds > 0 else None)
+
+
+def init_app(app) -> None:
+    """
+    Gives every request of the app its own upstream budget.
+    """
+    app.before_request(start_budget)
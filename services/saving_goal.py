@@ -1,29 +1,283 @@
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
 import requests
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, List, Optional
 from schemas.user_info import SavingGoalViewSchema, SavingGoalSchema
 from logger import logger
+from services.goal_cache import goal_cache
+from services.http_client import secondary_api
+from services.resilience import remaining_budget
+
+
+# Fan-out settings for reads that need several goals from the secondary API
+GOAL_FETCH_MAX_WORKERS = int(os.environ.get("GOAL_FETCH_MAX_WORKERS", "32"))
+GOAL_FETCH_CONCURRENCY = int(os.environ.get("GOAL_FETCH_CONCURRENCY", "8"))
+GOAL_FETCH_DEADLINE = float(os.environ.get("GOAL_FETCH_DEADLINE", "5.0"))
+GOAL_BATCH_SIZE = int(os.environ.get("GOAL_BATCH_SIZE", "50"))
+
+# Statuses with which the secondary API signals that it does not understand `/goals?ids=...`
+BATCH_REJECTED_STATUSES = {400, 404, 405, 501}
+# Seconds after a rejection before the batch form is tried again, e.g. once an upstream deploy is over
+GOAL_BATCH_REPROBE_INTERVAL = float(os.environ.get("GOAL_BATCH_REPROBE_INTERVAL", "300"))
+
+_batch_rejected_at: Optional[float] = None
+
+# Result of `run_bounded(..., wait_started=True)` for a call it never started
+NOT_STARTED = object()
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+# Calls handed to `run_bounded` that have not started yet, read by the load shedding
+_queued_calls = 0
+_queued_calls_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Returns the worker pool shared by every request of this process.
+    The pool is created lazily so it never exists before a gunicorn fork.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=GOAL_FETCH_MAX_WORKERS,
+                    thread_name_prefix="saving-goal",
+                )
+    return _executor
+
+
+def queued_calls() -> int:
+    """
+    Returns the number of fan-out calls of this process waiting for a free slot.
+    """
+    return _queued_calls
+
+
+def _count_queued(delta: int) -> None:
+    global _queued_calls
+    with _queued_calls_lock:
+        _queued_calls += delta
+
+
+def _start_call(func: Callable[[Any], Any], item: Any) -> Any:
+    _count_queued(-1)
+    return func(item)
+
+
+def batch_supported() -> bool:
+    """
+    Returns whether multi-ID requests should be sent: unless the secondary API rejected them
+    less than GOAL_BATCH_REPROBE_INTERVAL seconds ago.
+    """
+    rejected_at = _batch_rejected_at
+    return rejected_at is None or time.monotonic() - rejected_at >= GOAL_BATCH_REPROBE_INTERVAL
+
+
+def run_bounded(func: Callable[[Any], Any], items: List[Any], max_concurrency: Optional[int] = None,
+                deadline: Optional[float] = None, wait_started: bool = False) -> List[Any]:
+    """
+    Calls `func` once per item on the shared worker pool and returns the results in item order.
+    At most `max_concurrency` calls are in flight at a time, and calls still pending after
+    `deadline` seconds, or once the request's upstream budget is spent, are cancelled.
+    Failed or unfinished calls yield None.
+
+    Calls that change something upstream must not be abandoned halfway: with `wait_started`,
+    the calls already running at the deadline are waited for, each bounded by its own HTTP
+    timeouts, and only the ones not started yet are cancelled; they yield NOT_STARTED.
+    """
+    max_concurrency = max_concurrency or GOAL_FETCH_CONCURRENCY
+    deadline = GOAL_FETCH_DEADLINE if deadline is None else deadline
+    budget = remaining_budget()
+    if budget is not None:
+        deadline = min(deadline, max(budget, 0.0))
+
+    results: List[Any] = [None] * len(items)
+    if len(items) <= 1 or max_concurrency <= 1:
+        for index, item in enumerate(items):
+            results[index] = func(item)
+        return results
+
+    executor = get_executor()
+    expires_at = time.monotonic() + deadline
+    queued = iter(enumerate(items))
+    in_flight = {}
+    _count_queued(len(items))
+
+    def submit_next() -> None:
+        for index, item in queued:
+            # Run in a copy of the caller's context, so the call sees the request's upstream budget
+            in_flight[executor.submit(contextvars.copy_context().run, _start_call, func, item)] = index
+            return
+
+    for _ in range(min(max_concurrency, len(items))):
+        submit_next()
+
+    while in_flight:
+        remaining = expires_at - time.monotonic()
+        if remaining <= 0:
+            break
+        done, _ = wait(in_flight, timeout=remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            index = in_flight.pop(future)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                logger.warning("Error calling %s for %s: %s", func.__name__, items[index], e)
+            submit_next()
+
+    if in_flight:
+        unfinished = NOT_STARTED if wait_started else None
+        abandoned = not_started = 0
+        for future, index in in_flight.items():
+            if future.cancel():
+                results[index] = unfinished
+                not_started += 1
+            elif wait_started:
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.warning("Error calling %s for %s: %s", func.__name__, items[index], e)
+                continue
+            abandoned += 1
+        for index, _ in queued:
+            results[index] = unfinished
+            abandoned += 1
+            not_started += 1
+        _count_queued(-not_started)
+        logger.warning("Fan-out deadline of %ss exceeded for %s, %d call(s) %s",
+                       deadline, func.__name__, abandoned, "not started" if wait_started else "abandoned")
+
+    return results
 
 
 class SavingGoalService:
     """
     Service class for managing saving goals.
     """
-    BASE_URL = "http://secondary-api:5000"
+    http = secondary_api
+    cache = goal_cache
 
     @staticmethod
     def get_saving_goal_by_id(goal_id: int) -> Optional[SavingGoalViewSchema]:
-        url = f"{SavingGoalService.BASE_URL}/goals/goal_id?goal_id={goal_id}"
+        """
+        Returns a goal from the cache, fetching it from the secondary API on a miss.
+        """
+        goal = SavingGoalService.cache.get(goal_id)
+        if goal is None:
+            generation = SavingGoalService.cache.generation()
+            goal = SavingGoalService.fetch_saving_goal_by_id(goal_id)
+            SavingGoalService.cache.fill(goal, generation)
+        return goal
+
+    @staticmethod
+    def fetch_saving_goal_by_id(goal_id: int) -> Optional[SavingGoalViewSchema]:
         try:
-            response = requests.get(url)
+            response = SavingGoalService.http.get("/goals/goal_id", params={"goal_id": goal_id})
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
-            logger.info(f"Erro ao buscar o goal {goal_id}: {e}")
+            logger.info("Erro ao buscar o goal %s: %s", goal_id, e)
             return None
 
+    @staticmethod
+    def get_saving_goals_concurrently(goal_ids: List[int], max_concurrency: Optional[int] = None,
+                                      deadline: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetches several goals from the secondary API using the shared worker pool.
+        Cached goals are served directly; at most `max_concurrency` calls for the others are
+        in flight for this request, and the whole fan-out is abandoned after `deadline` seconds.
+        The result keeps the order of `goal_ids`; goals that failed or did not finish in time
+        are returned as None.
+        """
+        found = SavingGoalService.cache.get_many(goal_ids)
+        missing = [goal_id for goal_id in goal_ids if goal_id not in found]
+        if not missing:
+            return [found[goal_id] for goal_id in goal_ids]
+        generation = SavingGoalService.cache.generation()
+        fetched = run_bounded(SavingGoalService.fetch_saving_goal_by_id, missing, max_concurrency, deadline)
+        for goal_id, goal in zip(missing, fetched):
+            if goal:
+                SavingGoalService.cache.fill(goal, generation)
+                found[goal_id] = goal
+        return [found.get(goal_id) for goal_id in goal_ids]
+
+    @staticmethod
+    def get_saving_goal_batch(goal_ids: List[int]) -> Optional[Dict[int, Dict[str, Any]]]:
+        """
+        Fetches several goals with a single multi-ID request.
+        Returns the goals keyed by ID, or None when the secondary API rejects the batch form,
+        which is then not tried again for GOAL_BATCH_REPROBE_INTERVAL seconds.
+        Goals missing from the answer are simply absent from the dictionary.
+        """
+        global _batch_rejected_at
+        params = {"ids": ",".join(str(goal_id) for goal_id in goal_ids)}
+        try:
+            response = SavingGoalService.http.get("/goals", params=params)
+            if response.status_code in BATCH_REJECTED_STATUSES:
+                logger.warning("Secondary API rejected batch goal requests (HTTP %s), falling back to single-ID calls",
+                               response.status_code)
+                _batch_rejected_at = time.monotonic()
+                return None
+            response.raise_for_status()
+            payload = response.json()
+            if _batch_rejected_at is not None:
+                logger.info("Secondary API accepts batch goal requests again")
+                _batch_rejected_at = None
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.info("Erro ao buscar os goals %s: %s", goal_ids, e)
+            return {}
+
+        if isinstance(payload, dict):
+            payload = payload.get("goals", [])
+        return {goal["id"]: goal for goal in payload if isinstance(goal, dict) and "id" in goal}
+
+    @staticmethod
+    def get_saving_goals_by_ids(goal_ids: List[int], max_concurrency: Optional[int] = None,
+                                deadline: Optional[float] = None) -> List[Optional[Dict[str, Any]]]:
+        """
+        Fetches several goals using multi-ID requests of at most GOAL_BATCH_SIZE IDs each.
+        Cached goals are served directly, and fetched goals are added to the cache.
+        Falls back to single-ID requests while the secondary API does not support the batch form.
+        The result keeps the order of `goal_ids`; missing goals are returned as None.
+        """
+        deadline = GOAL_FETCH_DEADLINE if deadline is None else deadline
+        if not batch_supported() or GOAL_BATCH_SIZE <= 1:
+            return SavingGoalService.get_saving_goals_concurrently(goal_ids, max_concurrency, deadline)
+
+        expires_at = time.monotonic() + deadline
+        found = SavingGoalService.cache.get_many(goal_ids)
+        missing = [goal_id for goal_id in goal_ids if goal_id not in found]
+        if not missing:
+            return [found[goal_id] for goal_id in goal_ids]
+        generation = SavingGoalService.cache.generation()
+        chunks = [missing[i:i + GOAL_BATCH_SIZE] for i in range(0, len(missing), GOAL_BATCH_SIZE)]
+        batches = run_bounded(SavingGoalService.get_saving_goal_batch, chunks, max_concurrency, deadline)
+
+        rejected: List[int] = []
+        for chunk, batch in zip(chunks, batches):
+            if batch is None:
+                rejected.extend(chunk)
+                continue
+            for goal in batch.values():
+                SavingGoalService.cache.fill(goal, generation)
+            found.update(batch)
+
+        remaining = expires_at - time.monotonic()
+        if rejected and remaining > 0:
+            fallback = SavingGoalService.get_saving_goals_concurrently(rejected, max_concurrency, remaining)
+            found.update({goal_id: goal for goal_id, goal in zip(rejected, fallback) if goal})
+
+        return [found.get(goal_id) for goal_id in goal_ids]
+
     @staticmethod
     def post_saving_goal(goal_data: SavingGoalSchema) -> Optional[SavingGoalViewSchema]:
-        url = f"{SavingGoalService.BASE_URL}/goals"
         data = {
             'goal_currency': goal_data.goal_currency,
             'goal_name': goal_data.goal_name,
@@ -31,16 +285,30 @@ class SavingGoalService:
             'monthly_savings': goal_data.monthly_savings
         }
         try:
-            response = requests.post(url, data=data)
+            response = SavingGoalService.http.post("/goals", data=data)
             response.raise_for_status()
-            return response.json()
+            goal = response.json()
+            SavingGoalService.cache.set(goal)
+            return goal
         except requests.exceptions.RequestException as e:
-            logger.info(f"Erro ao adicionar saving goal: {e}")
+            logger.info("Erro ao adicionar saving goal: %s", e)
             return None
 
+    @staticmethod
+    def create_saving_goal(goal_data: Dict[str, Any], idempotency_key: str) -> Dict[str, Any]:
+        """
+        Creates a goal sending `idempotency_key`, so that an upstream honouring the header answers
+        a replayed creation with the goal made the first time. Unlike `post_saving_goal`, failures
+        are raised, for the caller to tell the ones worth retrying apart.
+        """
+        response = SavingGoalService.http.post("/goals", data=goal_data, headers={"Idempotency-Key": idempotency_key})
+        response.raise_for_status()
+        goal = response.json()
+        SavingGoalService.cache.set(goal)
+        return goal
+
     @staticmethod
     def put_saving_goal_by_id(goal_id: int, goal_data: SavingGoalSchema) -> Optional[SavingGoalViewSchema]:
-        url = f"{SavingGoalService.BASE_URL}/goals/goal_id?goal_id={goal_id}"
         data = {
             'goal_currency': goal_data.goal_currency,
             'goal_name': goal_data.goal_name,
@@ -48,20 +316,46 @@ class SavingGoalService:
             'monthly_savings': goal_data.monthly_savings
         }
         try:
-            response = requests.put(url, data=data)
-            response.raise_for_status()
-            return response.json()
+            return SavingGoalService.update_saving_goal(goal_id, data)
         except requests.exceptions.RequestException as e:
-            logger.info(f"Erro ao atualizar saving goal {goal_id}: {e}")
+            logger.info("Erro ao atualizar saving goal %s: %s", goal_id, e)
             return None
 
     @staticmethod
-    def delete_saving_goal_by_id(goal_id: int) -> Optional[str]:
-        url = f"{SavingGoalService.BASE_URL}/goals/goal_id?goal_id={goal_id}"
+    def update_saving_goal(goal_id: int, goal_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Updates a goal. Like `create_saving_goal`, failures are raised.
+        """
+        SavingGoalService.cache.invalidate(goal_id)
         try:
-            response = requests.delete(url)
+            response = SavingGoalService.http.put("/goals/goal_id", params={"goal_id": goal_id}, data=goal_data)
             response.raise_for_status()
-            return response.json()
+            goal = response.json()
+        except Exception:
+            # The update may have been applied all the same, after a read filled the cache
+            SavingGoalService.cache.invalidate(goal_id)
+            raise
+        SavingGoalService.cache.set(goal)
+        return goal
+
+    @staticmethod
+    def delete_saving_goal_by_id(goal_id: int) -> Optional[dict]:
+        try:
+            return SavingGoalService.remove_saving_goal(goal_id)
         except requests.exceptions.RequestException as e:
-            logger.info(f"Erro ao deletar saving goal {goal_id}: {e}")
+            logger.info("Erro ao deletar saving goal %s: %s", goal_id, e)
             return None
+
+    @staticmethod
+    def remove_saving_goal(goal_id: int) -> dict:
+        """
+        Deletes a goal and returns the secondary API's answer. Like `create_saving_goal`, failures are raised.
+        """
+        SavingGoalService.cache.invalidate(goal_id)
+        try:
+            response = SavingGoalService.http.delete("/goals/goal_id", params={"goal_id": goal_id})
+            response.raise_for_status()
+            return response.json()
+        finally:
+            # Drops a goal a concurrent read fetched before the deletion and stored since
+            SavingGoalService.cache.invalidate(goal_id)
@@ -0,0 +1,209 @@
+"""
+Username -> user row cache shared by every worker process on the host.
+
+Each process keeps the rows it has read in a local LRU. Their validity is decided by a table
+of generation numbers in a memory-mapped file that all the processes map: every committed
+change to a user increments the generation of that user's slot, and a cached row is only
+served while its slot still holds the generation read before the row was loaded. A hit is
+therefore a dictionary lookup and an 8-byte read, without a database round trip.
+
+Writers register the users they change with `invalidate_on_commit`; the generations are
+incremented once the transaction commits, so that no reader can cache a row older than the
+generation it stores. `UserVersionService.bump` registers the user itself, which covers
+every goal change. Changes made outside the API (a manual SQL update, a restored backup)
+are only picked up after USER_CACHE_TTL.
+"""
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Iterable, Optional
+
+from sqlalchemy import event
+
+from metrics import user_cache_lookups
+from models import Session
+from models.user_info import UserInfo
+
+# Cache settings, all overridable through the environment
+USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND", "shared")  # shared or none
+USER_CACHE_MAX_ENTRIES = int(os.environ.get("USER_CACHE_MAX_ENTRIES", "4096"))
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+USER_CACHE_PATH = os.environ.get("USER_CACHE_PATH", "cache/user_generations.bin")
+USER_CACHE_SLOTS = int(os.environ.get("USER_CACHE_SLOTS", "65536"))  # Users sharing a slot invalidate each other
+
+# The cached columns of a user; the password hash is deliberately left out
+CachedUser = namedtuple("CachedUser", ["id", "username", "salary", "created_at", "version"])
+
+_GENERATION = struct.Struct("=Q")
+_PENDING_KEY = "user_cache_pending"
+
+
+class GenerationTable:
+    """
+    Array of 64-bit generation numbers in a file mapped by every process on the host: one per
+    slot of users, preceded by a global one incremented along with any slot.
+    Reads are lock-free; increments hold an exclusive lock on the file.
+    """
+
+    def __init__(self, path: str, slots: int):
+        self.path = path
+        self.slots = slots
+        self._map: Optional[mmap.mmap] = None
+        self._fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        """
+        Closes the mapping, so that the current process opens the file again. Used after a fork:
+        the inherited descriptor would share its `flock` with the parent's.
+        """
+        if self._map is not None:
+            self._map.close()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._map = None
+        self._fd = None
+        self._lock = threading.Lock()
+
+    def _mapped(self) -> mmap.mmap:
+        if self._map is None:
+            with self._lock:
+                if self._map is None:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    size = (self.slots + 1) * _GENERATION.size
+                    fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                    if os.fstat(fd).st_size < size:
+                        os.ftruncate(fd, size)  # New bytes read as zero, and growing is idempotent
+                    self._fd = fd
+                    # A shared mapping stays shared with processes forked afterwards
+                    self._map = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        return self._map
+
+    def slot(self, user_id: int) -> int:
+        return (1 + user_id % self.slots) * _GENERATION.size
+
+    def get(self, user_id: int) -> int:
+        return _GENERATION.unpack_from(self._mapped(), self.slot(user_id))[0]
+
+    def get_global(self) -> int:
+        return _GENERATION.unpack_from(self._mapped(), 0)[0]
+
+    def increment(self, user_ids: Iterable[int]) -> None:
+        table = self._mapped()
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            for offset in {0} | {self.slot(user_id) for user_id in user_ids}:
+                _GENERATION.pack_into(table, offset, _GENERATION.unpack_from(table, offset)[0] + 1)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class UserCache:
+    """
+    Per-process LRU of user rows, validated against a shared GenerationTable.
+    """
+
+    def __init__(self, generations: Optional[GenerationTable], max_entries: int, ttl: float):
+        self.generations = generations
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session, username: str) -> Optional[CachedUser]:
+        """
+        Returns the user row of `username`, loading it with `session` on a miss, or None if the user does not exist.
+        Unknown usernames are not cached. Call it before any other read of the transaction, so that a
+        loaded row is never older than the generations read just before it.
+        """
+        if self.generations is None:
+            return self.load(session, username)
+
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is not None:
+                self._entries.move_to_end(username)
+        if entry is not None:
+            expires_at, generation, user = entry
+            if expires_at > time.monotonic() and self.generations.get(user.id) == generation:
+                user_cache_lookups.labels("hit").inc()
+                return user
+            self.discard(username)
+        user_cache_lookups.labels("miss").inc()
+
+        # The user's slot is only known after the load, so the global generation is read before it:
+        # if any change was committed in the meantime the row may be older than its slot's
+        # generation, and it is returned without being cached
+        before = self.generations.get_global()
+        user = self.load(session, username)
+        if user is not None:
+            generation = self.generations.get(user.id)
+            if self.generations.get_global() == before:
+                self.put(username, generation, user)
+        return user
+
+    @staticmethod
+    def load(session, username: str) -> Optional[CachedUser]:
+        row = session.query(UserInfo.id, UserInfo.username, UserInfo.salary, UserInfo.created_at,
+                            UserInfo.version).filter(UserInfo.username == username).first()
+        return CachedUser(*row) if row else None
+
+    def put(self, username: str, generation: int, user: CachedUser) -> None:
+        with self._lock:
+            self._entries[username] = (time.monotonic() + self.ttl, generation, user)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, username: str) -> None:
+        with self._lock:
+            self._entries.pop(username, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate_on_commit(self, session, user_id: int) -> None:
+        """
+        Marks the cached row of `user_id` as stale in every process once `session` commits.
+        """
+        session.info.setdefault(_PENDING_KEY, set()).add(user_id)
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        if self.generations is not None:
+            self.generations.increment(user_ids)
+
+
+def create_user_cache(name: str = USER_CACHE_BACKEND) -> UserCache:
+    """
+    Builds the user cache selected by `name`.
+    """
+    if name == "shared":
+        return UserCache(GenerationTable(USER_CACHE_PATH, USER_CACHE_SLOTS), USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL)
+    if name == "none":
+        return UserCache(None, 0, 0)
+    raise ValueError(f"Unknown user cache backend '{name}'.")
+
+
+user_cache = create_user_cache()
+
+if user_cache.generations is not None:
+    os.register_at_fork(after_in_child=user_cache.generations.reset)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session) -> None:
+    user_ids = session.info.pop(_PENDING_KEY, None)
+    if user_ids:
+        user_cache.invalidate(user_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,56 @@
+from typing import List
+
+from sqlalchemy import exists
+
+from models.user_goal import UserGoal
+
+
+class UserGoalService:
+    """
+    Service class for the links between users and their saving goals.
+    Every method is a single indexed statement inside the caller's session.
+    """
+
+    @staticmethod
+    def has_goal(session, user_id: int, goal_id: int) -> bool:
+        """
+        Checks whether the goal belongs to the user.
+        """
+        return session.query(
+            exists().where(UserGoal.user_id == user_id, UserGoal.goal_id == goal_id)
+        ).scalar()
+
+    @staticmethod
+    def add_goal(session, user_id: int, goal_id: int) -> UserGoal:
+        """
+        Links the goal to the user.
+        """
+        user_goal = UserGoal(user_id=user_id, goal_id=goal_id)
+        session.add(user_goal)
+        return user_goal
+
+    @staticmethod
+    def remove_goal(session, user_id: int, goal_id: int) -> bool:
+        """
+        Unlinks the goal from the user. Returns False if the link did not exist.
+        """
+        deleted = session.query(UserGoal).filter(
+            UserGoal.user_id == user_id, UserGoal.goal_id == goal_id
+        ).delete(synchronize_session=False)
+        return deleted > 0
+
+    @staticmethod
+    def remove_all(session, user_id: int) -> None:
+        """
+        Unlinks every goal from the user.
+        """
+        session.query(UserGoal).filter(UserGoal.user_id == user_id).delete(synchronize_session=False)
+
+    @staticmethod
+    def goal_ids(session, user_id: int) -> List[int]:
+        """
+        Returns the IDs of the user's goals, in the order they were added.
+        """
+        rows = session.query(UserGoal.goal_id).filter(UserGoal.user_id == user_id).order_by(
+            UserGoal.created_at, UserGoal.goal_id)
+        return [goal_id for (goal_id,) in rows]
@@ -0,0 +1,202 @@
+import csv
+import json
+import os
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from sqlalchemy.exc import IntegrityError
+
+from logger import logger
+from models import Session
+from models.user_info import UserInfo
+from services.auth import AuthService
+
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get("BULK_IMPORT_BATCH_SIZE", "500"))
+BULK_IMPORT_MAX_BATCH_SIZE = int(os.environ.get("BULK_IMPORT_MAX_BATCH_SIZE", "5000"))
+
+# A parsed input row: (line number, fields) or (line number, error message)
+ParsedRow = Tuple[int, Any]
+
+
+def iter_lines(stream) -> Iterator[str]:
+    """
+    Decodes a binary stream line by line. Only `readline` is required, since the WSGI input
+    handed over by gunicorn is not a full `io` object and cannot be wrapped in a TextIOWrapper.
+    """
+    for line in iter(stream.readline, b""):
+        yield line.decode("utf-8")
+
+
+def parse_ndjson(stream) -> Iterator[ParsedRow]:
+    """
+    Reads one JSON object per line from a binary stream, without buffering the whole body.
+    """
+    for line_number, line in enumerate(iter_lines(stream), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            fields = json.loads(line)
+        except ValueError as e:
+            yield line_number, f"Invalid JSON: {str(e)}"
+            continue
+        yield line_number, fields if isinstance(fields, dict) else "Expected a JSON object."
+
+
+def parse_csv(stream) -> Iterator[ParsedRow]:
+    """
+    Reads CSV rows with a `username,password[,salary]` header from a binary stream.
+    """
+    reader = csv.DictReader(iter_lines(stream))
+    for fields in reader:
+        yield reader.line_num, fields
+
+
+def validate_row(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns the insertable values of an input row, or raises ValueError.
+    """
+    username = (fields.get("username") or "").strip()
+    password = fields.get("password") or ""
+    if not username or not password:
+        raise ValueError("Both 'username' and 'password' are required.")
+    if len(username) > 100:
+        raise ValueError("Username is longer than 100 characters.")
+    salary = fields.get("salary")
+    salary = round(float(salary), 2) if salary not in (None, "") else 0.0
+    return {"username": username, "password": password, "salary": salary}
+
+
+class UserImportService:
+    """
+    Service class for importing users in bulk from a streamed request body.
+    """
+
+    @staticmethod
+    def import_users(rows: Iterable[ParsedRow], batch_size: int = BULK_IMPORT_BATCH_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        Inserts users batch by batch, one transaction per batch, and yields one result per batch
+        followed by a summary. Only one batch is held in memory at a time.
+        """
+        batch_size = max(1, min(batch_size, BULK_IMPORT_MAX_BATCH_SIZE))
+        rows = iter(rows)
+        totals = {"inserted": 0, "conflicts": 0, "errors": 0}
+        batch_number = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            batch_number += 1
+            result = UserImportService.import_batch(batch)
+            result["batch"] = batch_number
+            totals["inserted"] += result["inserted"]
+            totals["conflicts"] += len(result["conflicts"])
+            totals["errors"] += len(result["errors"])
+            yield result
+
+        logger.info("Bulk import finished: %s", totals)
+        yield {"summary": totals}
+
+    @staticmethod
+    def import_batch(batch: List[ParsedRow]) -> Dict[str, Any]:
+        """
+        Validates, hashes and inserts one batch with a single multi-row INSERT.
+        Duplicate usernames are reported per row and never abort the batch.
+        """
+        conflicts, errors = [], []
+        candidates: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        for line_number, fields in batch:
+            if isinstance(fields, str):
+                errors.append({"line": line_number, "message": fields})
+                continue
+            try:
+                values = validate_row(fields)
+            except (ValueError, TypeError) as e:
+                errors.append({"line": line_number, "message": str(e)})
+                continue
+            if values["username"] in candidates:
+                conflicts.append({"line": line_number, "username": values["username"],
+                                  "message": "Username repeated in the upload."})
+                continue
+            candidates[values["username"]] = (line_number, values)
+
+        inserted = 0
+        session = None
+        try:
+            session = Session()
+            existing = {username for (username,) in session.query(UserInfo.username).filter(
+                UserInfo.username.in_(list(candidates)))} if candidates else set()
+            for username in existing:
+                line_number, _ = candidates.pop(username)
+                conflicts.append({"line": line_number, "username": username,
+                                  "message": "User with the same username already exists in the database."})
+
+            if candidates:
+                values = [row for _, row in candidates.values()]
+                hashes = AuthService.hash_passwords([row["password"] for row in values])
+                for row, password_hash in zip(values, hashes):
+                    row["password"] = password_hash
+                try:
+                    session.execute(UserInfo.__table__.insert(), values)
+                    session.commit()
+                    inserted = len(values)
+                except IntegrityError:
+                    # A concurrent request took some of the usernames: insert row by row to find them
+                    session.rollback()
+                    inserted = UserImportService.insert_one_by_one(session, candidates, conflicts)
+
+        except Exception as e:
+            if session:
+                session.rollback()
+            logger.warning("Error importing a batch of %s users: %s", len(batch), e)
+            errors.extend({"line": line_number, "message": "Could not save the user info."}
+                          for line_number, _ in candidates.values())
+            inserted = 0
+
+        finally:
+            if session:
+                session.close()
+
+        conflicts.sort(key=lambda conflict: conflict["line"])
+        return {"inserted": inserted, "conflicts": conflicts, "errors": errors}
+
+    @staticmethod
+    def insert_one_by_one(session, candidates: Dict[str, Tuple[int, Dict[str, Any]]], conflicts: list) -> int:
+        """
+        Inserts the candidates in one transaction, one statement each, skipping taken usernames.
+        Dialects without a conflict-tolerant INSERT get a savepoint per row instead.
+        """
+        statement = insert_ignoring_conflicts(session)
+        inserted = 0
+        for username, (line_number, row) in candidates.items():
+            if statement is not None:
+                added = session.execute(statement, row).rowcount
+            else:
+                try:
+                    with session.begin_nested():
+                        session.execute(UserInfo.__table__.insert(), row)
+                    added = 1
+                except IntegrityError:
+                    added = 0
+            if added:
+                inserted += 1
+            else:
+                conflicts.append({"line": line_number, "username": username,
+                                  "message": "User with the same username already exists in the database."})
+        session.commit()
+        return inserted
+
+
+def insert_ignoring_conflicts(session):
+    """
+    Returns an INSERT into user_info that does nothing when the username is already taken,
+    or None when the database dialect has no such statement.
+    """
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        return None
+    return insert(UserInfo.__table__).on_conflict_do_nothing(index_elements=["username"])
@@ -1,13 +1,35 @@
-from typing import List
+from typing import List, Optional
 
+from sqlalchemy import text
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.orm.attributes import flag_modified
 from logger import logger
 from models import Session
 from models.user_info import UserInfo
 from schemas.user_info import UserInfoSchema, UserInfoUpdateUsernameSchema, UserInfoUpdateSalarySchema, \
-    SavingGoalSchema, SavingGoalViewSchema, UserInfoSavingGoalSchema
+    SavingGoalSchema, user_info_saving_goal_adapter
 from services import SavingGoalService
+from services.auth import AuthService
+from services.goal_outbox import GoalOutboxService, goal_outbox_worker
+from services.goal_projection import GoalProjectionService, GOAL_READ_SOURCE
+from services.user_cache import user_cache
+from services.user_goal import UserGoalService
+from services.user_version import UserVersionService, etag_matches, make_etag
+
+# Single-statement writes: the WHERE clause finds the user and RETURNING hands back the row,
+# so each mutation takes one round trip. SQLAlchemy 1.4 only compiles RETURNING for a few
+# backends, hence the text statements; SQLite supports it since 3.35.
+_USER_COLUMNS = (UserInfo.__table__.c.id, UserInfo.__table__.c.username, UserInfo.__table__.c.salary,
+                 UserInfo.__table__.c.created_at)
+UPDATE_USERNAME = text(
+    "UPDATE user_info SET username = :new_username, version = version + 1 "
+    "WHERE username = :username RETURNING id, username, salary, created_at"
+).columns(*_USER_COLUMNS)
+UPDATE_SALARY = text(
+    "UPDATE user_info SET salary = :salary, version = version + 1, "
+    "savings_ratio = CASE WHEN :salary > 0 THEN total_savings / :salary END "
+    "WHERE username = :username RETURNING id, username, salary, created_at"
+).columns(*_USER_COLUMNS)
+DELETE_USER = text("DELETE FROM user_info WHERE username = :username RETURNING id").columns(UserInfo.__table__.c.id)
 
 
 class UserInfoService:
@@ -22,10 +44,10 @@ class UserInfoService:
         Creates a new user in the database.
         Returns user data or an error message if it fails.
         """
-        logger.info(f"Adding saving goal with name: '{user_info.username}'")
+        logger.info("Adding saving goal with name: '%s'", user_info.username)
         user_info = UserInfo(
             username=user_info.username,
-            password=user_info.password,
+            password=AuthService.hash_password(user_info.password),
             salary=0.0,
         )
 
@@ -40,12 +62,12 @@ class UserInfoService:
         except IntegrityError:
             session.rollback()
             error_msg = "User with the same username already exists in the database."
-            logger.warning(f"Error adding user info '{user_info.username}', {error_msg}")
+            logger.warning("Error adding user info '%s', %s", user_info.username, error_msg)
             return {"message": error_msg}, 409
 
         except Exception as e:
             error_msg = "Could not save the new user info."
-            logger.warning(f"Error adding user info '{user_info.username}', {error_msg}: {str(e)}")
+            logger.warning("Error adding user info '%s', %s: %s", user_info.username, error_msg, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -53,58 +75,75 @@ class UserInfoService:
                 session.close()
 
     @staticmethod
-    def get_user_information(username: str):
+    def get_user_information(username: str, if_none_match: Optional[str] = None):
         """
         Return the user information with goals using the Secondary API.
+        Answers 304 from the user's version alone when `if_none_match` holds the current ETag.
         """
         session = None
         try:
             session = Session()
 
-            # Find the user information by username
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            if if_none_match:
+                current = UserVersionService.lookup(session, username)
+                if current and etag_matches(if_none_match, make_etag(*current)):
+                    return "", 304, {"ETag": make_etag(*current), "Cache-Control": "no-cache"}
+
+            # Find the user information and its projected goals by username
+            if GOAL_READ_SOURCE == "projection":
+                user_info, goal_ids, projections = GoalProjectionService.load_user_with_goals(session, username)
+            else:
+                user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+                goal_ids = UserGoalService.goal_ids(session, user_info.id) if user_info else []
+                projections = {}
 
             if not user_info:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            saving_goals: List[SavingGoalViewSchema] = []
-            total_savings: float = 0.0
-            for goal_id in user_info.goal_ids:
-                saving_goal_data = SavingGoalService.get_saving_goal_by_id(goal_id)
+            # Only goals without a local projection are fetched from the secondary API. The read
+            # stores nothing: the backfill job projects them (services.reconciliation.backfill_missing)
+            goals_by_id = {goal_id: projection.to_dict() for goal_id, projection in projections.items()}
+            missing_ids = [goal_id for goal_id in goal_ids if goal_id not in goals_by_id]
+            if missing_ids:
+                fetched = SavingGoalService.get_saving_goals_by_ids(missing_ids)
+                goals_by_id.update({goal["id"]: goal for goal in fetched if goal})
 
+            saving_goals: List[dict] = []
+            skipped_goals: List[int] = []
+            total_savings: float = 0.0
+            for goal_id in goal_ids:
+                saving_goal_data = goals_by_id.get(goal_id)
                 if not saving_goal_data:
-                    logger.warning(f"Saving goal with ID {goal_id} not found.")
+                    # Failed, timed out or short-circuited: reported instead of silently dropped
+                    skipped_goals.append(goal_id)
                     continue
 
                 total_savings += saving_goal_data["monthly_savings"]
-                saving_goal_instance = SavingGoalViewSchema(
-                    id=saving_goal_data["id"],
-                    goal_name=saving_goal_data["goal_name"],
-                    goal_currency=saving_goal_data["goal_currency"],
-                    goal_value=saving_goal_data["goal_value"],
-                    monthly_savings=saving_goal_data["monthly_savings"],
-                    converted_value=saving_goal_data["converted_value"],
-                    created_at=saving_goal_data["created_at"],
-                )
-                saving_goals.append(saving_goal_instance)
-
-            user_info_goal_instance = UserInfoSavingGoalSchema(
-                username=user_info.username,
-                password=user_info.password,
-                goals=saving_goals,
-                salary=user_info.salary,
-                total_savings=total_savings,
-                created_at=user_info.created_at,
-            )
-
-            logger.info(f"{username}")
-            return user_info_goal_instance.model_dump(), 200
+                saving_goals.append(saving_goal_data)
+
+            # Validated into plain dicts by a prebuilt adapter, with the same rules and output
+            # as UserInfoSavingGoalSchema(...).model_dump(), without building model instances
+            user_info_goal_data = {
+                "username": user_info.username,
+                "goals": saving_goals,
+                "salary": user_info.salary,
+                "total_savings": total_savings,
+                "created_at": user_info.created_at,
+                "skipped_goals": skipped_goals or None,
+            }
+            response = user_info_saving_goal_adapter.validate_python(user_info_goal_data)
+            if skipped_goals:
+                # A partial profile must not be cached by the client, so it gets no ETag
+                logger.warning("User information for %s returned without goals %s", username, skipped_goals)
+                return response, 200
+            logger.info("User information retrieved for %s", username)
+            return response, 200, {"ETag": make_etag(user_info.id, user_info.version), "Cache-Control": "no-cache"}
 
         except Exception as e:
             error_msg = f"Could not {username}."
-            logger.warning(f"Error {username}: {str(e)}")
+            logger.warning("Error %s: %s", username, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -116,30 +155,33 @@ class UserInfoService:
         """
         Deletes a specific user by its username.
         """
-        logger.info(f"Deleting saving goal with ID: '{username}'")
+        logger.info("Deleting saving goal with ID: '%s'", username)
 
         session = None
         try:
             session = Session()
 
-            # Find the user by its username
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_id = session.execute(DELETE_USER, {"username": username}).scalar()
 
-            if not user_info:
+            if user_id is None:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            # Delete the user
-            session.delete(user_info)
+            # Delete its goal links, the local projections of its goals and its pending goals,
+            # for databases that do not enforce the ON DELETE CASCADE of the foreign keys
+            GoalProjectionService.remove_for_user(session, user_id)
+            UserGoalService.remove_all(session, user_id)
+            GoalOutboxService.remove_for_user(session, user_id)
+            user_cache.invalidate_on_commit(session, user_id)
             session.commit()
-            logger.info(f"User with username {username} deleted successfully")
+            logger.info("User with username %s deleted successfully", username)
 
             return {"message": f"User with username {username} deleted successfully"}, 200
 
         except Exception as e:
             error_msg = f"Error deleting user with username {username}."
-            logger.error(f"{error_msg}: {str(e)}")
+            logger.error("%s: %s", error_msg, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -153,37 +195,34 @@ class UserInfoService:
         Returns updated user data or an error message.
         """
         new_username = update_username.new_username
-        logger.info(f"Updating username with username: '{username}'")
+        logger.info("Updating username with username: '%s'", username)
 
         session = None
         try:
             session = Session()
 
-            # Find the user information by username
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            # Rename and bump the version in one statement; a taken username fails on the unique constraint
+            row = session.execute(UPDATE_USERNAME, {"username": username, "new_username": new_username}).first()
 
-            if not user_info:
+            if row is None:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            # Check if the new username already exists
-            existing_user = session.query(UserInfo).filter(UserInfo.username == new_username).first()
-            if existing_user:
-                error_msg = f"User with username {new_username} already exists."
-                logger.warning(error_msg)
-                return {"message": error_msg}, 409
-
-            # Update the username
-            user_info.username = new_username
-
+            user_cache.invalidate_on_commit(session, row.id)
             session.commit()
-            logger.info(f"Username for user with username {username} updated successfully to {new_username}")
-            return user_info.to_dict(), 200
+            logger.info("Username for user with username %s updated successfully to %s", username, new_username)
+            return UserInfo.row_to_dict(row, UserGoalService.goal_ids(session, row.id)), 200
+
+        except IntegrityError:
+            session.rollback()
+            error_msg = f"User with username {new_username} already exists."
+            logger.warning(error_msg)
+            return {"message": error_msg}, 409
 
         except Exception as e:
             error_msg = f"Could not update username for user with username {username}."
-            logger.warning(f"Error updating username for user with username {username}: {str(e)}")
+            logger.warning("Error updating username for user with username %s: %s", username, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -197,29 +236,27 @@ class UserInfoService:
         Returns updated user data or an error message.
         """
         new_salary = round(update_salary.new_salary, 2)
-        logger.info(f"Updating salary with username: '{username}'")
+        logger.info("Updating salary with username: '%s'", username)
 
         session = None
         try:
             session = Session()
 
-            # Find the username by username
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            row = session.execute(UPDATE_SALARY, {"username": username, "salary": new_salary}).first()
 
-            if not user_info:
+            if row is None:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            # Update the salary
-            user_info.salary = new_salary
+            user_cache.invalidate_on_commit(session, row.id)
             session.commit()
-            logger.info(f"Salary for user with username {username} updated successfully to {new_salary}")
-            return user_info.to_dict(), 200
+            logger.info("Salary for user with username %s updated successfully to %s", username, new_salary)
+            return UserInfo.row_to_dict(row, UserGoalService.goal_ids(session, row.id)), 200
 
         except Exception as e:
             error_msg = f"Could not update salary for user with username {username}."
-            logger.warning(f"Error updating salary for user with username {username}: {str(e)}")
+            logger.warning("Error updating salary for user with username %s: %s", username, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -234,22 +271,18 @@ class UserInfoService:
         """
         goal_data = saving_goal.model_dump()
         goal_data['goal_currency'] = goal_data['goal_currency'].value
-        logger.info(f"goal_data: {goal_data}")
-        logger.info(f"Adding saving goal for user: {username}")
+        logger.info("Adding saving goal for user: %s", username)
 
         session = None
         try:
             session = Session()
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_info = user_cache.get(session, username)
 
             if not user_info:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            if user_info.goal_ids is None:
-                user_info.goal_ids = []
-
             goal_instance = SavingGoalSchema(**goal_data)
             secondary_api_response = SavingGoalService.post_saving_goal(goal_instance)
             if not secondary_api_response:
@@ -259,17 +292,17 @@ class UserInfoService:
             if not goal_id:
                 return {"message": "Goal ID not found in the response."}, 400
 
-            user_info.goal_ids.append(goal_id)
-            logger.info(f"user_info: {user_info}")
-            flag_modified(user_info, "goal_ids")  # Forces SQLAlchemy to detect the change
+            UserGoalService.add_goal(session, user_info.id, goal_id)
+            GoalProjectionService.save(session, user_info.id, secondary_api_response)
+            UserVersionService.bump(session, user_info.id)
             session.commit()
-            logger.info(f"Goal with ID {goal_id} added to user with username {username} successfully")
+            logger.info("Goal with ID %s added to user with username %s successfully", goal_id, username)
 
-            return user_info.to_dict(), 200
+            return UserInfo.row_to_dict(user_info, UserGoalService.goal_ids(session, user_info.id)), 200
 
         except Exception as e:
             error_msg = f"Could not add saving goal for user with username {username}."
-            logger.warning(f"Error adding saving goal for user with username {username}: {str(e)}")
+            logger.warning("Error adding saving goal for user with username %s: %s", username, e)
             return {"message": error_msg}, 400
 
         finally:
@@ -278,40 +311,126 @@ class UserInfoService:
 
 
     @staticmethod
-    def get_goal_for_user(username: str, goal_id: int):
+    def post_goal_for_user_async(username: str, saving_goal: SavingGoalSchema):
+        """
+        Accepts a saving goal for asynchronous creation in the secondary API.
+        Writes the pending goal and its outbox entry in one local transaction and returns
+        202 with the status URL; the goal outbox worker creates the goal afterwards.
+        """
+        goal_data = saving_goal.model_dump()
+        goal_data['goal_currency'] = goal_data['goal_currency'].value
+        logger.info("Queueing saving goal for user: %s", username)
+
+        session = None
+        try:
+            session = Session()
+            user = UserVersionService.lookup(session, username)
+
+            if not user:
+                error_msg = f"User with username {username} not found."
+                logger.warning(error_msg)
+                return {"message": error_msg}, 404
+
+            pending_goal = GoalOutboxService.enqueue(session, user[0], goal_data)
+            session.commit()
+            goal_outbox_worker.notify()
+            logger.info("Saving goal queued as pending goal %s for user %s", pending_goal.id, username)
+
+            response = UserInfoService.pending_goal_view(username, pending_goal)
+            return response, 202, {"Location": response["status_url"]}
+
+        except Exception as e:
+            error_msg = f"Could not add saving goal for user with username {username}."
+            logger.warning("Error queueing saving goal for user with username %s: %s", username, e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
+
+    @staticmethod
+    def get_pending_goal_for_user(username: str, pending_goal_id: int):
+        """
+        Returns the status of an asynchronous goal creation.
+        """
+        session = None
+        try:
+            session = Session()
+            user = UserVersionService.lookup(session, username)
+            pending_goal = GoalOutboxService.get(session, user[0], pending_goal_id) if user else None
+
+            if not pending_goal:
+                error_msg = f"Goal request {pending_goal_id} not found for user {username}."
+                logger.warning(error_msg)
+                return {"message": error_msg}, 404
+
+            return UserInfoService.pending_goal_view(username, pending_goal), 200
+
+        except Exception as e:
+            error_msg = f"Could not get goal request {pending_goal_id} for user {username}."
+            logger.warning("%s: %s", error_msg, e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
+
+    @staticmethod
+    def pending_goal_view(username: str, pending_goal) -> dict:
+        """
+        Builds the status of a pending goal, with the URLs to poll it and, once created, to get the goal.
+        """
+        response = pending_goal.to_dict()
+        response["status_url"] = f"/users/{username}/goal-requests/{pending_goal.id}"
+        if pending_goal.goal_id is not None:
+            response["goal_url"] = f"/users/{username}/goal/{pending_goal.goal_id}"
+        return response
+
+    @staticmethod
+    def get_goal_for_user(username: str, goal_id: int, if_none_match: Optional[str] = None):
         """
         Retrieves a specific saving goal for a user using the secondary API.
+        Answers 304 from the user's version and the goal link alone when `if_none_match` holds the current ETag.
         """
-        logger.info(f"Fetching goal with ID {goal_id} for user {username}")
+        logger.info("Fetching goal with ID %s for user %s", goal_id, username)
 
         session = None
         try:
             session = Session()
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_info = user_cache.get(session, username)
 
             if not user_info:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            if not user_info.goal_ids or goal_id not in user_info.goal_ids:
+            # Checked before the conditional, so that no ETag answers for a goal of another user
+            if not UserGoalService.has_goal(session, user_info.id, goal_id):
                 error_msg = f"Goal ID {goal_id} not found for user {username}."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            goal_data = SavingGoalService.get_saving_goal_by_id(goal_id)
+            etag = make_etag(user_info.id, user_info.version, goal_id)
+            if etag_matches(if_none_match, etag):
+                return "", 304, {"ETag": etag, "Cache-Control": "no-cache"}
+
+            projection = GoalProjectionService.get(session, goal_id) if GOAL_READ_SOURCE == "projection" else None
+            if projection:
+                goal_data = projection.to_dict()
+            else:
+                goal_data = SavingGoalService.get_saving_goal_by_id(goal_id)
 
             if not goal_data:
                 error_msg = f"Goal ID {goal_id} not found in secondary API."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            logger.info(f"Goal retrieved successfully for user {username}: {goal_data}")
-            return goal_data, 200
+            logger.info("Goal retrieved successfully for user %s", username)
+            return goal_data, 200, {"ETag": etag, "Cache-Control": "no-cache"}
 
         except Exception as e:
             error_msg = f"Could not retrieve goal with ID {goal_id} for user {username}."
-            logger.warning(f"Error fetching goal: {str(e)}")
+            logger.warning("Error fetching goal: %s", e)
             return {"message": error_msg}, 400
 
         finally:
@@ -322,21 +441,21 @@ class UserInfoService:
     def delete_goal_for_user(username: str, goal_id: int):
         """
         Deletes a specific saving goal for a user.
-        This removes the reference from the user's `goal_ids` and deletes the goal in the secondary API.
+        This removes the link between the user and the goal and deletes the goal in the secondary API.
         """
-        logger.info(f"Deleting goal with ID {goal_id} for user {username}")
+        logger.info("Deleting goal with ID %s for user %s", goal_id, username)
 
         session = None
         try:
             session = Session()
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_info = user_cache.get(session, username)
 
             if not user_info:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            if not user_info.goal_ids or goal_id not in user_info.goal_ids:
+            if not UserGoalService.has_goal(session, user_info.id, goal_id):
                 error_msg = f"Goal ID {goal_id} not found for user {username}."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
@@ -347,16 +466,17 @@ class UserInfoService:
                 return {"message": "Failed to delete goal in secondary API."}, 400
 
             # Remove goal from user's list and update in DB
-            user_info.goal_ids.remove(goal_id)
-            flag_modified(user_info, "goal_ids")  # Forces SQLAlchemy to detect the change
+            UserGoalService.remove_goal(session, user_info.id, goal_id)
+            GoalProjectionService.remove(session, goal_id)
+            UserVersionService.bump(session, user_info.id)
             session.commit()
 
-            logger.info(f"Goal with ID {goal_id} deleted successfully for user {username}")
+            logger.info("Goal with ID %s deleted successfully for user %s", goal_id, username)
             return {"message": f"Goal {goal_id} deleted successfully."}, 200
 
         except Exception as e:
             error_msg = f"Could not delete goal with ID {goal_id} for user {username}."
-            logger.warning(f"Error deleting goal: {str(e)}")
+            logger.warning("Error deleting goal: %s", e)
             return {"message": error_msg}, 400
 
         finally:
@@ -371,19 +491,19 @@ class UserInfoService:
         """
         goal_data = goal.model_dump()
         goal_data['goal_currency'] = goal_data['goal_currency'].value
-        logger.info(f"Updating goal with ID {goal_id} for user {username} with data: {goal_data}")
+        logger.info("Updating goal with ID %s for user %s", goal_id, username)
 
         session = None
         try:
             session = Session()
-            user_info = session.query(UserInfo).filter(UserInfo.username == username).first()
+            user_info = user_cache.get(session, username)
 
             if not user_info:
                 error_msg = f"User with username {username} not found."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
 
-            if not user_info.goal_ids or goal_id not in user_info.goal_ids:
+            if not UserGoalService.has_goal(session, user_info.id, goal_id):
                 error_msg = f"Goal ID {goal_id} not found for user {username}."
                 logger.warning(error_msg)
                 return {"message": error_msg}, 404
@@ -393,12 +513,16 @@ class UserInfoService:
             if not secondary_api_response:
                 return {"message": "Failed to update goal in secondary API."}, 400
 
-            logger.info(f"Goal with ID {goal_id} updated successfully for user {username}")
+            GoalProjectionService.save(session, user_info.id, secondary_api_response)
+            UserVersionService.bump(session, user_info.id)
+            session.commit()
+
+            logger.info("Goal with ID %s updated successfully for user %s", goal_id, username)
             return secondary_api_response, 200
 
         except Exception as e:
             error_msg = f"Could not update goal with ID {goal_id} for user {username}."
-            logger.warning(f"Error updating goal: {str(e)}")
+            logger.warning("Error updating goal: %s", e)
             return {"message": error_msg}, 400
 
         finally:
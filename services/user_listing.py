@@ -0,0 +1,128 @@
+import base64
+import hmac
+import json
+import os
+from typing import Any, Dict, Iterator, Optional
+
+from flask import request
+from sqlalchemy import select
+
+from logger import logger
+from models import Session
+from models.user_info import UserInfo
+from schemas.user_info import UserInfoListQuerySchema
+
+USER_LIST_MAX_LIMIT = 500
+USER_LIST_STREAM_CHUNK = 1000
+# The listing shows every user's salary, so it only answers requests carrying this secret
+USER_LIST_SECRET = os.environ.get("USER_LIST_SECRET", "")
+USER_LIST_HEADER = "X-Admin-Token"
+
+_columns = (UserInfo.id, UserInfo.username, UserInfo.salary, UserInfo.created_at)
+
+
+def encode_cursor(last_id: int) -> str:
+    """
+    Encodes the position after the user `last_id` as an opaque cursor token.
+    """
+    return base64.urlsafe_b64encode(json.dumps({"after": last_id}).encode()).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> int:
+    """
+    Returns the user ID a cursor token points after, or raises ValueError.
+    """
+    if not cursor:
+        return 0
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(payload["after"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor.") from e
+
+
+def has_admin_token() -> bool:
+    token = request.headers.get(USER_LIST_HEADER)
+    return bool(USER_LIST_SECRET and token and hmac.compare_digest(token, USER_LIST_SECRET))
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "username": row.username,
+        "salary": row.salary,
+        "created_at": row.created_at.strftime("%Y-%m-%d %H:%M:%S") if row.created_at else None,
+    }
+
+
+def build_query(query: UserInfoListQuerySchema, after_id: int):
+    """
+    Builds the keyset query: users after `after_id` matching the filters, ordered by ID.
+    The primary key seek keeps the cost of a page independent of its position in the table.
+    A narrow salary or creation date range is read from its (salary, id) or (created_at, id)
+    index instead, then sorted; a page of a wide range that matches few rows per ID still
+    scans the rows between its matches, so its cost grows with the sparseness of the filter.
+    """
+    statement = select(*_columns).where(UserInfo.id > after_id).order_by(UserInfo.id)
+    if query.min_salary is not None:
+        statement = statement.where(UserInfo.salary >= query.min_salary)
+    if query.max_salary is not None:
+        statement = statement.where(UserInfo.salary <= query.max_salary)
+    if query.created_after is not None:
+        statement = statement.where(UserInfo.created_at >= query.created_after)
+    if query.created_before is not None:
+        statement = statement.where(UserInfo.created_at < query.created_before)
+    return statement
+
+
+class UserListingService:
+    """
+    Service class for listing users page by page or as a stream.
+    """
+
+    @staticmethod
+    def list_users(query: UserInfoListQuerySchema):
+        """
+        Returns one page of users and the cursor of the next page.
+        """
+        try:
+            after_id = decode_cursor(query.cursor)
+        except ValueError as e:
+            return {"message": str(e)}, 400
+        limit = max(1, min(query.limit, USER_LIST_MAX_LIMIT))
+
+        session = None
+        try:
+            session = Session()
+            # One extra row tells whether there is a next page
+            rows = session.execute(build_query(query, after_id).limit(limit + 1)).all()
+            users = [row_to_dict(row) for row in rows[:limit]]
+            next_cursor = encode_cursor(rows[limit - 1].id) if len(rows) > limit else None
+            return {"users": users, "next_cursor": next_cursor}, 200
+
+        except Exception as e:
+            error_msg = "Could not list users."
+            logger.warning("Error listing users: %s", e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
+
+    @staticmethod
+    def stream_users(query: UserInfoListQuerySchema) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every matching user after the cursor, fetched from a server-side cursor
+        in chunks so memory stays flat whatever the table size.
+        """
+        after_id = decode_cursor(query.cursor)
+        session = Session()
+        try:
+            result = session.execute(
+                build_query(query, after_id).execution_options(stream_results=True)
+            )
+            for partition in result.partitions(USER_LIST_STREAM_CHUNK):
+                for row in partition:
+                    yield row_to_dict(row)
+        finally:
+            session.close()
@@ -0,0 +1,98 @@
+from typing import NamedTuple, Optional
+
+from sqlalchemy import case
+
+from logger import logger
+from models import Session
+from models.user_info import UserInfo, months_to_goals, rebuild_aggregates, savings_ratio
+
+
+class GoalTotals(NamedTuple):
+    """
+    What one goal, or a set of goals, adds to its user's savings aggregates.
+    """
+    goal_count: int
+    total_savings: float
+    total_goal_value: float
+
+
+def goal_totals(projection) -> GoalTotals:
+    return GoalTotals(1, projection.monthly_savings, projection.converted_value)
+
+
+class UserSummaryService:
+    """
+    Service class for the savings aggregates stored on each user.
+    The aggregates follow the user's goal projections inside the caller's transaction, so they
+    never need the secondary API: updates and removals apply their difference, and inserts
+    recompute the user from its projections.
+    """
+
+    @staticmethod
+    def apply(session, user_id: int, before: Optional[GoalTotals], after: Optional[GoalTotals]) -> None:
+        """
+        Applies the change of one goal, from `before` to `after` (None when absent), to the user's aggregates.
+        """
+        before = before or GoalTotals(0, 0.0, 0.0)
+        after = after or GoalTotals(0, 0.0, 0.0)
+        delta = GoalTotals(*(new - old for new, old in zip(after, before)))
+        if not any(delta):
+            return
+
+        users = UserInfo.__table__
+        # Sums of floats drift, so they restart from exactly zero with the last goal
+        no_goals = users.c.goal_count + delta.goal_count == 0
+        total_savings = case((no_goals, 0.0), else_=users.c.total_savings + delta.total_savings)
+        total_goal_value = case((no_goals, 0.0), else_=users.c.total_goal_value + delta.total_goal_value)
+        session.execute(users.update().where(users.c.id == user_id).values(
+            goal_count=users.c.goal_count + delta.goal_count,
+            total_savings=total_savings,
+            total_goal_value=total_goal_value,
+            savings_ratio=savings_ratio(total_savings, users.c.salary),
+            months_to_goals=months_to_goals(total_goal_value, total_savings),
+        ))
+
+    @staticmethod
+    def rebuild(session, user_id: Optional[int] = None) -> int:
+        """
+        Recomputes the aggregates of one user, or of every user, from their goal projections,
+        discarding any drift. Returns the number of updated users.
+        """
+        return session.execute(rebuild_aggregates(user_id)).rowcount
+
+    @staticmethod
+    def get_user_summary(username: str):
+        """
+        Returns the savings aggregates of a user with a single indexed query.
+        """
+        session = None
+        try:
+            session = Session()
+            row = session.query(
+                UserInfo.username, UserInfo.salary, UserInfo.goal_count, UserInfo.total_savings,
+                UserInfo.total_goal_value, UserInfo.savings_ratio, UserInfo.months_to_goals,
+            ).filter(UserInfo.username == username).first()
+
+            if not row:
+                error_msg = f"User with username {username} not found."
+                logger.warning(error_msg)
+                return {"message": error_msg}, 404
+
+            return {
+                "username": row.username,
+                "salary": row.salary,
+                "goal_count": row.goal_count,
+                "total_savings": round(row.total_savings, 2),
+                "total_goal_value": round(row.total_goal_value, 2),
+                "savings_ratio": round(row.savings_ratio, 4) if row.savings_ratio is not None else None,
+                "months_to_goals": round(row.months_to_goals, 1) if row.months_to_goals is not None else None,
+            }, 200
+
+        except Exception as e:
+            error_msg = f"Could not get the summary of user with username {username}."
+            logger.warning("%s: %s", error_msg, e)
+            return {"message": error_msg}, 400
+
+        finally:
+            if session:
+                session.close()
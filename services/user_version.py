@@ -0,0 +1,49 @@
+from typing import Optional, Tuple
+
+from models.user_info import UserInfo
+from services.user_cache import user_cache
+
+
+def make_etag(user_id: int, version: int, goal_id: Optional[int] = None) -> str:
+    """
+    Builds the ETag of a user's profile, or of one of its goals when `goal_id` is given.
+    """
+    tag = f"u{user_id}-v{version}" if goal_id is None else f"u{user_id}-v{version}-g{goal_id}"
+    return f'"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks an `If-None-Match` header against an ETag, using the weak comparison of RFC 9110.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+
+class UserVersionService:
+    """
+    Service class for the version counter of each user, from which the ETags are built.
+    The version is bumped by every change to what the profile and goal endpoints return.
+    """
+
+    @staticmethod
+    def lookup(session, username: str) -> Optional[Tuple[int, int]]:
+        """
+        Returns the ID and version of a user from the user cache, or None if it does not exist.
+        """
+        user = user_cache.get(session, username)
+        return (user.id, user.version) if user else None
+
+    @staticmethod
+    def bump(session, user_id: int) -> None:
+        """
+        Increments the user's version inside the caller's transaction, and invalidates
+        the cached user row once it commits.
+        """
+        session.query(UserInfo).filter(UserInfo.id == user_id).update(
+            {UserInfo.version: UserInfo.version + 1}, synchronize_session=False)
+        user_cache.invalidate_on_commit(session, user_id)
@@ -0,0 +1,105 @@
+"""
+Test fixtures: the app on a throwaway SQLite database, with the secondary API served by the
+in-process stub of benchmarks/secondary_api_stub.py.
+
+The settings are read from the environment when the modules are imported, so they are set
+here, before anything from the application is imported.
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="main-api-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'db.sqlite3')}",
+    "GOAL_CACHE_PATH": os.path.join(_workdir, "cache", "goals.sqlite3"),
+    "USER_CACHE_PATH": os.path.join(_workdir, "cache", "user_generations.bin"),
+    "RATE_LIMIT_PATH": os.path.join(_workdir, "cache", "rate_limits.sqlite3"),
+    "RATE_LIMIT_BACKEND": "none",
+    "LOG_PATH": os.path.join(_workdir, "log/"),
+    "PROFILE_DIR": os.path.join(_workdir, "profiles/"),
+    "AUTH_SCRYPT_N": "1024",
+    "AUTH_TOKEN_SECRET": "test-secret",
+    "USER_LIST_SECRET": "test-admin",
+    "AUTH_HASH_WORKERS": "1",
+    "GOAL_OUTBOX_WORKER": "0",
+    "GOAL_PROJECTION_RECONCILE": "0",
+    "GOAL_PROJECTION_BACKFILL": "0",
+})
+
+import pytest  # noqa: E402
+
+import models  # noqa: E402
+from app import create_app  # noqa: E402
+from benchmarks.secondary_api_stub import StubConfig, start_stub_server  # noqa: E402
+from models.base import Base  # noqa: E402
+from services import saving_goal  # noqa: E402
+from models.user_info import UserInfo  # noqa: E402
+from services.auth import AuthService  # noqa: E402
+from services.goal_cache import goal_cache  # noqa: E402
+from services.http_client import secondary_api  # noqa: E402
+from services.user_cache import user_cache  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def stub():
+    """
+    The secondary API stub, shared by every test; its config is reset after each test.
+    """
+    config = StubConfig()
+    server, base_url = start_stub_server(config)
+    secondary_api.base_url = base_url
+    yield config
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def app(stub):
+    return create_app({"TESTING": True, "LOG_CONFIGURE": False, "BACKGROUND_JOBS": False})
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture(autouse=True)
+def clean_state(stub):
+    """
+    Starts every test with empty tables and caches, closed circuits and a well-behaved upstream.
+    """
+    with models.get_engine().begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    goal_cache.clear()
+    user_cache.clear()
+    secondary_api.breakers = {}
+    saving_goal._batch_rejected_at = None
+    stub.latency, stub.jitter, stub.error_rate, stub.batch = 0.0, 0.0, 0.0, True
+    yield
+
+
+def auth(username: str) -> dict:
+    """
+    Returns the Authorization header of a session token issued to `username`.
+    """
+    session = models.Session()
+    try:
+        user_id = session.query(UserInfo.id).filter(UserInfo.username == username).scalar()
+    finally:
+        session.close()
+    return {"Authorization": f"Bearer {AuthService.issue_token(user_id, username)}"}
+
+
+def create_user(client, username: str, salary: float = 0.0) -> None:
+    assert client.post("/users", data={"username": username, "password": "secret"}).status_code == 200
+    if salary:
+        response = client.put(f"/users/{username}/salary", data={"new_salary": salary}, headers=auth(username))
+        assert response.status_code == 200
+
+
+def create_goal(client, username: str, goal_value: float = 100.0, monthly_savings: float = 10.0) -> int:
+    response = client.post(f"/users/{username}/goal", headers=auth(username), data={
+        "goal_name": "Trip", "goal_currency": "USD", "goal_value": goal_value, "monthly_savings": monthly_savings,
+    })
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()["goal_ids"][-1]
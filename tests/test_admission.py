@@ -0,0 +1,133 @@
+import os
+import runpy
+import threading
+import time
+
+import admission
+from admission import MemoryBucketBackend, RateLimiter
+from app import create_app
+from services import saving_goal
+from services.http_client import secondary_api
+
+from conftest import auth, create_user
+
+GOAL = {"goal_name": "Trip", "goal_currency": "USD", "goal_value": 100, "monthly_savings": 10}
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def in_background(app, *requests_args):
+    """
+    Sends slow goal creations from other threads, as other requests served by the same worker.
+    """
+    headers = auth("ana")
+    threads = [threading.Thread(target=lambda: app.test_client().post(*args, data=GOAL, headers=headers))
+               for args in requests_args]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_user_over_its_rate_gets_429(client, monkeypatch):
+    monkeypatch.setattr(admission, "user_limiter", RateLimiter(MemoryBucketBackend(100), "user", 0.5, 2))
+    create_user(client, "ana")
+
+    statuses = [client.get("/users/ana/summary") for _ in range(3)]
+
+    assert [response.status_code for response in statuses] == [200, 200, 429]
+    assert int(statuses[2].headers["Retry-After"]) >= 1
+    assert client.get("/users/bob/summary").status_code == 404  # Other users keep their own bucket
+
+
+def test_worker_at_its_in_flight_limit_sheds_with_503(app, client, stub, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_IN_FLIGHT", 2)
+    create_user(client, "ana")
+    stub.latency = 0.5
+
+    threads = in_background(app, ("/users/ana/goal",), ("/users/ana/goal",))
+    try:
+        wait_for(lambda: admission._in_flight == 2)
+        response = client.get("/users/ana/summary")
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER)
+        assert client.get("/metrics").status_code == 200  # Operational routes are never shed
+    finally:
+        for thread in threads:
+            thread.join()
+    assert client.get("/users/ana/summary").status_code == 200
+
+
+def test_upstream_routes_are_shed_while_local_ones_are_served(app, client, stub, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_MAX_UPSTREAM_IN_FLIGHT", 1)
+    create_user(client, "ana")
+    stub.latency = 0.5
+
+    threads = in_background(app, ("/users/ana/goal",))
+    try:
+        wait_for(lambda: secondary_api.in_flight == 1)
+        response = client.post("/users/ana/goal", data=GOAL, headers=auth("ana"))
+        assert response.status_code == 503
+        assert "Retry-After" in response.headers
+        assert client.get("/users/ana/summary").status_code == 200
+    finally:
+        for thread in threads:
+            thread.join()
+
+
+def test_queued_fan_out_calls_are_counted():
+    release = threading.Event()
+    results = []
+    fan_out = threading.Thread(target=lambda: results.extend(
+        saving_goal.run_bounded(lambda item: release.wait(5) and item, [1, 2, 3, 4], max_concurrency=2, deadline=5)))
+    fan_out.start()
+    try:
+        wait_for(lambda: saving_goal.queued_calls() == 2)
+    finally:
+        release.set()
+        fan_out.join()
+    assert results == [1, 2, 3, 4]
+    assert saving_goal.queued_calls() == 0
+
+
+def test_gunicorn_profile_sheds_one_short_of_the_worker_threads(monkeypatch):
+    for name in ("ADMISSION_MAX_IN_FLIGHT", "AUTH_HASH_WORKERS", "AUTH_TOKEN_SECRET"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv("GUNICORN_WORKER_CLASS", "gthread")
+    monkeypatch.setenv("GUNICORN_THREADS", "4")
+
+    runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py"))
+
+    assert os.environ["ADMISSION_MAX_IN_FLIGHT"] == "3"
+
+
+def test_client_address_comes_from_the_trusted_proxy_only(stub, monkeypatch):
+    monkeypatch.setattr(admission, "client_limiter", RateLimiter(MemoryBucketBackend(100), "client", 0.01, 1))
+
+    def statuses(app, *forwarded_for):
+        client = app.test_client()
+        return [client.get("/users/ana/summary", headers={"X-Forwarded-For": address}).status_code
+                for address in forwarded_for]
+
+    config = {"TESTING": True, "LOG_CONFIGURE": False, "BACKGROUND_JOBS": False}
+    behind_proxy = create_app({**config, "TRUSTED_PROXY_HOPS": 1})
+    # The proxy appends the peer it saw, so the client's own entries are never trusted
+    assert statuses(behind_proxy, "10.0.0.1", "10.0.0.2", "1.2.3.4, 10.0.0.2") == [404, 404, 429]
+
+    # Without a trusted proxy, a client changing the header keeps its bucket
+    monkeypatch.setattr(admission, "client_limiter", RateLimiter(MemoryBucketBackend(100), "client", 0.01, 1))
+    assert statuses(create_app(config), "10.0.0.3", "10.0.0.4") == [404, 429]
+
+
+def test_gunicorn_profile_shares_the_rate_limits_of_several_workers(monkeypatch):
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "gunicorn.conf.py")
+    for workers, backend in (("1", "memory"), ("4", "file")):
+        for name in ("RATE_LIMIT_BACKEND", "ADMISSION_MAX_IN_FLIGHT", "AUTH_HASH_WORKERS", "AUTH_TOKEN_SECRET"):
+            monkeypatch.delenv(name, raising=False)
+        monkeypatch.setenv("GUNICORN_WORKERS", workers)
+        runpy.run_path(path)
+        assert os.environ["RATE_LIMIT_BACKEND"] == backend
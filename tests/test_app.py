@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import os, sys
+import models
+from app import create_app
+
+database = sys.argv[1]
+app = create_app({"BACKGROUND_JOBS": False})
+assert models._engine is None, "the engine was built by create_app"
+assert not os.path.exists(database), "the database was created by create_app"
+
+assert app.test_client().get("/users/nobody").status_code == 404
+assert models._engine is not None and os.path.exists(database)
+"""
+
+
+def test_create_app_leaves_the_database_to_the_first_request(tmp_path):
+    database = tmp_path / "db" / "db.sqlite3"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{database}", "LOG_PATH": f"{tmp_path}/log/",
+           "GOAL_CACHE_PATH": str(tmp_path / "goals.sqlite3")}
+
+    # A new interpreter, since this one already built its engine
+    completed = subprocess.run([sys.executable, "-c", PROBE, str(database)], cwd=ROOT, env=env,
+                               capture_output=True, text=True, timeout=60)
+
+    assert completed.returncode == 0, completed.stderr
@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import text
+
+import models
+import password_hashing
+from app import create_app
+from models.migrations import hash_plaintext_passwords
+from services import auth as auth_service
+
+from conftest import auth, create_user
+
+
+def stored_password(username: str) -> str:
+    with models.get_engine().connect() as connection:
+        return connection.execute(
+            text("SELECT password FROM user_info WHERE username = :username"), {"username": username}).scalar()
+
+
+def test_migration_hashes_legacy_plaintext_passwords(client):
+    with models.get_engine().begin() as connection:
+        connection.execute(text("INSERT INTO user_info (username, password, salary) VALUES ('old', 'hunter2', 0)"))
+    assert client.post("/users", data={"username": "new", "password": "secret"}).status_code == 200
+    hashed_before = stored_password("new")
+
+    assert hash_plaintext_passwords(models.get_engine()) == 1
+    assert hash_plaintext_passwords(models.get_engine()) == 0
+
+    assert password_hashing.is_hashed(stored_password("old"))
+    assert stored_password("new") == hashed_before
+    response = client.post("/users/login", data={"username": "old", "password": "hunter2"})
+    assert response.status_code == 200
+    assert client.post("/users/login", data={"username": "old", "password": "wrong"}).status_code == 401
+
+
+def login(client, username: str) -> dict:
+    response = client.post("/users/login", data={"username": username, "password": "secret"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.get_json()['access_token']}"}
+
+
+def test_changing_a_user_requires_a_token(client):
+    create_user(client, "ana")
+
+    response = client.put("/users/ana/salary", data={"new_salary": 1000})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"].startswith("Bearer")
+    forged = {"Authorization": "Bearer e30.c2lnbmF0dXJl"}
+    assert client.put("/users/ana/salary", data={"new_salary": 1000}, headers=forged).status_code == 401
+    assert client.delete("/users/ana").status_code == 401
+
+    assert client.put("/users/ana/salary", data={"new_salary": 1000}, headers=login(client, "ana")).status_code == 200
+
+
+def test_a_token_only_changes_its_own_user(client):
+    create_user(client, "ana")
+    create_user(client, "bob")
+
+    assert client.put("/users/bob/salary", data={"new_salary": 1000}, headers=auth("ana")).status_code == 403
+    assert client.delete("/users/bob", headers=auth("ana")).status_code == 403
+    assert client.get("/users/bob").status_code == 200
+
+
+def test_a_rename_ends_the_tokens_of_the_old_username(client):
+    create_user(client, "ana")
+    headers = login(client, "ana")
+
+    assert client.put("/users/ana/username", data={"new_username": "ana2"}, headers=headers).status_code == 200
+
+    assert client.put("/users/ana2/salary", data={"new_salary": 1000}, headers=headers).status_code == 403
+    assert client.put("/users/ana2/salary", data={"new_salary": 1000}, headers=login(client, "ana2")).status_code == 200
+
+
+def test_app_refuses_to_start_without_a_token_secret(monkeypatch):
+    monkeypatch.setattr(auth_service, "AUTH_TOKEN_SECRET", None)
+
+    with pytest.raises(RuntimeError, match="AUTH_TOKEN_SECRET"):
+        create_app({"TESTING": True, "LOG_CONFIGURE": False, "BACKGROUND_JOBS": False})
@@ -0,0 +1,37 @@
+from conftest import create_goal, create_user
+
+
+def test_profile_answers_304_until_the_user_changes(client):
+    create_user(client, "ana")
+    create_goal(client, "ana")
+    etag = client.get("/users/ana").headers["ETag"]
+
+    assert client.get("/users/ana", headers={"If-None-Match": etag}).status_code == 304
+
+    create_goal(client, "ana")
+    response = client.get("/users/ana", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_goal_answers_304_for_a_matching_etag(client):
+    create_user(client, "ana")
+    goal_id = create_goal(client, "ana")
+    response = client.get(f"/users/ana/goal/{goal_id}")
+    assert response.status_code == 200
+
+    response = client.get(f"/users/ana/goal/{goal_id}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+    assert client.get(f"/users/ana/goal/{goal_id}", headers={"If-None-Match": "*"}).status_code == 304
+
+
+def test_conditional_goal_read_checks_ownership_first(client):
+    create_user(client, "ana")
+    create_user(client, "bia")
+    other_goal_id = create_goal(client, "bia")
+    own_goal_id = create_goal(client, "ana")
+    own_etag = client.get(f"/users/ana/goal/{own_goal_id}").headers["ETag"]
+
+    assert client.get(f"/users/ana/goal/{other_goal_id}", headers={"If-None-Match": "*"}).status_code == 404
+    assert client.get(f"/users/ana/goal/{other_goal_id}", headers={"If-None-Match": own_etag}).status_code == 404
+    assert client.get("/users/ana/goal/999", headers={"If-None-Match": "*"}).status_code == 404
@@ -0,0 +1,21 @@
+from sqlalchemy import text
+
+from models.engine import SQLITE_BUSY_TIMEOUT, build_engine
+
+
+def test_pragmas_are_applied_to_every_new_connection(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'db.sqlite3'}", pool_class="null")
+
+    for _ in range(2):  # Without a pool, each checkout opens a new connection
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_BUSY_TIMEOUT
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+
+
+def test_database_directory_is_created(tmp_path):
+    engine = build_engine(f"sqlite:///{tmp_path / 'database' / 'db.sqlite3'}")
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    assert (tmp_path / "database" / "db.sqlite3").exists()
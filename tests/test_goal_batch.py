@@ -0,0 +1,107 @@
+import time
+
+import requests
+
+from services import goal_batch
+from services.goal_outbox import drain_once
+from services.goal_projection import GoalProjectionService
+from services.http_client import secondary_api
+
+from conftest import auth, create_goal, create_user
+
+GOAL = {"goal_name": "Trip", "goal_currency": "USD", "goal_value": 100, "monthly_savings": 10}
+
+
+def upstream_goal_ids() -> set:
+    return {goal["id"] for goal in requests.get(f"{secondary_api.base_url}/goals").json()}
+
+
+def apply(client, operations, username: str = "ana"):
+    response = client.post(f"/users/{username}/goals:batch", json={"operations": operations}, headers=auth(username))
+    return response.status_code, response.get_json()
+
+
+def test_results_carry_the_status_and_message_of_each_operation(client):
+    create_user(client, "ana")
+    kept, deleted = create_goal(client, "ana"), create_goal(client, "ana")
+
+    status, body = apply(client, [
+        {"op": "create", "goal": GOAL},
+        {"op": "update", "goal_id": kept, "goal": dict(GOAL, goal_value=200)},
+        {"op": "delete", "goal_id": deleted},
+        {"op": "delete", "goal_id": 999},
+        {"op": "delete", "goal_id": kept},
+        {"op": "update", "goal_id": kept},
+    ])
+
+    assert status == 200
+    results = body["results"]
+    assert [entry["status"] for entry in results] == [200, 200, 200, 404, 409, 400]
+    assert results[0]["goal"]["id"] == results[0]["goal_id"]
+    assert results[1]["goal"]["goal_value"] == 200
+    assert results[2]["message"] == f"Goal {deleted} deleted successfully."
+    assert all(isinstance(entry["message"], str) for entry in results[2:])
+    assert body["goal_ids"] == [kept, results[0]["goal_id"]]
+
+
+def test_goal_already_deleted_upstream_is_unlinked(client):
+    create_user(client, "ana")
+    goal_id = create_goal(client, "ana")
+    requests.delete(f"{secondary_api.base_url}/goals/goal_id", params={"goal_id": goal_id})
+
+    status, body = apply(client, [{"op": "delete", "goal_id": goal_id}])
+
+    assert body["results"][0]["status"] == 200
+    assert body["goal_ids"] == []
+
+
+def test_started_calls_are_waited_for_at_the_deadline(client, stub, monkeypatch):
+    monkeypatch.setattr(goal_batch, "GOALS_BATCH_DEADLINE", 0.2)
+    monkeypatch.setattr(goal_batch, "GOALS_BATCH_CONCURRENCY", 2)
+    create_user(client, "ana")
+    before = upstream_goal_ids()
+    stub.latency = 0.5
+
+    status, body = apply(client, [{"op": "create", "goal": GOAL} for _ in range(4)])
+
+    assert status == 200
+    assert [entry["status"] for entry in body["results"]] == [200, 200, 503, 503]
+    assert "not created" in body["results"][2]["message"]
+    # Every goal created upstream is linked to the user: none was abandoned mid-call
+    assert upstream_goal_ids() - before == set(body["goal_ids"])
+    assert len(body["goal_ids"]) == 2
+
+
+def test_unanswered_creation_is_finished_by_the_outbox(client, stub, monkeypatch):
+    monkeypatch.setattr(secondary_api, "timeout", (1.0, 0.2))
+    create_user(client, "ana")
+    before = upstream_goal_ids()
+    stub.latency = 0.4
+
+    status, body = apply(client, [{"op": "create", "goal": GOAL}])
+
+    entry = body["results"][0]
+    assert entry["status"] == 202
+    assert body["goal_ids"] == []
+    time.sleep(0.5)  # The creation completes upstream after the client gave up on it
+    stub.latency = 0.0
+    assert drain_once() == 1
+
+    request = client.get(entry["status_url"]).get_json()
+    assert request["status"] == "created"
+    assert client.get("/users/ana").get_json()["goals"][0]["id"] == request["goal_id"]
+    assert upstream_goal_ids() - before == {request["goal_id"]}
+
+
+def test_local_failure_after_the_upstream_calls_is_a_server_error(client, monkeypatch):
+    create_user(client, "ana")
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(GoalProjectionService, "save", fail)
+
+    status, body = apply(client, [{"op": "create", "goal": GOAL}])
+
+    assert status == 500
+    assert "may have been applied" in body["message"]
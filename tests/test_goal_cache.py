@@ -0,0 +1,50 @@
+from services import goal_cache
+from services.goal_cache import FileCacheBackend, GoalCache
+
+
+def test_default_backend_is_shared_between_processes():
+    assert isinstance(goal_cache.create_backend(), FileCacheBackend)
+
+
+def test_invalidation_reaches_every_cache_on_the_file(tmp_path):
+    path = str(tmp_path / "cache" / "goals.sqlite3")
+    worker_a = GoalCache(FileCacheBackend(path, max_entries=10, ttl=60))
+    worker_b = GoalCache(FileCacheBackend(path, max_entries=10, ttl=60))
+    goal = {"id": 1, "goal_name": "Trip", "goal_value": 100.0}
+
+    worker_a.set(goal)
+    assert worker_b.get(1) == goal
+
+    worker_b.invalidate(1)
+    assert worker_a.get(1) is None
+
+
+def test_a_hit_does_not_write_to_the_file(tmp_path):
+    backend = FileCacheBackend(str(tmp_path / "goals.sqlite3"), max_entries=10, ttl=60)
+    GoalCache(backend).set({"id": 1, "goal_name": "Trip"})
+    changes = backend.connection.total_changes
+
+    assert GoalCache(backend).get_many([1, 2]) == {1: {"id": 1, "goal_name": "Trip"}}
+    assert backend.connection.total_changes == changes
+
+
+def test_a_fill_fetched_before_an_invalidation_is_dropped(tmp_path):
+    path = str(tmp_path / "goals.sqlite3")
+    reader = GoalCache(FileCacheBackend(path, max_entries=10, ttl=60))
+    writer = GoalCache(FileCacheBackend(path, max_entries=10, ttl=60))
+
+    generation = reader.generation()
+    writer.invalidate(1)  # The goal changes upstream after the reader fetched it
+    reader.fill({"id": 1, "goal_value": 100.0}, generation)
+    assert reader.get(1) is None
+
+    reader.fill({"id": 1, "goal_value": 200.0}, reader.generation())
+    assert writer.get(1) == {"id": 1, "goal_value": 200.0}
+
+
+def test_the_entries_closest_to_expiring_are_evicted_first(tmp_path):
+    cache = GoalCache(FileCacheBackend(str(tmp_path / "goals.sqlite3"), max_entries=2, ttl=60))
+    for goal_id in (1, 2, 3):
+        cache.set({"id": goal_id})
+
+    assert sorted(cache.get_many([1, 2, 3])) == [2, 3]
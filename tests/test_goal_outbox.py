@@ -0,0 +1,110 @@
+import warnings
+from datetime import datetime, timedelta
+
+import requests
+from sqlalchemy.exc import SAWarning
+
+from models import Session
+from models.goal_outbox import GoalOutbox
+from services import goal_outbox
+from services.goal_outbox import claim_due, drain_once
+from services.saving_goal import SavingGoalService
+
+from conftest import auth, create_user
+
+GOAL = {"goal_name": "Trip", "goal_currency": "USD", "goal_value": 100, "monthly_savings": 10}
+
+
+def queue_goal(client, username: str = "ana") -> str:
+    response = client.post(f"/users/{username}/goal", data=GOAL, headers={"Prefer": "respond-async", **auth(username)})
+    assert response.status_code == 202
+    return response.headers["Location"]
+
+
+def outbox_entries():
+    session = Session()
+    try:
+        return session.query(GoalOutbox).all()
+    finally:
+        session.close()
+
+
+def test_drain_creates_the_goal_and_links_it(client):
+    create_user(client, "ana")
+    status_url = queue_goal(client)
+
+    assert drain_once() == 1
+
+    status = client.get(status_url).get_json()
+    assert status["status"] == "created"
+    assert client.get("/users/ana").get_json()["goals"][0]["id"] == status["goal_id"]
+    assert outbox_entries() == []
+
+
+def test_claimed_entry_is_leased_to_one_worker(client):
+    create_user(client, "ana")
+    queue_goal(client)
+
+    claimed = claim_due()
+    assert len(claimed) == 1
+    assert claim_due() == []
+
+
+def test_upstream_failure_schedules_a_retry(client, stub, monkeypatch):
+    monkeypatch.setattr(goal_outbox, "backoff", lambda attempts: 60.0)
+    create_user(client, "ana")
+    status_url = queue_goal(client)
+    stub.error_rate = 1.0
+
+    assert drain_once() == 1
+
+    [entry] = outbox_entries()
+    assert entry.attempts == 1
+    assert entry.claimed_until is None
+    assert entry.next_attempt_at > datetime.now() + timedelta(seconds=30)
+    assert entry.last_error
+    assert client.get(status_url).get_json()["status"] == "pending"
+    assert claim_due() == []  # Not due before its backoff
+
+
+def test_goal_fails_after_the_last_attempt(client, stub, monkeypatch):
+    monkeypatch.setattr(goal_outbox, "GOAL_OUTBOX_MAX_ATTEMPTS", 1)
+    create_user(client, "ana")
+    status_url = queue_goal(client)
+    stub.error_rate = 1.0
+
+    drain_once()
+
+    status = client.get(status_url).get_json()
+    assert status["status"] == "failed"
+    assert "after 1 attempts" in status["error"]
+    assert outbox_entries() == []
+
+
+def test_goal_rejected_by_upstream_fails_without_retry(client, monkeypatch):
+    def reject(goal_data, idempotency_key):
+        response = requests.Response()
+        response.status_code = 422
+        raise requests.exceptions.HTTPError(response=response)
+
+    monkeypatch.setattr(SavingGoalService, "create_saving_goal", staticmethod(reject))
+    create_user(client, "ana")
+    status_url = queue_goal(client)
+
+    drain_once()
+
+    status = client.get(status_url).get_json()
+    assert status["status"] == "failed"
+    assert "422" in status["error"]
+    assert outbox_entries() == []
+
+
+def test_deleting_a_user_removes_its_outbox_entries_without_warnings(client):
+    create_user(client, "ana")
+    queue_goal(client)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", SAWarning)
+        assert client.delete("/users/ana", headers=auth("ana")).status_code == 200
+
+    assert outbox_entries() == []
@@ -0,0 +1,85 @@
+import json
+import multiprocessing
+import os
+import runpy
+import subprocess
+import sys
+from types import SimpleNamespace
+
+import metrics
+import models
+from services.http_client import secondary_api
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG = os.path.join(ROOT, "gunicorn.conf.py")
+DERIVED = ("ADMISSION_MAX_IN_FLIGHT", "AUTH_HASH_WORKERS", "AUTH_TOKEN_SECRET", "RATE_LIMIT_BACKEND",
+           "GOAL_CACHE_BACKEND", "GUNICORN_WORKERS", "GUNICORN_THREADS")
+
+
+def load_config(monkeypatch, **env) -> dict:
+    """
+    Runs gunicorn.conf.py with `env`, letting it derive every setting left unset.
+    """
+    for name in DERIVED:
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return runpy.run_path(CONFIG)
+
+
+def test_workers_and_threads_follow_the_cores(monkeypatch):
+    cores = multiprocessing.cpu_count()
+    config = load_config(monkeypatch, GUNICORN_WORKER_CLASS="gthread")
+
+    assert (config["workers"], config["threads"]) == (cores + 1, 4)
+    assert os.environ["ADMISSION_MAX_IN_FLIGHT"] == "3"
+    assert os.environ["AUTH_HASH_WORKERS"] == str(max(1, cores // (cores + 1)))
+    assert [config["default_workers"](name) for name in ("sync", "gthread", "gevent")] == \
+        [cores * 2 + 1, cores + 1, cores]
+
+
+def test_sync_workers_run_one_request_each(monkeypatch):
+    config = load_config(monkeypatch, GUNICORN_WORKER_CLASS="sync", GUNICORN_WORKERS="2")
+
+    assert (config["workers"], config["threads"]) == (2, 1)
+    assert os.environ["ADMISSION_MAX_IN_FLIGHT"] == "0"  # Shedding is off
+    assert os.environ["AUTH_HASH_WORKERS"] == str(max(1, multiprocessing.cpu_count() // 2))
+
+
+def test_gevent_workers_keep_the_caches_in_memory():
+    # Run apart: loading the config under gevent patches the whole process
+    env = {name: value for name, value in os.environ.items() if name not in DERIVED}
+    env.update(GUNICORN_WORKER_CLASS="gevent", GUNICORN_WORKER_CONNECTIONS="50", GUNICORN_WORKERS="4")
+    probe = (f"import json, os, runpy; runpy.run_path({CONFIG!r}); "
+             "print(json.dumps({name: os.environ[name] for name in "
+             "('ADMISSION_MAX_IN_FLIGHT', 'GOAL_CACHE_BACKEND', 'RATE_LIMIT_BACKEND')}))")
+    output = subprocess.run([sys.executable, "-c", probe], env=env, cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+
+    assert json.loads(output) == {
+        "ADMISSION_MAX_IN_FLIGHT": "49", "GOAL_CACHE_BACKEND": "memory", "RATE_LIMIT_BACKEND": "memory"}
+
+
+def test_post_fork_drops_the_connections_inherited_from_the_master(client, monkeypatch):
+    config = load_config(monkeypatch, GUNICORN_WORKER_CLASS="gthread")
+    assert client.get("/users/ana").status_code == 404  # The master used the engine before forking
+    pool = models.get_engine().pool
+    assert secondary_api.session is not None
+
+    config["post_fork"](None, SimpleNamespace(pid=os.getpid()))
+
+    assert models.get_engine().pool is not pool
+    assert secondary_api._session is None
+    assert client.get("/users/ana").status_code == 404  # New connections are opened on demand
+
+
+def test_child_exit_drops_the_live_gauges_of_the_worker(monkeypatch, tmp_path):
+    config = load_config(monkeypatch, GUNICORN_WORKER_CLASS="gthread")
+    monkeypatch.setattr(metrics, "PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(tmp_path))
+    for name in ("gauge_livesum_4242.db", "gauge_livesum_4343.db", "counter_4242.db"):
+        (tmp_path / name).touch()
+
+    config["child_exit"](None, SimpleNamespace(pid=4242))
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["counter_4242.db", "gauge_livesum_4343.db"]
@@ -0,0 +1,45 @@
+import os
+
+from services import http_client
+from services.http_client import HttpClient
+
+
+def retry_policy(client: HttpClient):
+    return client.session.get_adapter("http://upstream").max_retries
+
+
+def test_only_idempotent_verbs_are_retried_and_never_after_a_read_timeout():
+    retry = retry_policy(HttpClient("http://upstream", retries=2))
+
+    assert "POST" not in retry.allowed_methods
+    assert {"GET", "PUT", "DELETE"} <= retry.allowed_methods
+    assert retry.read == 0
+    assert (retry.connect, retry.status) == (2, 2)
+    assert retry.is_retry("GET", 503) and not retry.is_retry("POST", 503)
+
+
+def test_pool_is_sized_from_the_settings():
+    adapter = HttpClient("http://upstream", pool_maxsize=7).session.get_adapter("http://upstream")
+
+    assert adapter._pool_maxsize == 7
+
+
+def test_session_is_rebuilt_in_a_forked_process(monkeypatch):
+    client = HttpClient("http://upstream")
+    parent_session = client.session
+    assert client.session is parent_session
+
+    parent_pid = os.getpid()
+    monkeypatch.setattr(http_client.os, "getpid", lambda: parent_pid + 1)
+
+    assert client.session is not parent_session
+    assert client.session is client.session
+
+
+def test_reset_drops_the_session():
+    client = HttpClient("http://upstream")
+    session = client.session
+
+    client.reset()
+
+    assert client.session is not session
@@ -0,0 +1,62 @@
+import logging
+import queue
+
+from logger import LogPipeline, NonBlockingQueueHandler, RateLimitFilter, SamplingFilter
+
+
+def make_record(message: str = "served %s", level: int = logging.INFO, name: str = "app") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, message, ("ana",), None)
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+
+    for _ in range(3):
+        handler.handle(make_record())
+
+    assert handler.queue.qsize() == 1
+
+
+def test_rate_limit_caps_each_message_template_but_not_warnings():
+    rate_limit = RateLimitFilter(per_second=0.001, burst=2)
+
+    assert [rate_limit.filter(make_record()) for _ in range(3)] == [True, True, False]
+    assert rate_limit.filter(make_record("other %s"))
+    assert rate_limit.filter(make_record(level=logging.WARNING))
+
+
+def test_sampling_applies_per_logger_and_keeps_warnings():
+    sampling = SamplingFilter({"noisy": 0.0, "kept": 1.0})
+
+    assert not sampling.filter(make_record(name="noisy"))
+    assert sampling.filter(make_record(name="noisy", level=logging.WARNING))
+    assert sampling.filter(make_record(name="kept"))
+    assert sampling.filter(make_record(name="unlisted"))
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_pipeline_hands_records_to_the_original_handlers():
+    target = logging.getLogger("tests.pipeline")
+    target.setLevel(logging.INFO)
+    target.propagate = False
+    handler = ListHandler()
+    target.addHandler(handler)
+    pipeline = LogPipeline(["tests.pipeline"])
+    pipeline.start()
+    try:
+        assert handler not in target.handlers
+        target.info("served %s", "ana")
+    finally:
+        pipeline.stop()
+        for queue_handler in pipeline.queue_handlers:
+            target.removeHandler(queue_handler)
+
+    assert handler.messages == ["served ana"]
@@ -0,0 +1,42 @@
+from prometheus_client.parser import text_string_to_metric_families
+
+from conftest import create_user
+
+
+def samples(client, name: str) -> list:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    families = text_string_to_metric_families(response.get_data(as_text=True))
+    return [sample for family in families for sample in family.samples if sample.name == name]
+
+
+def count_of(client, name: str, **labels) -> float:
+    return sum(sample.value for sample in samples(client, name)
+               if all(sample.labels.get(key) == value for key, value in labels.items()))
+
+
+def test_requests_are_timed_per_route_template_and_status(client):
+    create_user(client, "ana")
+    labels = {"method": "GET", "route": "/users/<username>"}
+    before = count_of(client, "http_request_duration_seconds_count", status="200", **labels)
+    missing = count_of(client, "http_request_duration_seconds_count", status="404", **labels)
+
+    client.get("/users/ana")
+    client.get("/users/ana")
+    client.get("/users/nobody/summary")
+    client.get("/users/nobody")
+
+    assert count_of(client, "http_request_duration_seconds_count", status="200", **labels) == before + 2
+    assert count_of(client, "http_request_duration_seconds_count", status="404", **labels) == missing + 1
+    assert not [sample for sample in samples(client, "http_request_duration_seconds_count")
+                if sample.labels["route"] == "/users/ana"]
+
+
+def test_sql_statements_are_counted_per_request(client):
+    create_user(client, "ana")
+    before = count_of(client, "db_statements_per_request_count", route="/users/<username>/summary")
+
+    client.get("/users/ana/summary")
+
+    assert count_of(client, "db_statements_per_request_count", route="/users/<username>/summary") == before + 1
+    assert count_of(client, "db_statement_duration_seconds_count", route="/users/<username>/summary") > 0
@@ -0,0 +1,42 @@
+from sqlalchemy import create_engine, inspect, text
+
+from models.base import Base
+from models.migrations import migrate_goal_ids_to_user_goal
+
+
+def legacy_engine(tmp_path):
+    # A database of the version that kept the goals of each user in a goal_ids JSON column
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.sqlite3'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("ALTER TABLE user_info ADD COLUMN goal_ids JSON"))
+        connection.execute(text(
+            "INSERT INTO user_info (id, username, password, salary, created_at, goal_ids) VALUES "
+            "(1, 'ana', 'x', 0, '2024-01-01 10:00:00', '[30, 10, 20, 10]'), "
+            "(2, 'bob', 'x', 0, '2024-01-02 10:00:00', '[]')"))
+    return engine
+
+
+def linked_goals(engine, user_id: int):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT goal_id FROM user_goal WHERE user_id = :user_id ORDER BY created_at"), {"user_id": user_id}
+        ).scalars().all()
+
+
+def test_goal_ids_are_moved_to_user_goal_in_order(tmp_path):
+    engine = legacy_engine(tmp_path)
+
+    assert migrate_goal_ids_to_user_goal(engine) == 3
+
+    assert linked_goals(engine, 1) == [30, 10, 20]
+    assert linked_goals(engine, 2) == []
+    assert "goal_ids" not in {column["name"] for column in inspect(engine).get_columns("user_info")}
+
+
+def test_goal_ids_migration_runs_only_once(tmp_path):
+    engine = legacy_engine(tmp_path)
+    migrate_goal_ids_to_user_goal(engine)
+
+    assert migrate_goal_ids_to_user_goal(engine) == 0
+    assert linked_goals(engine, 1) == [30, 10, 20]
@@ -0,0 +1,48 @@
+import pytest
+
+import profiling
+from app import create_app
+
+from conftest import create_user
+
+TOKEN = {"X-Profile-Token": "profile-secret"}
+
+
+@pytest.fixture
+def profiled_client(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, "PROFILE_SECRET", "profile-secret")
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+    app = create_app({"TESTING": True, "LOG_CONFIGURE": False, "BACKGROUND_JOBS": False})
+    return app.test_client()
+
+
+def test_admin_endpoints_need_the_profile_token(profiled_client):
+    assert profiled_client.get("/admin/profiles").status_code == 404
+    assert profiled_client.get("/admin/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 404
+    assert profiled_client.get("/admin/profiles", headers=TOKEN).status_code == 200
+
+
+def test_only_requests_with_the_token_are_profiled(profiled_client):
+    create_user(profiled_client, "ana")
+    profiled_client.get("/users/ana/summary", headers={"X-Profile-Token": "wrong"})
+    profiled_client.get("/users/ana/summary", headers=TOKEN)
+
+    listing = profiled_client.get("/admin/profiles", headers=TOKEN).get_json()
+
+    assert list(listing["routes"]) == ["/users/<username>/summary"]
+    assert "request thread only" in listing["scope"].lower()
+    profile = listing["routes"]["/users/<username>/summary"][0]
+    report = profiled_client.get(f"/admin/profiles/{profile['slug']}/{profile['name']}", headers=TOKEN)
+    assert report.status_code == 200
+    assert "function calls" in report.get_data(as_text=True)
+
+
+def test_only_the_newest_profiles_are_kept(profiled_client, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILE_MAX_FILES", 2)
+    create_user(profiled_client, "ana")
+    for _ in range(4):
+        profiled_client.get("/users/ana/summary", headers=TOKEN)
+
+    assert len(profiling.stored_profiles()) == 2
+    routes = profiled_client.get("/admin/profiles", headers=TOKEN).get_json()["routes"]
+    assert len(routes["/users/<username>/summary"]) == 2
@@ -0,0 +1,57 @@
+import time
+
+from models import Session
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_info import UserInfo
+from services.reconciliation import ProjectionReconciler
+
+from conftest import create_goal, create_user
+
+
+def drop_projections() -> None:
+    # As left by the migration of the legacy goal_ids column: links without projections or aggregates
+    session = Session()
+    session.query(SavingGoalProjection).delete()
+    session.query(UserInfo).update({"goal_count": 0, "total_savings": 0.0, "total_goal_value": 0.0})
+    session.commit()
+    session.close()
+
+
+def test_background_reconciler_projects_goals_without_a_local_row(client):
+    create_user(client, "ana", salary=1000)
+    goal_ids = [create_goal(client, "ana", monthly_savings=10), create_goal(client, "ana", monthly_savings=30)]
+    drop_projections()
+
+    reconciler = ProjectionReconciler(interval=0.01)
+    reconciler.start()
+    try:
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            session = Session()
+            projected = session.query(SavingGoalProjection.id).count()
+            session.close()
+            if projected == len(goal_ids):
+                break
+            time.sleep(0.02)
+    finally:
+        reconciler.stop()
+
+    session = Session()
+    assert sorted(goal_id for (goal_id,) in session.query(SavingGoalProjection.id)) == sorted(goal_ids)
+    user = session.query(UserInfo).filter(UserInfo.username == "ana").one()
+    assert (user.goal_count, user.total_savings) == (2, 40.0)
+    session.close()
+
+
+def test_profile_read_serves_unprojected_goals_without_writing(client):
+    create_user(client, "ana", salary=1000)
+    goal_id = create_goal(client, "ana", monthly_savings=10)
+    drop_projections()
+
+    response = client.get("/users/ana")
+
+    assert response.status_code == 200
+    assert [goal["id"] for goal in response.get_json()["goals"]] == [goal_id]
+    session = Session()
+    assert session.query(SavingGoalProjection).count() == 0
+    session.close()
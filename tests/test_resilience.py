@@ -0,0 +1,129 @@
+import contextvars
+import time
+
+import pytest
+import requests
+
+from services.http_client import HttpClient
+from services.resilience import (
+    CLOSED, HALF_OPEN, OPEN, BudgetExhaustedError, CircuitBreaker, CircuitOpenError, start_budget)
+
+
+def breaker(**settings) -> CircuitBreaker:
+    defaults = {"window": 10, "min_calls": 4, "failure_rate": 0.5, "slow_call_rate": 0.5,
+                "slow_call_seconds": 1.0, "open_seconds": 60, "half_open_calls": 3}
+    return CircuitBreaker("GET /goals", **{**defaults, **settings})
+
+
+def opened(**settings) -> CircuitBreaker:
+    circuit = breaker(**settings)
+    for _ in range(4):
+        circuit.record(True, 0.0)
+    assert circuit.state == OPEN
+    return circuit
+
+
+def test_circuit_opens_at_the_failure_rate_once_it_has_min_calls():
+    circuit = breaker()
+    for _ in range(3):
+        circuit.record(True, 0.0)
+    assert circuit.state == CLOSED  # Three failures, but fewer calls than min_calls
+
+    circuit.record(False, 0.0)
+
+    assert circuit.state == OPEN
+
+
+def test_circuit_opens_at_the_slow_call_rate():
+    circuit = breaker()
+    for duration in (2.0, 0.0, 2.0):
+        circuit.record(False, duration)
+    assert circuit.state == CLOSED
+
+    circuit.record(False, 0.0)
+
+    assert circuit.state == OPEN
+
+
+def test_open_circuit_fails_fast_without_calling_upstream(monkeypatch):
+    client = HttpClient("http://upstream")
+    client.breakers["GET /goals"] = opened()
+    monkeypatch.setattr(client.session, "request", pytest.fail)
+
+    with pytest.raises(CircuitOpenError):
+        client.get("/goals")
+
+
+def test_circuit_half_opens_after_the_open_interval_and_closes_after_good_probes():
+    circuit = opened(open_seconds=0.01)
+    assert not circuit.allow()
+    time.sleep(0.02)
+
+    assert [circuit.allow() for _ in range(4)] == [True, True, True, False]
+    assert circuit.state == HALF_OPEN
+    for _ in range(3):
+        circuit.record(False, 0.0)
+
+    assert circuit.state == CLOSED
+    assert circuit.allow()
+
+
+@pytest.mark.parametrize("failed, duration", [(True, 0.0), (False, 2.0)])
+def test_a_bad_probe_reopens_the_circuit(failed, duration):
+    circuit = opened(open_seconds=0.01)
+    time.sleep(0.02)
+    assert circuit.allow() and circuit.allow()
+
+    circuit.record(False, 0.0)
+    circuit.record(failed, duration)
+
+    assert circuit.state == OPEN
+    assert not circuit.allow()
+
+
+def sent_timeouts(budget: float, method: str, **kwargs):
+    """
+    Sends one call under a budget of `budget` seconds and returns the timeouts it was given.
+    """
+    client = HttpClient("http://upstream", connect_timeout=2.0, read_timeout=5.0)
+    sent = []
+
+    def fake_request(method, url, timeout, **kwargs):
+        sent.append(timeout)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+
+    client.session.request = fake_request
+
+    def call():
+        start_budget(budget)
+        client.request(method, "/goals", **kwargs)
+
+    contextvars.copy_context().run(call)
+    return sent[0]
+
+
+def test_timeouts_shrink_to_the_remaining_budget():
+    connect_timeout, read_timeout = sent_timeouts(0.5, "GET")
+
+    assert 0 < connect_timeout <= 0.5 and 0 < read_timeout <= 0.5
+    assert sent_timeouts(10, "GET") == (2.0, 5.0)
+
+
+def test_posts_keep_their_read_timeout_unless_they_can_be_replayed():
+    connect_timeout, read_timeout = sent_timeouts(0.5, "POST")
+    assert connect_timeout <= 0.5 and read_timeout == 5.0
+
+    _, read_timeout = sent_timeouts(0.5, "POST", headers={"Idempotency-Key": "key"})
+    assert read_timeout <= 0.5
+
+
+def test_no_call_starts_once_the_budget_is_spent():
+    def call():
+        start_budget(0.001)
+        time.sleep(0.01)
+        HttpClient("http://upstream").get("/goals")
+
+    with pytest.raises(BudgetExhaustedError):
+        contextvars.copy_context().run(call)
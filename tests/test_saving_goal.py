@@ -0,0 +1,131 @@
+import contextvars
+import threading
+import time
+
+from services import saving_goal
+from services.resilience import remaining_budget, start_budget
+from services.saving_goal import SavingGoalService
+
+from conftest import create_goal, create_user
+
+
+def goal_ids(client, count: int):
+    create_user(client, "ana")
+    return [create_goal(client, "ana", goal_value=100 * (index + 1)) for index in range(count)]
+
+
+def test_batch_fetch_returns_goals_in_order(client):
+    ids = goal_ids(client, 3)
+    SavingGoalService.cache.clear()
+
+    goals = SavingGoalService.get_saving_goals_by_ids(list(reversed(ids)) + [999])
+
+    assert [goal["id"] for goal in goals[:3]] == list(reversed(ids))
+    assert goals[3] is None
+    assert saving_goal.batch_supported()
+
+
+def test_rejected_batch_falls_back_to_single_calls(client, stub):
+    ids = goal_ids(client, 3)
+    SavingGoalService.cache.clear()
+    stub.batch = False
+
+    goals = SavingGoalService.get_saving_goals_by_ids(ids)
+
+    assert [goal["id"] for goal in goals] == ids
+    assert not saving_goal.batch_supported()
+
+
+def test_batch_form_is_probed_again_after_the_cooldown(client, stub, monkeypatch):
+    ids = goal_ids(client, 2)
+    SavingGoalService.cache.clear()
+    stub.batch = False
+    SavingGoalService.get_saving_goals_by_ids(ids)
+    assert not saving_goal.batch_supported()
+
+    # Upstream accepts the batch form again once its deploy is over
+    stub.batch = True
+    monkeypatch.setattr(saving_goal, "_batch_rejected_at", time.monotonic() - saving_goal.GOAL_BATCH_REPROBE_INTERVAL)
+    assert saving_goal.batch_supported()
+    SavingGoalService.cache.clear()
+
+    goals = SavingGoalService.get_saving_goals_by_ids(ids)
+
+    assert [goal["id"] for goal in goals] == ids
+    assert saving_goal._batch_rejected_at is None
+
+
+def test_run_bounded_abandons_calls_past_the_deadline():
+    def slow(item):
+        time.sleep(0.5 if item == "slow" else 0)
+        return item
+
+    started_at = time.monotonic()
+    results = saving_goal.run_bounded(slow, ["fast", "slow", "fast"], max_concurrency=3, deadline=0.1)
+
+    assert results == ["fast", None, "fast"]
+    assert time.monotonic() - started_at < 0.4
+
+
+def test_run_bounded_keeps_item_order_when_calls_finish_out_of_order():
+    def reversed_delay(item):
+        time.sleep(0.05 * (3 - item))
+        return item * 10
+
+    assert saving_goal.run_bounded(reversed_delay, [0, 1, 2, 3], max_concurrency=4, deadline=5) == [0, 10, 20, 30]
+
+
+def test_run_bounded_caps_the_calls_in_flight():
+    lock = threading.Lock()
+    running, peak = [0], [0]
+
+    def tracked(item):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return item
+
+    assert saving_goal.run_bounded(tracked, list(range(10)), max_concurrency=3, deadline=5) == list(range(10))
+    assert peak[0] == 3
+
+
+def test_run_bounded_deadline_is_capped_by_the_request_budget():
+    def slow(item):
+        time.sleep(0.5 if item == "slow" else 0)
+        return item
+
+    def with_budget():
+        start_budget(0.1)
+        started_at = time.monotonic()
+        results = saving_goal.run_bounded(slow, ["fast", "slow"], max_concurrency=2, deadline=5)
+        return results, time.monotonic() - started_at
+
+    results, elapsed = contextvars.copy_context().run(with_budget)
+
+    assert results == ["fast", None]
+    assert elapsed < 0.4
+
+
+def test_run_bounded_calls_see_the_callers_context():
+    request_id = contextvars.ContextVar("request_id", default=None)
+
+    def in_request():
+        request_id.set("abc")
+        start_budget(2.0)
+        return saving_goal.run_bounded(lambda _: (request_id.get(), remaining_budget() is not None), [1, 2],
+                                       max_concurrency=2, deadline=5)
+
+    assert contextvars.copy_context().run(in_request) == [("abc", True), ("abc", True)]
+
+
+def test_run_bounded_reports_calls_never_started_when_waiting_for_started_ones():
+    def slow(item):
+        time.sleep(0.3)
+        return item
+
+    results = saving_goal.run_bounded(slow, [1, 2, 3], max_concurrency=2, deadline=0.1, wait_started=True)
+
+    assert results == [1, 2, saving_goal.NOT_STARTED]
@@ -0,0 +1,81 @@
+import json
+from datetime import datetime
+
+from flask import Flask
+
+import serialization
+from schemas.user_info import UserInfoSavingGoalSchema, user_info_saving_goal_adapter
+
+# Amounts as the API stores them, plus values whose repr needs every digit
+AMOUNTS = [300.0, 100.5, 0.1 + 0.2, 1 / 3, 1234567.89, 0.01, 99999999999.99, 7]
+
+
+def profile(goal_count: int, skipped_goals=None) -> dict:
+    goals = [{
+        "id": index,
+        "goal_name": f"Goal {index}",
+        "goal_currency": "USD",
+        "goal_value": AMOUNTS[index % len(AMOUNTS)],
+        "monthly_savings": AMOUNTS[(index + 3) % len(AMOUNTS)],
+        "converted_value": AMOUNTS[(index + 5) % len(AMOUNTS)],
+        "created_at": datetime(2024, 2, 29, 23, 59, 58),
+    } for index in range(goal_count)]
+    return {
+        "username": "ana",
+        "goals": goals,
+        "salary": 3000.0,
+        "total_savings": sum(goal["monthly_savings"] for goal in goals),
+        "created_at": datetime(2024, 1, 5, 8, 30, 1),
+        "skipped_goals": skipped_goals,
+    }
+
+
+def old_response(data: dict) -> bytes:
+    # The former path: one model per goal, model_dump(), then Flask's standard library encoder
+    with Flask(__name__).app_context() as context:
+        return context.app.json.response(UserInfoSavingGoalSchema(**data).model_dump()).get_data()
+
+
+def new_response(data: dict):
+    app = Flask(__name__)
+    serialization.init_app(app)
+    with app.app_context():
+        return app.json.response(user_info_saving_goal_adapter.validate_python(data))
+
+
+def test_profile_bytes_match_the_model_dump_and_jsonify_output():
+    for data in (profile(3), profile(0), profile(2, skipped_goals=[7, 8])):
+        assert new_response(data).get_data() == old_response(data)
+
+
+def test_dates_are_in_http_format_and_keys_sorted():
+    body = json.loads(new_response(profile(1)).get_data())
+
+    assert body["created_at"] == "Fri, 05 Jan 2024 08:30:01 GMT"
+    assert body["goals"][0]["created_at"] == "2024-02-29 23:59:58"
+    assert list(body) == sorted(body) and list(body["goals"][0]) == sorted(body["goals"][0])
+    assert body["skipped_goals"] is None
+
+
+def test_exponent_floats_keep_their_value():
+    # orjson writes 1e16 where the standard library writes 1e+16: same number, other spelling
+    values = [1e16, 1e-7, 2.5e-5, 1.2345678901234568e17]
+
+    assert json.loads(serialization.dumps_bytes(values)) == values
+
+
+def test_large_profiles_are_streamed_in_chunks_with_the_same_bytes():
+    data = profile(serialization.JSON_STREAM_MIN_ITEMS + 50)
+
+    response = new_response(data)
+
+    assert response.is_streamed
+    chunks = list(response.response)
+    assert len(chunks) > serialization.JSON_STREAM_MIN_ITEMS // serialization.JSON_STREAM_CHUNK_ITEMS
+    assert b"".join(chunks) == old_response(data)
+
+
+def test_short_lists_are_sent_in_one_piece():
+    response = new_response(profile(serialization.JSON_STREAM_MIN_ITEMS - 1))
+
+    assert not response.is_streamed
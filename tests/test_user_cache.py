@@ -0,0 +1,109 @@
+import os
+
+from sqlalchemy import text
+
+import models
+from models.user_info import UserInfo
+from services import user_cache as user_cache_module
+from services.user_cache import GenerationTable, UserCache, user_cache
+from conftest import auth, create_user
+
+
+def user_id(username: str) -> int:
+    session = models.Session()
+    try:
+        return session.query(UserInfo.id).filter(UserInfo.username == username).scalar()
+    finally:
+        session.close()
+
+
+def cached_salary(cache: UserCache, username: str) -> float:
+    session = models.Session()
+    try:
+        return cache.get(session, username).salary
+    finally:
+        session.close()
+
+
+def second_reader(ttl: float = 60) -> UserCache:
+    """
+    A cache mapping the same generation file, as another worker process of the host would.
+    """
+    return UserCache(GenerationTable(user_cache.generations.path, user_cache.generations.slots), 10, ttl)
+
+
+def test_every_user_write_bumps_its_slot(client):
+    create_user(client, "alice")
+    alice = user_id("alice")
+    generations = user_cache.generations
+
+    before = generations.get(alice)
+    assert client.put("/users/alice/salary", data={"new_salary": 10}, headers=auth("alice")).status_code == 200
+    assert generations.get(alice) == before + 1
+
+    response = client.put("/users/alice/username", data={"new_username": "alicia"}, headers=auth("alice"))
+    assert response.status_code == 200
+    assert generations.get(alice) == before + 2
+
+    assert client.delete("/users/alicia", headers=auth("alicia")).status_code == 200
+    assert generations.get(alice) == before + 3
+
+
+def test_a_rolled_back_write_does_not_bump_the_slot(client):
+    create_user(client, "alice")
+    alice = user_id("alice")
+    before, global_before = user_cache.generations.get(alice), user_cache.generations.get_global()
+
+    session = models.Session()
+    try:
+        session.execute(text("UPDATE user_info SET salary = 20 WHERE id = :id"), {"id": alice})
+        user_cache.invalidate_on_commit(session, alice)
+        session.rollback()
+        session.commit()  # Nothing is left pending for a later commit of the same session
+    finally:
+        session.close()
+
+    assert user_cache.generations.get(alice) == before
+    assert user_cache.generations.get_global() == global_before
+
+
+def test_another_reader_reloads_a_changed_user(client):
+    create_user(client, "alice", salary=10)
+    reader = second_reader()
+    assert cached_salary(reader, "alice") == 10
+
+    assert client.put("/users/alice/salary", data={"new_salary": 20}, headers=auth("alice")).status_code == 200
+    assert cached_salary(reader, "alice") == 20
+
+
+def test_changes_made_outside_the_api_are_served_until_the_ttl(client, monkeypatch):
+    create_user(client, "alice", salary=10)
+    reader = second_reader(ttl=60)
+    assert cached_salary(reader, "alice") == 10
+
+    with models.get_engine().begin() as connection:
+        connection.execute(text("UPDATE user_info SET salary = 20 WHERE username = 'alice'"))
+    assert cached_salary(reader, "alice") == 10
+
+    now = user_cache_module.time.monotonic()
+    monkeypatch.setattr(user_cache_module.time, "monotonic", lambda: now + 61)
+    assert cached_salary(reader, "alice") == 20
+
+
+def test_a_forked_process_maps_the_table_again_and_shares_it(client):
+    create_user(client, "alice")
+    alice = user_id("alice")
+    generations = user_cache.generations
+    before = generations.get(alice)  # Maps the file in this process
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            reopened = generations._map is None and generations._fd is None
+            generations.increment([alice])
+        finally:
+            os._exit(0 if reopened else 1)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert generations.get(alice) == before + 1
@@ -0,0 +1,34 @@
+import pytest
+
+from models import Session
+from models.user_info import UserInfo
+from services import user_import
+from services.user_import import UserImportService
+
+from conftest import create_user
+
+
+@pytest.mark.parametrize("conflict_tolerant_insert", [True, False])
+def test_row_by_row_insert_skips_taken_usernames(client, monkeypatch, conflict_tolerant_insert):
+    if not conflict_tolerant_insert:
+        # As on a dialect without INSERT ... ON CONFLICT DO NOTHING
+        monkeypatch.setattr(user_import, "insert_ignoring_conflicts", lambda session: None)
+    create_user(client, "taken")
+    candidates = {
+        "first": (1, {"username": "first", "password": "x", "salary": 0.0}),
+        "taken": (2, {"username": "taken", "password": "x", "salary": 0.0}),
+        "last": (3, {"username": "last", "password": "x", "salary": 0.0}),
+    }
+    conflicts = []
+
+    session = Session()
+    try:
+        inserted = UserImportService.insert_one_by_one(session, candidates, conflicts)
+    finally:
+        session.close()
+
+    assert inserted == 2
+    assert [(conflict["line"], conflict["username"]) for conflict in conflicts] == [(2, "taken")]
+    session = Session()
+    assert sorted(username for (username,) in session.query(UserInfo.username)) == ["first", "last", "taken"]
+    session.close()
@@ -0,0 +1,35 @@
+from conftest import auth, create_user
+
+
+def test_rename_to_a_taken_username_is_a_conflict(client):
+    create_user(client, "ana")
+    create_user(client, "bob")
+
+    response = client.put("/users/ana/username", data={"new_username": "bob"}, headers=auth("ana"))
+
+    assert response.status_code == 409
+    assert client.get("/users/ana").status_code == 200
+
+
+def test_rename_to_the_same_username_succeeds(client):
+    create_user(client, "ana")
+
+    response = client.put("/users/ana/username", data={"new_username": "ana"}, headers=auth("ana"))
+
+    assert response.status_code == 200
+    assert response.get_json()["username"] == "ana"
+
+
+def test_salary_of_a_missing_user_is_not_found(client):
+    response = client.put("/users/ghost/salary", data={"new_salary": 1000}, headers=auth("ghost"))
+
+    assert response.status_code == 404
+
+
+def test_deleting_a_user_twice_is_not_found_the_second_time(client):
+    create_user(client, "ana")
+    headers = auth("ana")
+
+    assert client.delete("/users/ana", headers=headers).status_code == 200
+    assert client.delete("/users/ana", headers=headers).status_code == 404
+    assert client.get("/users/ana").status_code == 404
@@ -0,0 +1,81 @@
+import json
+
+from sqlalchemy import create_engine, text
+
+import models
+from models.base import Base
+from models.migrations import add_user_info_listing_indexes
+from services.user_listing import USER_LIST_MAX_LIMIT
+
+ADMIN = {"X-Admin-Token": "test-admin"}
+
+
+def insert_users(count: int) -> None:
+    with models.get_engine().begin() as connection:
+        connection.execute(
+            text("INSERT INTO user_info (username, password, salary, created_at) "
+                 "VALUES (:username, 'x', :salary, '2024-01-01 10:00:00')"),
+            [{"username": f"user{index}", "salary": index * 100} for index in range(count)])
+
+
+def list_users(client, **params):
+    response = client.get("/users", query_string=params, headers=ADMIN)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def test_listing_requires_the_admin_token(client):
+    assert client.get("/users").status_code == 403
+    assert client.get("/users", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    assert client.get("/users?stream=true").status_code == 403
+
+
+def test_cursor_walks_every_matching_user_once_in_id_order(client):
+    insert_users(7)
+
+    usernames, cursor = [], None
+    while True:
+        page = list_users(client, limit=2, min_salary=100, **({"cursor": cursor} if cursor else {}))
+        assert len(page["users"]) <= 2
+        usernames += [user["username"] for user in page["users"]]
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
+
+    assert usernames == [f"user{index}" for index in range(1, 7)]
+
+
+def test_bad_cursor_is_a_400(client):
+    assert client.get("/users?cursor=not-a-cursor", headers=ADMIN).status_code == 400
+    assert client.get("/users?cursor=not-a-cursor&stream=true", headers=ADMIN).status_code == 400
+
+
+def test_page_size_is_capped(client):
+    insert_users(USER_LIST_MAX_LIMIT + 1)
+
+    page = list_users(client, limit=10_000)
+
+    assert len(page["users"]) == USER_LIST_MAX_LIMIT
+    assert page["next_cursor"]
+
+
+def test_stream_returns_every_matching_user_as_ndjson(client):
+    insert_users(5)
+
+    response = client.get("/users?stream=true&max_salary=300", headers=ADMIN)
+
+    assert response.status_code == 200
+    assert response.mimetype == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [row["username"] for row in rows] == ["user0", "user1", "user2", "user3"]
+
+
+def test_migration_adds_the_filter_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.sqlite3'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX ix_user_info_salary_id"))
+        connection.execute(text("DROP INDEX ix_user_info_created_at_id"))
+
+    assert add_user_info_listing_indexes(engine) == 2
+    assert add_user_info_listing_indexes(engine) == 0
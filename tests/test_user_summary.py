@@ -0,0 +1,131 @@
+import os
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+import models
+from models import Session
+from models.base import Base
+from app import init_db_command
+from models.migrations import add_user_info_aggregates, rebuild_stale_aggregates, run_migrations
+from models.saving_goal_projection import SavingGoalProjection
+from models.user_info import UserInfo
+from services.reconciliation import ProjectionReconciler
+from services.user_summary import UserSummaryService
+
+from conftest import auth, create_goal, create_user
+
+AGGREGATES = ("goal_count", "total_savings", "total_goal_value", "savings_ratio", "months_to_goals")
+
+
+def summary(client, username: str = "ana") -> dict:
+    response = client.get(f"/users/{username}/summary")
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def projected_totals(username: str = "ana"):
+    session = Session()
+    try:
+        projections = (session.query(SavingGoalProjection).join(UserInfo, UserInfo.id == SavingGoalProjection.user_id)
+                       .filter(UserInfo.username == username).all())
+        return (len(projections), round(sum(goal.monthly_savings for goal in projections), 2),
+                round(sum(goal.converted_value for goal in projections), 2))
+    finally:
+        session.close()
+
+
+def test_goal_changes_apply_to_the_aggregates(client):
+    create_user(client, "ana", salary=1000)
+    first = create_goal(client, "ana", monthly_savings=10)
+    second = create_goal(client, "ana", monthly_savings=30)
+
+    assert (summary(client)["goal_count"], summary(client)["total_savings"]) == (2, 40.0)
+    assert summary(client)["savings_ratio"] == 0.04
+
+    client.put(f"/users/ana/goal/{first}", headers=auth("ana"), data={
+        "goal_name": "Trip", "goal_currency": "USD", "goal_value": 100, "monthly_savings": 50})
+    client.delete(f"/users/ana/goal/{second}", headers=auth("ana"))
+    current = summary(client)
+    assert (current["goal_count"], current["total_savings"]) == (1, 50.0)
+    assert (current["goal_count"], current["total_savings"], current["total_goal_value"]) == projected_totals()
+
+    client.delete(f"/users/ana/goal/{first}", headers=auth("ana"))
+    current = summary(client)
+    assert (current["goal_count"], current["total_savings"], current["total_goal_value"]) == (0, 0.0, 0.0)
+    assert current["savings_ratio"] == 0.0 and current["months_to_goals"] is None
+
+
+def test_rebuild_discards_drift(client):
+    create_user(client, "ana", salary=1000)
+    create_goal(client, "ana", monthly_savings=10)
+    session = Session()
+    session.query(UserInfo).update({"goal_count": 7, "total_savings": 3.0})
+    session.commit()
+
+    assert rebuild_stale_aggregates(models.get_engine()) == 1
+    assert rebuild_stale_aggregates(models.get_engine()) == 0
+
+    assert (summary(client)["goal_count"], summary(client)["total_savings"]) == (1, 10.0)
+    session.query(UserInfo).update({"total_savings": 3.0})
+    session.commit()
+    assert UserSummaryService.rebuild(session) == 1
+    session.commit()
+    session.close()
+    assert summary(client)["total_savings"] == 10.0
+
+
+def test_migration_computes_the_aggregates_of_existing_users():
+    engine = create_engine(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'old.sqlite3')}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for column in AGGREGATES:
+            connection.execute(text(f"ALTER TABLE user_info DROP COLUMN {column}"))
+        connection.execute(text(
+            "INSERT INTO user_info (id, username, password, salary, version) VALUES (1, 'ana', 'x', 1000, 1)"))
+        for goal_id, monthly_savings in ((1, 10.0), (2, 30.0)):
+            connection.execute(text(
+                "INSERT INTO saving_goal_projection (id, user_id, goal_name, goal_currency, goal_value, "
+                "monthly_savings, converted_value, created_at, refreshed_at) "
+                "VALUES (:id, 1, 'Trip', 'USD', 100, :monthly_savings, 200, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)"),
+                {"id": goal_id, "monthly_savings": monthly_savings})
+
+    assert add_user_info_aggregates(engine)
+    assert not add_user_info_aggregates(engine)
+
+    with engine.connect() as connection:
+        row = connection.execute(text(f"SELECT {', '.join(AGGREGATES)} FROM user_info")).one()
+    assert tuple(row) == (2, 40.0, 400.0, 0.04, 10.0)
+
+
+def test_backfilled_goals_count_in_the_aggregates(client):
+    create_user(client, "ana", salary=1000)
+    create_goal(client, "ana", monthly_savings=10)
+    create_goal(client, "ana", monthly_savings=30)
+    # As left by an earlier version removing the projections without their delta:
+    # links without projections, and aggregates still counting them
+    session = Session()
+    session.query(SavingGoalProjection).delete()
+    session.commit()
+    session.close()
+    assert summary(client)["goal_count"] == 2
+
+    ProjectionReconciler(refresh=False).run_once()
+
+    current = summary(client)
+    assert (current["goal_count"], current["total_savings"]) == (2, 40.0)
+
+
+def test_stale_aggregates_are_only_rebuilt_by_init_db(client):
+    create_user(client, "ana", salary=1000)
+    create_goal(client, "ana", monthly_savings=10)
+    session = Session()
+    session.query(UserInfo).update({"goal_count": 7})
+    session.commit()
+    session.close()
+
+    run_migrations(models.get_engine())  # What every worker runs when its engine is built
+    assert summary(client)["goal_count"] == 7
+
+    init_db_command()
+    assert summary(client)["goal_count"] == 1